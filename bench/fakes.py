@@ -0,0 +1,186 @@
+"""deterministic stand-ins for the model, vector database and ollama backends
+
+All fakes are offline and reproducible, so benchmark runs only measure the
+service itself.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from interfaces import EmbeddingFunctionInterface, VectorDBInterface
+from utils import Context
+
+
+def fake_vector(text: str, dimension: int) -> np.ndarray:
+    # same text, same vector - seeded by the text hash
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeEmbeddingFunction(EmbeddingFunctionInterface):
+    """embedding function with deterministic vectors and simulated inference time
+
+    parameters: dimension, latency_ms per call, latency_per_text_ms per text.
+    The latency blocks the calling thread like a cpu bound model does.
+    """
+
+    def __init__(self, model_name: str = "fake", parameters: dict = {}) -> None:
+        super().__init__(type_desc="Fake benchmark model", model_name=model_name, parameters=parameters)
+        self.dimension: int = int(self.parameters.get("dimension", 384))
+        self.latency_ms: float = float(self.parameters.get("latency_ms", 5))
+        self.latency_per_text_ms: float = float(self.parameters.get("latency_per_text_ms", 0.5))
+        self.loaded: bool = False
+
+    def load(self, context: Context) -> bool:
+        self.loaded = True
+        return True
+
+    def unload(self) -> bool:
+        self.loaded = False
+        return True
+
+    def get_memory_usage(self) -> int:
+        return self.dimension * 4 * 30000
+
+    def get_embedding(self, context: Context, text: str) -> list:
+        result = self.get_embeddings(context=context, texts=[text])
+        return result[0] if result else None
+
+    def get_embeddings(self, context: Context, texts: list) -> list:
+        if not self.loaded:
+            context.set_error(f"embedding function not available for {self.get_description()}")
+            return None
+        time.sleep((self.latency_ms + self.latency_per_text_ms * len(texts)) / 1000)
+        return [fake_vector(text, self.dimension).tolist() for text in texts]
+
+
+class FakeVectorDB(VectorDBInterface):
+    """in memory vector database with brute force search and simulated latency"""
+
+    def __init__(self, collection: str = "default", parameters: dict = {}) -> None:
+        super().__init__(collection=collection, parameters=parameters)
+        self.latency_ms: float = float(parameters.get("latency_ms", 2))
+        self._records: dict = {}
+
+    async def _wait(self):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+    async def is_valid(self) -> bool:
+        return True
+
+    async def count(self, context: Context) -> bool:
+        await self._wait()
+        return len(self._records)
+
+    async def learn_document(self, context: Context, id: str, document: str = None, embedding: list = None, uri: str = None, metadata: dict = {}) -> bool:
+        return await self.learn_documents(context=context, ids=[id], documents=[document], embeddings=[embedding], uris=[uri], metadatas=[metadata])
+
+    async def learn_documents(self, context: Context, ids: list, documents: list = None, embeddings: list = None, uris: list = None, metadatas: list = None) -> bool:
+        await self._wait()
+        for index, id in enumerate(ids):
+            self._records[id] = {
+                "id": id,
+                "document": documents[index] if documents else None,
+                "embedding": np.asarray(embeddings[index], dtype=np.float32),
+                "uri": uris[index] if uris else None,
+                "metadata": metadatas[index] if metadatas else None
+            }
+        return True
+
+    async def get_metadatas(self, context: Context, ids: list) -> dict:
+        await self._wait()
+        return {id: self._records[id]["metadata"] for id in ids if id in self._records}
+
+    async def get_documents(self, context: Context, offset: int = 0, limit: int = 100) -> list:
+        await self._wait()
+        records = list(self._records.values())[offset:offset + limit]
+        return [{name: record[name] for name in ["id", "document", "uri", "metadata"]} for record in records]
+
+    async def query_document(self, context: Context, max_records: int = 5, embedding: list = None, metadata: dict = None) -> bool:
+        result = await self.query_documents(context=context, max_records=max_records, embeddings=[embedding], metadata=metadata)
+        return result[0]
+
+    async def query_documents(self, context: Context, max_records: int = 5, embeddings: list = None, metadata: dict = None) -> bool:
+        await self._wait()
+        records = [record for record in self._records.values() if self._matches(record, metadata)]
+        if not records:
+            return [[] for _ in embeddings]
+
+        matrix = np.stack([record["embedding"] for record in records])
+        queries = np.asarray(embeddings, dtype=np.float32)
+        distances = 1.0 - queries @ matrix.T
+        result = []
+        for row in distances:
+            best = np.argsort(row)[:max_records]
+            result.append([{
+                "id": records[index]["id"],
+                "document": records[index]["document"],
+                "metadata": records[index]["metadata"],
+                "distance": float(row[index])
+            } for index in best])
+        return result
+
+    def _matches(self, record: dict, where: dict) -> bool:
+        if not where:
+            return True
+        metadata = record["metadata"] or {}
+        return all(metadata.get(key) == value for key, value in where.items())
+
+
+class StubOllamaServer:
+    """local http server answering /api/embeddings and /api/embed like ollama"""
+
+    def __init__(self, dimension: int = 768, latency_ms: float = 5, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.dimension: int = dimension
+        self.latency_ms: float = latency_ms
+        self._server = ThreadingHTTPServer((host, port), self._create_handler())
+        self._thread: threading.Thread = None
+
+    def get_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _create_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                time.sleep(stub.latency_ms / 1000)
+                if self.path == "/api/embeddings":
+                    body = {"embedding": fake_vector(str(payload.get("prompt", "")), stub.dimension).tolist()}
+                elif self.path == "/api/embed":
+                    texts = payload.get("input", [])
+                    if isinstance(texts, str):
+                        texts = [texts]
+                    body = {"embeddings": [fake_vector(text, stub.dimension).tolist() for text in texts]}
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
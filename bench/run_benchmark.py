@@ -0,0 +1,217 @@
+"""offline benchmark of the REST endpoints
+
+Drives the FastAPI app in process with fake backends at a fixed concurrency
+and writes throughput and latency percentiles per endpoint as JSON.
+
+    python bench/run_benchmark.py --concurrency 32 --requests 2000 --output result.json
+    python bench/run_benchmark.py --compare result.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import httpx
+from fakes import FakeEmbeddingFunction, FakeVectorDB, StubOllamaServer
+from utils import Context
+
+ENDPOINTS = ["embedding", "embeddings_batch", "document_learn", "document_query", "embedding_ollama", "models", "documents_count"]
+DEFAULT_ENDPOINTS = ["embedding", "embeddings_batch", "document_learn", "document_query", "models"]
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    # nearest rank
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+class Workload:
+    """deterministic request payloads for each endpoint"""
+
+    def __init__(self, seed: int, distinct_texts: int, batch_size: int, words: int) -> None:
+        self.random = random.Random(seed)
+        self.batch_size: int = batch_size
+        vocabulary = [f"word{index}" for index in range(2000)]
+        self.texts = [" ".join(self.random.choice(vocabulary) for _ in range(words)) for _ in range(distinct_texts)]
+        self.counter: int = 0
+
+    def text(self) -> str:
+        return self.random.choice(self.texts)
+
+    def request(self, endpoint: str) -> tuple:
+        self.counter += 1
+        if endpoint == "embedding":
+            return "POST", "/embedding", {"text": self.text(), "id": "default"}
+        if endpoint == "embedding_ollama":
+            return "POST", "/embedding", {"text": self.text(), "id": "ollama"}
+        if endpoint == "embeddings_batch":
+            return "POST", "/embeddings_batch", {"texts": [self.text() for _ in range(self.batch_size)], "id": "default"}
+        if endpoint == "document_learn":
+            return "POST", "/document_learn", {"id": f"doc-{self.counter}", "document": self.text(), "metadata": {"source": "bench"}}
+        if endpoint == "document_query":
+            return "POST", "/document_query", {"document": self.text(), "max_records": 5}
+        if endpoint == "models":
+            return "GET", "/models", None
+        if endpoint == "documents_count":
+            return "GET", "/documents_count", None
+        raise ValueError(f"unknown endpoint {endpoint}")
+
+
+async def setup_service(args, ollama_url: str = None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+    handler = main.Factory.get_service_handler()
+    handler.add_model_type("fake", FakeEmbeddingFunction)
+    context = Context()
+    parameters = {"dimension": args.dimension, "latency_ms": args.latency_ms, "latency_per_text_ms": args.latency_per_text_ms}
+    if not await handler.load_model(context=context, model_type="fake", model_name="fake", model_id="default", parameters=parameters):
+        raise RuntimeError(f"loading fake model failed: {context.reason}")
+    if ollama_url:
+        if not await handler.load_model(context=context, model_type="ollama", model_name="bench", model_id="ollama", parameters={"url": ollama_url}):
+            raise RuntimeError(f"loading ollama proxy failed: {context.reason}")
+    handler.vdb_server = FakeVectorDB(parameters={"embedding": "default", "latency_ms": args.vectordb_latency_ms})
+    return main.app, handler
+
+
+async def run_endpoint(client: httpx.AsyncClient, workload: Workload, endpoint: str, requests: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, path, payload = workload.request(endpoint)
+            started = time.perf_counter()
+            response = await client.request(method, path, json=payload)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50": 1000 * percentile(latencies, 0.50),
+            "p95": 1000 * percentile(latencies, 0.95),
+            "p99": 1000 * percentile(latencies, 0.99),
+            "max": 1000 * max(latencies) if latencies else 0.0
+        }
+    }
+
+
+async def run(args) -> dict:
+    endpoints = args.endpoints.split(",")
+    for endpoint in endpoints:
+        if endpoint not in ENDPOINTS:
+            raise SystemExit(f"unknown endpoint {endpoint} - valid values: {ENDPOINTS}")
+
+    stub = None
+    if "embedding_ollama" in endpoints:
+        stub = StubOllamaServer(dimension=args.dimension, latency_ms=args.latency_ms)
+        stub.start()
+
+    try:
+        app, handler = await setup_service(args, stub.get_url() if stub else None)
+        workload = Workload(seed=args.seed, distinct_texts=args.distinct_texts, batch_size=args.batch_size, words=args.words)
+        results = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # seed the collection so queries have something to rank
+            for _ in range(args.warmup):
+                method, path, payload = workload.request("document_learn")
+                await client.request(method, path, json=payload)
+            for endpoint in endpoints:
+                handler.clear_cache(Context())
+                results[endpoint] = await run_endpoint(client, workload, endpoint, args.requests, args.concurrency)
+    finally:
+        if stub:
+            stub.stop()
+
+    return {
+        "version": git_version(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ["output", "compare"]},
+        "results": results
+    }
+
+
+def compare(baseline: dict, current: dict) -> dict:
+    # relative change, positive is better for throughput and worse for latency
+    result = {}
+    for endpoint, values in current["results"].items():
+        before = baseline.get("results", {}).get(endpoint)
+        if not before:
+            continue
+        result[endpoint] = {
+            "throughput_rps": _change(before["throughput_rps"], values["throughput_rps"]),
+            "p50": _change(before["latency_ms"]["p50"], values["latency_ms"]["p50"]),
+            "p99": _change(before["latency_ms"]["p99"], values["latency_ms"]["p99"])
+        }
+    return {"baseline_version": baseline.get("version"), "changes": result}
+
+
+def _change(before: float, after: float) -> float:
+    return (after - before) / before if before else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline benchmark of the cdbembed endpoints")
+    parser.add_argument("--endpoints", default=",".join(DEFAULT_ENDPOINTS), help=f"comma separated list of {ENDPOINTS}")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--dimension", type=int, default=384, help="dimension of the fake embeddings")
+    parser.add_argument("--latency-ms", type=float, default=5, help="fake model latency per call")
+    parser.add_argument("--latency-per-text-ms", type=float, default=0.5, help="fake model latency per text")
+    parser.add_argument("--vectordb-latency-ms", type=float, default=2, help="fake vectordb latency per call")
+    parser.add_argument("--batch-size", type=int, default=32, help="texts per /embeddings_batch request")
+    parser.add_argument("--distinct-texts", type=int, default=5000, help="size of the text pool, smaller pools mean more cache hits")
+    parser.add_argument("--words", type=int, default=24, help="words per text")
+    parser.add_argument("--warmup", type=int, default=200, help="documents learned before measuring")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the result json to this file")
+    parser.add_argument("--compare", help="baseline result json to compare with")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as file:
+            result["comparison"] = compare(json.load(file), result)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
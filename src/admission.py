@@ -0,0 +1,155 @@
+from collections import deque
+import asyncio
+import time
+import metrics
+from utils import Context
+
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK        = "bulk"
+
+# ordered by rank, a free slot goes to the first class with a waiting call
+PRIORITIES = [PRIORITY_INTERACTIVE, PRIORITY_BULK]
+
+
+def parse_priority(value: str, default: str = PRIORITY_INTERACTIVE) -> str:
+    """returns the priority class of a header or parameter value, None if the value is unknown"""
+    if not value:
+        return default
+    value = value.strip().lower()
+    return value if value in PRIORITIES else None
+
+
+class PriorityClass:
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout_ms: int) -> None:
+        self.name: str = name
+        self.max_concurrency: int = max(1, max_concurrency)
+        self.max_queue: int = max(0, max_queue)
+        self.queue_timeout_ms: int = max(0, queue_timeout_ms)
+        self.running: int = 0
+        self.waiting: deque = deque()
+        self.admitted: int = 0
+        self.rejected: int = 0
+        self.timeouts: int = 0
+        self.wait_seconds: float = 0.0
+
+    def get_stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout_ms": self.queue_timeout_ms,
+            "running": self.running,
+            "waiting": len(self.waiting),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.wait_seconds * 1000 / self.admitted, 3) if self.admitted else 0.0
+        }
+
+
+class AdmissionScheduler:
+    """admits embedding model calls by priority class
+
+    At most ``capacity`` calls run at the same time over all classes and at most
+    ``max_concurrency`` calls of one class. A free slot always goes to the
+    waiting interactive calls first, so bulk work yields to queries at the
+    boundary of its next batch. A call is rejected with 503 right away if the
+    queue of its class is full and after ``queue_timeout_ms`` without a slot.
+    """
+
+    DEFAULT_CAPACITY = 4
+    DEFAULT_INTERACTIVE_CONCURRENCY = 4
+    DEFAULT_INTERACTIVE_QUEUE       = 256
+    DEFAULT_INTERACTIVE_TIMEOUT_MS  = 2000
+    DEFAULT_BULK_CONCURRENCY = 1
+    DEFAULT_BULK_QUEUE       = 64
+    DEFAULT_BULK_TIMEOUT_MS  = 60000
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, classes: list = None) -> None:
+        self.capacity: int = max(1, capacity)
+        if classes is None:
+            classes = [
+                PriorityClass(PRIORITY_INTERACTIVE, self.DEFAULT_INTERACTIVE_CONCURRENCY, self.DEFAULT_INTERACTIVE_QUEUE, self.DEFAULT_INTERACTIVE_TIMEOUT_MS),
+                PriorityClass(PRIORITY_BULK, self.DEFAULT_BULK_CONCURRENCY, self.DEFAULT_BULK_QUEUE, self.DEFAULT_BULK_TIMEOUT_MS)
+            ]
+        self.classes: dict[str, PriorityClass] = {item.name: item for item in sorted(classes, key=lambda item: PRIORITIES.index(item.name))}
+        self._running: int = 0
+
+    def get_class(self, priority: str) -> PriorityClass:
+        return self.classes.get(priority if priority else PRIORITY_INTERACTIVE, self.classes[PRIORITY_INTERACTIVE])
+
+    async def acquire(self, context: Context, priority: str = None) -> bool:
+        """waits for a slot of the class, release it with ``release`` of the same priority
+
+        :return: True if admitted, False with the reason in the context otherwise
+        :rtype: bool
+        """
+        item = self.get_class(priority)
+        if len(item.waiting) >= item.max_queue and not self._is_free(item):
+            item.rejected += 1
+            metrics.ADMISSION_REJECTED.inc(priority=item.name, reason="queue_full")
+            context.set_error(f"{item.name} queue is full - retry later", status_code=503)
+            return False
+
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        item.waiting.append(future)
+        self._dispatch()
+        try:
+            if item.queue_timeout_ms:
+                await asyncio.wait_for(asyncio.shield(future), item.queue_timeout_ms / 1000)
+            else:
+                await future
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if future.done() and not future.cancelled():
+                # granted while the wait ended, hand the slot on
+                self.release(item.name)
+            else:
+                future.cancel()
+                self._remove(item, future)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            item.timeouts += 1
+            metrics.ADMISSION_REJECTED.inc(priority=item.name, reason="timeout")
+            context.set_error(f"no {item.name} slot free within {item.queue_timeout_ms} ms - retry later", status_code=503)
+            return False
+
+        waited = time.perf_counter() - started
+        context.add_timing("queue", waited)
+        item.admitted += 1
+        item.wait_seconds += waited
+        metrics.ADMISSION_WAIT_SECONDS.observe(waited, priority=item.name)
+        return True
+
+    def release(self, priority: str = None):
+        item = self.get_class(priority)
+        item.running -= 1
+        self._running -= 1
+        self._dispatch()
+
+    def get_stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "running": self._running,
+            "classes": {name: item.get_stats() for name, item in self.classes.items()}
+        }
+
+    def _is_free(self, item: PriorityClass) -> bool:
+        return self._running < self.capacity and item.running < item.max_concurrency
+
+    def _dispatch(self):
+        # higher classes first, a lower class only gets slots no higher class can use
+        for item in self.classes.values():
+            while item.waiting and self._is_free(item):
+                future = item.waiting.popleft()
+                if future.done():
+                    continue
+                item.running += 1
+                self._running += 1
+                future.set_result(True)
+
+    def _remove(self, item: PriorityClass, future: asyncio.Future):
+        try:
+            item.waiting.remove(future)
+        except ValueError:
+            pass
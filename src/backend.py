@@ -1,30 +1,172 @@
 from interfaces import EmbeddingFunctionInterface, VectorDBInterface
-from utils import Context, getenv, getenv_as_int
+from utils import Context, getenv, getenv_as_int, track_context
 from chroma import EmbeddingFunctionDefault
 from ollama_client import EmbeddingFunctionOllama
+from workers import EmbeddingFunctionProcessPool
+from onnx_embedding import EmbeddingFunctionOnnx
 from chroma_server import ChromaDBServer
+from local_vectordb import LocalVectorDB
+from collection_pool import CollectionPool
+from batcher import EmbeddingBatcher
+from executor import InferenceExecutor
+from admission import AdmissionScheduler, PriorityClass, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from cache import EmbeddingCache, EmbeddingDiskCache, QueryResultCache
+from ingest import BulkIngestor
+from jobs import JobManager
+from write_buffer import WriteBehindBuffer
+from profiler import SamplingProfiler
+from chunking import TextChunker
+from bucketing import DEFAULT_MAX_BATCH_TOKENS
+from changes import content_hash, with_change_keys, get_status, get_counts, STATUS_SKIPPED
+from registry import ModelRegistry, ModelEntry
+import asyncio
+import time
+import metrics
+import numpy as np
     
 
 class ServiceHandler:
     TYPE_DEFAULT = "default"
     TYPE_CHROMADB  = "chromadb"
     TYPE_OLLAMA  = "ollama"
+    TYPE_ONNX    = "onnx"
+    TYPE_LOCAL   = "local"
 
-    VALID_TYPES = [TYPE_DEFAULT, TYPE_OLLAMA]
-    VECTORDB_TYPES = [TYPE_DEFAULT, TYPE_CHROMADB]
+    VALID_TYPES = [TYPE_DEFAULT, TYPE_OLLAMA, TYPE_ONNX]
+    VECTORDB_TYPES = [TYPE_DEFAULT, TYPE_CHROMADB, TYPE_LOCAL]
+
+    DEFAULT_MAX_BATCH_SIZE = 256
 
     def __init__(self) -> None:
-        self._model_cache:dict[str, EmbeddingFunctionInterface] = {}
+        self._custom_types: dict = {}
+        self.models: ModelRegistry = ModelRegistry(factory=self.create_embedding_function, on_load=self._on_model_load, on_unload=self._on_model_unload)
         self.vdb_server: VectorDBInterface = None
+        self.max_batch_size: int = self.DEFAULT_MAX_BATCH_SIZE
+        self._batchers: dict[str, EmbeddingBatcher] = {}
+        self.batching_enabled: bool = True
+        self.batch_max_size: int = EmbeddingBatcher.DEFAULT_MAX_BATCH_SIZE
+        self.batch_max_wait_ms: int = EmbeddingBatcher.DEFAULT_MAX_WAIT_MS
+        self.batch_max_queue: int = EmbeddingBatcher.DEFAULT_MAX_QUEUE
+        self.executor: InferenceExecutor = InferenceExecutor()
+        self.admission: AdmissionScheduler = AdmissionScheduler()
+        self.inference_processes: int = 0
+        self.inference_process_threads: int = 0
+        self.inference_max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS
+        self.embedding_cache: EmbeddingCache = EmbeddingCache()
+        self.query_cache: QueryResultCache = QueryResultCache()
+        self.disk_cache: EmbeddingDiskCache = None
+        self._disk_writes: set = set()
+        self.ingest_batch_size: int = BulkIngestor.DEFAULT_BATCH_SIZE
+        self.ingest_upsert_size: int = BulkIngestor.DEFAULT_UPSERT_SIZE
+        self.ingest_max_errors: int = BulkIngestor.DEFAULT_MAX_ERRORS
+        self.jobs: JobManager = JobManager(handler=self)
+        self.write_buffer: WriteBehindBuffer = None
+        self.write_buffer_durable: bool = True
+        self.profiler: SamplingProfiler = SamplingProfiler()
+        self.profiler_enabled: bool = False
+        self.chunking_enabled: bool = False
+        self.change_detection: bool = False
+        self.chunk_tokens: int = TextChunker.DEFAULT_TOKENS
+        self.chunk_overlap: int = TextChunker.DEFAULT_OVERLAP
+        metrics.REGISTRY.add_collector(self.collect_metrics)
 
-    def startup(self) -> bool:
+    async def startup(self) -> bool:
         try:
+            # check inference executor
+            inf_workers = getenv_as_int("INFERENCE_WORKERS", InferenceExecutor.DEFAULT_MAX_WORKERS, desc="number of threads running model inference")
+            inf_queue = getenv_as_int("INFERENCE_QUEUE_LIMIT", InferenceExecutor.DEFAULT_MAX_QUEUE, desc="max number of inference calls waiting for a free thread")
+            self.executor.shutdown()
+            self.executor = InferenceExecutor(max_workers=inf_workers, max_queue=inf_queue)
+
+            # check admission control - interactive calls get free slots before bulk calls
+            self.admission = AdmissionScheduler(
+                capacity=getenv_as_int("ADMISSION_CAPACITY", AdmissionScheduler.DEFAULT_CAPACITY, desc="max number of embedding calls running at the same time"),
+                classes=[
+                    PriorityClass(
+                        PRIORITY_INTERACTIVE,
+                        max_concurrency=getenv_as_int("ADMISSION_INTERACTIVE_CONCURRENCY", AdmissionScheduler.DEFAULT_INTERACTIVE_CONCURRENCY, desc="max number of running interactive embedding calls"),
+                        max_queue=getenv_as_int("ADMISSION_INTERACTIVE_QUEUE", AdmissionScheduler.DEFAULT_INTERACTIVE_QUEUE, desc="max number of waiting interactive embedding calls - more are rejected with 503"),
+                        queue_timeout_ms=getenv_as_int("ADMISSION_INTERACTIVE_TIMEOUT_MS", AdmissionScheduler.DEFAULT_INTERACTIVE_TIMEOUT_MS, desc="max time in ms an interactive embedding call waits for a slot")
+                    ),
+                    PriorityClass(
+                        PRIORITY_BULK,
+                        max_concurrency=getenv_as_int("ADMISSION_BULK_CONCURRENCY", AdmissionScheduler.DEFAULT_BULK_CONCURRENCY, desc="max number of running bulk embedding calls"),
+                        max_queue=getenv_as_int("ADMISSION_BULK_QUEUE", AdmissionScheduler.DEFAULT_BULK_QUEUE, desc="max number of waiting bulk embedding calls - more are rejected with 503"),
+                        queue_timeout_ms=getenv_as_int("ADMISSION_BULK_TIMEOUT_MS", AdmissionScheduler.DEFAULT_BULK_TIMEOUT_MS, desc="max time in ms a bulk embedding call waits for a slot")
+                    )
+                ]
+            )
+            self.inference_processes = getenv_as_int("INFERENCE_PROCESSES", 0, desc="number of worker processes hosting each default model - 0 runs inference in the api process")
+            self.inference_max_batch_tokens = getenv_as_int("INFERENCE_MAX_BATCH_TOKENS", DEFAULT_MAX_BATCH_TOKENS, desc="max padded tokens per forward pass - texts are grouped by token length")
+            self.inference_process_threads = getenv_as_int("INFERENCE_PROCESS_THREADS", 0, desc="torch threads per worker process - 0 splits the cores evenly")
+
+            # check embedding cache
+            cache_mb = getenv_as_int("EMBEDDING_CACHE_MB", EmbeddingCache.DEFAULT_MAX_MB, desc="memory budget of the embedding cache in MB - 0 disables the cache")
+            self.embedding_cache = EmbeddingCache(max_bytes=cache_mb * 1024 * 1024)
+            disk_cache_path = getenv("EMBEDDING_DISK_CACHE_PATH", desc="optional: sqlite file of the persistent embedding cache")
+            disk_cache_mb = getenv_as_int("EMBEDDING_DISK_CACHE_MB", EmbeddingDiskCache.DEFAULT_MAX_MB, desc="size limit of the persistent embedding cache in MB")
+            if disk_cache_path:
+                self.disk_cache = EmbeddingDiskCache(path=disk_cache_path, max_bytes=disk_cache_mb * 1024 * 1024)
+            query_cache_size = getenv_as_int("QUERY_CACHE_SIZE", QueryResultCache.DEFAULT_MAX_ENTRIES, desc="max number of cached vectordb query results - 0 disables the cache")
+            query_cache_ttl = getenv_as_int("QUERY_CACHE_TTL", QueryResultCache.DEFAULT_TTL, desc="seconds a cached query result is served at most")
+            self.query_cache = QueryResultCache(max_entries=query_cache_size, ttl=query_cache_ttl)
+
+            # check batch limits
+            self.max_batch_size = getenv_as_int("EMBEDDING_MAX_BATCH_SIZE", self.DEFAULT_MAX_BATCH_SIZE, desc="max number of texts per batch embedding call")
+            self.batching_enabled = getenv("BATCHING_ENABLED", "true").lower() in ["true", "1", "yes"]
+            self.batch_max_size = getenv_as_int("BATCHING_MAX_SIZE", EmbeddingBatcher.DEFAULT_MAX_BATCH_SIZE, desc="max number of concurrent requests combined into one inference")
+            self.batch_max_wait_ms = getenv_as_int("BATCHING_MAX_WAIT_MS", EmbeddingBatcher.DEFAULT_MAX_WAIT_MS, desc="max time in ms a request waits for others to join its batch")
+            self.batch_max_queue = getenv_as_int("BATCHING_MAX_QUEUE", EmbeddingBatcher.DEFAULT_MAX_QUEUE, desc="max number of requests waiting for a batch per model")
+
+            # check bulk ingestion
+            self.ingest_batch_size = getenv_as_int("INGEST_BATCH_SIZE", BulkIngestor.DEFAULT_BATCH_SIZE, desc="number of documents embedded together during bulk ingestion")
+            self.ingest_upsert_size = getenv_as_int("INGEST_UPSERT_SIZE", BulkIngestor.DEFAULT_UPSERT_SIZE, desc="number of documents per vectordb upsert during bulk ingestion")
+            self.ingest_max_errors = getenv_as_int("INGEST_MAX_ERRORS", BulkIngestor.DEFAULT_MAX_ERRORS, desc="max number of item errors reported by bulk ingestion")
+
+            # check ingestion jobs
+            self.jobs = JobManager(
+                handler=self,
+                directory=getenv("JOBS_DIR", JobManager.DEFAULT_DIRECTORY, desc="directory of the spooled records and states of ingestion jobs"),
+                workers=getenv_as_int("JOBS_WORKERS", JobManager.DEFAULT_WORKERS, desc="number of ingestion jobs running at the same time"),
+                max_queue=getenv_as_int("JOBS_MAX_QUEUE", JobManager.DEFAULT_MAX_QUEUE, desc="max number of queued ingestion jobs - more are rejected with 429"),
+                max_upload_bytes=getenv_as_int("JOBS_MAX_UPLOAD_MB", JobManager.DEFAULT_MAX_UPLOAD_MB, desc="max size of an uploaded job in MB") * 1024 * 1024,
+                file_root=getenv("JOBS_FILE_ROOT", desc="optional: directory of records files that jobs may reference")
+            )
+            self.jobs.start()
+
+            # check write behind buffer of single document learns
+            if getenv("WRITE_BUFFER_ENABLED", "false").lower() in ["true", "1", "yes"]:
+                self.write_buffer = WriteBehindBuffer(
+                    max_records=getenv_as_int("WRITE_BUFFER_MAX_RECORDS", WriteBehindBuffer.DEFAULT_MAX_RECORDS, desc="number of pending documents that starts a batched upsert"),
+                    max_delay_ms=getenv_as_int("WRITE_BUFFER_MAX_DELAY_MS", WriteBehindBuffer.DEFAULT_MAX_DELAY_MS, desc="max time in ms a document waits for its batched upsert"),
+                    max_pending=getenv_as_int("WRITE_BUFFER_MAX_PENDING", WriteBehindBuffer.DEFAULT_MAX_PENDING, desc="max number of pending documents per collection - more learns wait for a flush"),
+                    on_flush=self._on_vdb_write
+                )
+            self.write_buffer_durable = getenv("WRITE_BUFFER_DURABLE", "true").lower() in ["true", "1", "yes"]
+
+            # check profiler endpoint
+            self.profiler_enabled = getenv("PROFILER_ENABLED", "false").lower() in ["true", "1", "yes"]
+
+            # check change detection
+            self.change_detection = getenv("CHANGE_DETECTION", "false").lower() in ["true", "1", "yes"]
+
+            # check chunking
+            self.chunking_enabled = getenv("CHUNKING_ENABLED", "false").lower() in ["true", "1", "yes"]
+            self.chunk_tokens = getenv_as_int("CHUNK_TOKENS", TextChunker.DEFAULT_TOKENS, desc="target number of model tokens per document chunk")
+            self.chunk_overlap = getenv_as_int("CHUNK_OVERLAP", TextChunker.DEFAULT_OVERLAP, desc="number of tokens shared by neighbouring chunks")
+
+            # check model registry
+            self.models.memory_budget = getenv_as_int("MODEL_MEMORY_BUDGET_MB", 0, desc="memory budget of all resident models in MB - 0 for no limit") * 1024 * 1024
+            self.models.idle_ttl = getenv_as_int("MODEL_IDLE_TTL", 0, desc="seconds after which an unused model is unloaded - 0 keeps models loaded")
+            lazy = getenv("MODEL_LAZY_LOAD", "false").lower() in ["true", "1", "yes"]
+            self.models.start()
+
             # check for default model
             context = Context()
             default_model = getenv("DEFAULT_MODEL")
             if default_model:
                 print("Loading default model...")
-                if self.load_model(context=context, model_type="default", model_name=default_model, model_id="default"):
+                if await self.load_model(context=context, model_type="default", model_name=default_model, model_id="default", lazy=lazy):
                     print(f"Default model loaded at startup: {default_model}")
                 else:
                     print(f"Loading default model {default_model} at startup failed")
@@ -33,7 +175,7 @@ class ServiceHandler:
             ollama_url = getenv("OLLAMA_URL")
             ollama_model = getenv("OLLAMA_MODEL")
             if ollama_model and ollama_url:
-                if self.load_model(context=context, model_type="ollama", model_name=ollama_model, model_id="ollama", parameters={"url": ollama_url}):
+                if await self.load_model(context=context, model_type="ollama", model_name=ollama_model, model_id="ollama", parameters={"url": ollama_url}, lazy=lazy):
                     print(f"Ollama proxy loaded at startup: url {ollama_url} model {ollama_model}")
                 else:
                     print(f"Loading ollama proxy to {ollama_url} at startup failed")      
@@ -46,6 +188,11 @@ class ServiceHandler:
             vdb_emb  = getenv("VECTORDB_EMBEDDING", "default")
             vdb_dbs  = getenv("VECTORDB_DATABASE", "default_database")
             vdb_ten  = getenv("VECTORDB_TENANT","default_tenant")
+            vdb_path = getenv("VECTORDB_PATH", LocalVectorDB.DEFAULT_PATH)
+            vdb_spc  = getenv("VECTORDB_SPACE", "l2")
+            vdb_idx  = getenv("VECTORDB_INDEX", "auto")
+            vdb_sync = getenv("VECTORDB_SYNC", "true").lower() in ["true", "1", "yes"]
+            vdb_max  = getenv_as_int("VECTORDB_MAX_COLLECTIONS", CollectionPool.DEFAULT_MAX_COLLECTIONS, desc="max number of open collections besides the default collection")
 
             # init vdb istance
             vdb_server: VectorDBInterface = None
@@ -54,9 +201,11 @@ class ServiceHandler:
                     print("invalid vectordb type - valid values: ", self.VECTORDB_TYPES)
                 elif vdb_type == self.TYPE_DEFAULT or vdb_type == self.TYPE_CHROMADB:
                     if vdb_port:
-                        vdb_server = ChromaDBServer(host=vdb_host, port=vdb_port, collection=vdb_coll, parameters={"database": vdb_dbs, "tenant": vdb_ten, "embedding": vdb_emb})
+                        vdb_server = ChromaDBServer(host=vdb_host, port=vdb_port, collection=vdb_coll, parameters={"database": vdb_dbs, "tenant": vdb_ten, "embedding": vdb_emb, "max_collections": vdb_max})
+                elif vdb_type == self.TYPE_LOCAL:
+                    vdb_server = LocalVectorDB(collection=vdb_coll, parameters={"path": vdb_path, "space": vdb_spc, "index": vdb_idx, "sync": vdb_sync, "database": vdb_dbs, "tenant": vdb_ten, "embedding": vdb_emb, "max_collections": vdb_max})
             
-            if not vdb_server or not vdb_server.is_valid():
+            if not vdb_server or not await vdb_server.is_valid():
                 print("connect to vector database failed")
                 return False
             else:       
@@ -66,6 +215,16 @@ class ServiceHandler:
         except Exception as exc:
             print(f"Error while checking environment parameters at startup: {exc}")
 
+    async def shutdown(self):
+        await self.jobs.stop()
+        if self.write_buffer:
+            await self.write_buffer.close()
+        self.models.stop()
+        self.unload_all(Context())
+        self.executor.shutdown()
+        if self.disk_cache:
+            await asyncio.gather(*self._disk_writes, return_exceptions=True)
+            self.disk_cache.close()
 
     def get_model_id(self, model_type: str, model_name: str, model_id: str = None) -> str:
         """generates a unique model id for internal cache
@@ -88,55 +247,95 @@ class ServiceHandler:
 
     def is_model_loaded(self, context: Context, model_type: str, model_name: str, model_id: str = None) -> bool:
         use_model_id = self.get_model_id(model_type=model_type, model_name=model_name, model_id=model_id)
-        if use_model_id in self._model_cache:
-            return True
-        else:
-            return False
+        return self.models.is_loaded(use_model_id)
         
     def get_loaded_models(self, context: Context) -> list:
         result = []
-        for model_id in self._model_cache.keys():
-            emb_function = self._model_cache.get(model_id)
-            record = {
-                "id": model_id,
-                "description": emb_function.get_description()
-            }   
+        for entry in self.models.get_entries():
+            record = entry.get_info()
+            if entry.is_loaded():
+                record["description"] = entry.emb_function.get_description()
+            batcher = self._batchers.get(entry.model_id)
+            if batcher:
+                record["batching"] = batcher.get_settings()
             result.append(record)
         context.set_payload(result)
         return result
 
-    def get_embedding_function_by_id(self, model_id: str) -> EmbeddingFunctionInterface:
-        if model_id in self._model_cache:
-            return self._model_cache[model_id]
-        else:
+    async def get_embedding_function_by_id(self, model_id: str, context: Context = None) -> EmbeddingFunctionInterface:
+        # registered models are loaded on first use
+        if not self.models.contains(model_id):
             return None
+        return await self.models.get(context if context else Context(), model_id)
+
+    def add_model_type(self, model_type: str, factory):
+        """registers an additional model type, e.g. fake models for benchmarks
+
+        :param model_type: name of the new loader type
+        :type model_type: str
+        :param factory: called with model_name and parameters, returns an EmbeddingFunctionInterface
+        """
+        self._custom_types[model_type] = factory
+
+    def create_embedding_function(self, model_type: str, model_name: str, parameters: dict = {}) -> EmbeddingFunctionInterface:
+        if model_type in self._custom_types:
+            return self._custom_types[model_type](model_name=model_name, parameters=parameters)
+        elif model_type == "default":
+            # parameter processes overrides INFERENCE_PROCESSES per model
+            model_parameters = dict({"max_batch_tokens": self.inference_max_batch_tokens}, **(parameters if parameters else {}))
+            processes = int(model_parameters.get("processes", self.inference_processes))
+            if processes > 0:
+                model_parameters["processes"] = processes
+                if self.inference_process_threads and "threads" not in model_parameters:
+                    model_parameters["threads"] = self.inference_process_threads
+                return EmbeddingFunctionProcessPool(model_name=model_name, parameters=model_parameters)
+            return EmbeddingFunctionDefault(model_name=model_name, parameters=model_parameters)
+        elif model_type == "ollama":
+            return EmbeddingFunctionOllama(model_name=model_name, parameters=parameters)
+        elif model_type == "onnx":
+            model_parameters = dict({"max_batch_tokens": self.inference_max_batch_tokens}, **(parameters if parameters else {}))
+            return EmbeddingFunctionOnnx(model_name=model_name, parameters=model_parameters)
+        return None
+
+    def _on_model_load(self, entry: ModelEntry):
+        self._close_batcher(entry.model_id)
+        self.embedding_cache.invalidate(entry.model_id)
+
+        # per model batching settings
+        if self.batching_enabled:
+            self._batchers[entry.model_id] = EmbeddingBatcher(
+                model_id=entry.model_id,
+                emb_function=entry.emb_function,
+                executor=self.executor,
+                admission=self.admission,
+                entry=entry,
+                max_batch_size=int(entry.parameters.get("batch_size", self.batch_max_size)),
+                max_wait_ms=int(entry.parameters.get("batch_wait_ms", self.batch_max_wait_ms)),
+                max_queue=int(entry.parameters.get("batch_queue", self.batch_max_queue))
+            )
+
+    def _on_model_unload(self, entry: ModelEntry):
+        self._close_batcher(entry.model_id)
+        self.embedding_cache.invalidate(entry.model_id)
 
     def unload_model(self, context: Context, model_type: str, model_name: str, model_id: str = None, delete_cache: bool = True) -> bool:
         use_model_id = self.get_model_id(model_type=model_type, model_name=model_name, model_id=model_id)
-        if not use_model_id in self._model_cache:
+        if not self.models.contains(use_model_id):
             context.set_error("model not loaded", status_code=400)
             return False
         else:
-            emb_func = self.get_embedding_function_by_id(use_model_id)
-            emb_func.unload()
-            if delete_cache:
-                del self._model_cache[use_model_id]
-            return True
+            return self.models.unload(use_model_id, remove=delete_cache)
 
     def unload_all(self, context: Context) -> True:
-        count = 0
-        all_ids = self._model_cache.keys()
-        for model_id in all_ids:
-            self.unload_model(context, "", "", model_id=model_id, delete_cache=False)
-            count += 1
+        count = self.models.unload_all()
         context.set_success(f"{count} models unloaded")
-        self._model_cache = {}
+        self.embedding_cache.clear()
         return True
 
-    def load_model(self, context: Context, model_type: str, model_name: str, model_id: str = None, parameters: dict = {}) -> bool:
+    async def load_model(self, context: Context, model_type: str, model_name: str, model_id: str = None, parameters: dict = {}, lazy: bool = False) -> bool:
         try:
             # check model
-            if model_type not in self.VALID_TYPES:
+            if model_type not in self.VALID_TYPES and model_type not in self._custom_types:
                 context.set_error(f"invalid model type: {model_type}")
                 return False
             
@@ -144,92 +343,410 @@ class ServiceHandler:
             if model_id == "string":
                 model_id = None
 
-            # set embedding by type
-            emb_function: EmbeddingFunctionInterface = None
-            if model_type == "default":
-                emb_function = EmbeddingFunctionDefault(model_name=model_name)
-            elif model_type == "ollama":
-                emb_function = EmbeddingFunctionOllama(model_name=model_name, parameters=parameters)
-                
-            # check and load model
-            if not emb_function:
-                context.set_error(f"invalid embedding function: loader type {model_type} model name {model_name}")
-                return False
-            else:
-                if not emb_function.load(context=context):
-                    context.set_error(reason="Loading model failed")
-                    return False
-
-            # get the model id
+            # register and load - concurrent loads of one id share a single load
             use_model_id = self.get_model_id(model_type=model_type, model_name=model_name, model_id=model_id)
-            self._model_cache[use_model_id] = emb_function
+            self.models.register(model_id=use_model_id, model_type=model_type, model_name=model_name, parameters=parameters)
+            if lazy:
+                context.set_success(f"model registered as id {use_model_id}")
+                return True
+
+            if not await self.models.load(context=context, model_id=use_model_id):
+                return False
             context.set_success(f"model loaded as id {use_model_id}")
             return True
 
         except Exception as exc:
             context.set_error(f"Error: {exc}")
 
-    def get_embedding(self, context: Context, text: str, model_type: str, model_name: str, model_id: str = None) -> bool:
+    async def get_embedding_function(self, context: Context, model_type: str, model_name: str, model_id: str = None) -> EmbeddingFunctionInterface:
+        # get the model id and check if registered
+        use_model_id = self.get_model_id(model_type=model_type, model_name=model_name, model_id=model_id)
+        if not self.models.contains(use_model_id):
+            if not await self.load_model(context=context, model_type=model_type, model_name=model_name, model_id=model_id):
+                context.set_error("model not found")
+                return None
+
+        # get embedding function - loads lazily registered models
+        emb_function = await self.get_embedding_function_by_id(use_model_id, context=context)
+        if not emb_function:
+            if not context.reason:
+                context.set_error("model function not found")
+            return None
+        return emb_function
+
+    def _close_batcher(self, model_id: str):
+        batcher = self._batchers.pop(model_id, None)
+        if batcher:
+            batcher.close()
+
+    def _get_cache_key(self, model_id: str, emb_function: EmbeddingFunctionInterface) -> str:
+        # persistent rows stay valid across restarts only for the same type, model and output parameters
+        entry = self.models.get_entry(model_id)
+        model_type = entry.model_type if entry else "default"
+        return f"{model_type}::{emb_function.get_cache_key()}"
+
+    async def _lookup_cached(self, model_id: str, emb_function: EmbeddingFunctionInterface, texts: list) -> list:
+        # memory first, then the persistent tier
+        result = [self.embedding_cache.get(model_id, text) for text in texts]
+        missing = [index for index, vector in enumerate(result) if vector is None]
+        if self.disk_cache and missing:
+            found = await asyncio.get_running_loop().run_in_executor(None, self.disk_cache.get_many, model_id, self._get_cache_key(model_id, emb_function), [texts[index] for index in missing])
+            for position, vector in found.items():
+                index = missing[position]
+                result[index] = self.embedding_cache.put(model_id, texts[index], vector)
+        return result
+
+    def _store_cached(self, model_id: str, emb_function: EmbeddingFunctionInterface, texts: list, embeddings: list) -> list:
+        vectors = [self.embedding_cache.put(model_id, text, embedding) for text, embedding in zip(texts, embeddings)]
+        if self.disk_cache:
+            # write behind - the caller does not wait for the disk, shutdown waits for the pending writes
+            future = asyncio.get_running_loop().run_in_executor(None, self.disk_cache.put_many, model_id, self._get_cache_key(model_id, emb_function), list(zip(texts, vectors)))
+            self._disk_writes.add(future)
+            future.add_done_callback(self._disk_writes.discard)
+        return vectors
+
+    async def _compute_embeddings(self, context: Context, model_id: str, emb_function: EmbeddingFunctionInterface, texts: list) -> list:
+        # one model call is one batch of the admission control
+        with self.models.use(model_id):
+            if not await self.admission.acquire(context, context.priority):
+                return None
+            try:
+                started = time.perf_counter()
+                result = await emb_function.get_embeddings_async(context=context, texts=texts, executor=self.executor)
+                seconds = time.perf_counter() - started
+                metrics.observe_embedding(model_id, len(texts), seconds)
+                context.add_timing("embed", seconds)
+                return result
+            finally:
+                self.admission.release(context.priority)
+
+    async def embed_text(self, context: Context, model_id: str, emb_function: EmbeddingFunctionInterface, text: str) -> np.ndarray:
+        # float32 vector, converted to json only at the response
+        cached = await self._lookup_cached(model_id, emb_function, [text])
+        if cached[0] is not None:
+            return cached[0]
+
+        # concurrent single texts are combined by the batcher
+        batcher = self._batchers.get(model_id)
+        if batcher:
+            embedding = await batcher.submit(context=context, text=text)
+        else:
+            result = await self._compute_embeddings(context, model_id, emb_function, [text])
+            embedding = result[0] if result is not None and len(result) > 0 else None
+
+        if embedding is None:
+            return None
+        return self._store_cached(model_id, emb_function, [text], [embedding])[0]
+
+    async def embed_texts(self, context: Context, model_id: str, emb_function: EmbeddingFunctionInterface, texts: list) -> np.ndarray:
+        # serve cached texts, compute each missing text only once
+        cached = await self._lookup_cached(model_id, emb_function, texts)
+        result = [None] * len(texts)
+        missing: dict[str, list] = {}
+        for index, text in enumerate(texts):
+            if cached[index] is not None:
+                result[index] = cached[index]
+            else:
+                missing.setdefault(text, []).append(index)
+
+        if missing:
+            missing_texts = list(missing.keys())
+            embeddings = await self._compute_embeddings(context, model_id, emb_function, missing_texts)
+            if embeddings is None or len(embeddings) != len(missing_texts):
+                return None
+            vectors = self._store_cached(model_id, emb_function, missing_texts, embeddings)
+            for text, vector in zip(missing_texts, vectors):
+                for index in missing[text]:
+                    result[index] = vector
+        # one vector per row
+        return np.stack(result)
+
+    def get_cache_stats(self, context: Context) -> dict:
+        result = self.embedding_cache.get_stats()
+        if self.disk_cache:
+            result["disk"] = self.disk_cache.get_stats()
+        result["query"] = self.query_cache.get_stats()
+        context.set_payload(result)
+        return result
+
+    def get_admission_stats(self, context: Context) -> dict:
+        result = self.admission.get_stats()
+        context.set_payload(result)
+        return result
+
+    def get_write_buffer_stats(self, context: Context) -> dict:
+        result = dict(self.write_buffer.get_stats(), enabled=True) if self.write_buffer else {"enabled": False}
+        context.set_payload(result)
+        return result
+
+    async def profile(self, context: Context, seconds: float = None, interval_ms: float = None) -> str:
+        """samples the stacks of all threads of the process for some seconds
+
+        :return: folded stacks with their sample counts, the input of flame graph tools
+        :rtype: str
+        """
+        if not self.profiler_enabled:
+            context.set_error("profiler is disabled - set PROFILER_ENABLED", status_code=403)
+            return None
+        if seconds is not None and (seconds <= 0 or seconds > SamplingProfiler.MAX_SECONDS):
+            context.set_error(f"seconds must be between 0 and {SamplingProfiler.MAX_SECONDS}")
+            return None
+
+        # the sampling thread never blocks the event loop
+        stacks = await asyncio.get_running_loop().run_in_executor(
+            None,
+            self.profiler.sample,
+            seconds if seconds else SamplingProfiler.DEFAULT_SECONDS,
+            interval_ms if interval_ms else SamplingProfiler.DEFAULT_INTERVAL_MS
+        )
+        if stacks is None:
+            context.set_error("a profile is already running", status_code=409)
+            return None
+        result = SamplingProfiler.format_folded(stacks)
+        context.set_payload(result)
+        return result
+
+    def collect_metrics(self):
+        # refresh gauges that mirror the state of other components
+        metrics.QUEUE_DEPTH.set(self.executor.get_pending(), queue="inference")
+        if self.write_buffer:
+            metrics.QUEUE_DEPTH.set(self.write_buffer.get_pending(), queue="write_buffer")
+        for name, item in self.admission.classes.items():
+            metrics.QUEUE_DEPTH.set(len(item.waiting), queue=f"admission:{name}")
+            metrics.ADMISSION_RUNNING.set(item.running, priority=name)
+        for model_id, batcher in list(self._batchers.items()):
+            metrics.QUEUE_DEPTH.set(batcher.get_queue_depth(), queue=f"batch:{model_id}")
+        for entry in self.models.get_entries():
+            metrics.MODELS_RESIDENT.set(entry.memory_bytes if entry.is_loaded() else 0, model=entry.model_id)
+
+        tiers = [("memory", self.embedding_cache), ("query", self.query_cache)]
+        if self.disk_cache:
+            tiers.append(("disk", self.disk_cache))
+        for tier, cache in tiers:
+            requests = cache.hits + cache.misses
+            metrics.CACHE_REQUESTS.set(cache.hits, tier=tier, result="hit")
+            metrics.CACHE_REQUESTS.set(cache.misses, tier=tier, result="miss")
+            metrics.CACHE_HIT_RATIO.set(cache.hits / requests if requests else 0.0, tier=tier)
+        metrics.CACHE_BYTES.set(self.embedding_cache.get_stats()["bytes"], tier="memory")
+
+    def clear_cache(self, context: Context) -> bool:
+        self.embedding_cache.clear()
+        self.query_cache.clear()
+        context.set_success("embedding cache cleared")
+        return True
+
+    async def get_embedding(self, context: Context, text: str, model_type: str, model_name: str, model_id: str = None) -> bool:
         try:
-            # get the model id and check if loaded
+            emb_function = await self.get_embedding_function(context=context, model_type=model_type, model_name=model_name, model_id=model_id)
+            if not emb_function:
+                return False
+
+            # get embedding
             use_model_id = self.get_model_id(model_type=model_type, model_name=model_name, model_id=model_id)
-            if not self.is_model_loaded(context=context, model_name=model_name, model_type=model_type, model_id=use_model_id):
-                if not self.load_model(context=context, model_type=model_id, model_name=model_name, model_id=model_id):
-                    context.set_error("model not found")
-                    return False
+            result = await self.embed_text(context=context, model_id=use_model_id, emb_function=emb_function, text=text)
+            if result is not None and len(result) > 0:
+                context.set_payload(result)
+                return True
+            else:
+                if not context.reason:
+                    context.set_error("invalid embedding detected")
+                return False
+
+        except Exception as exc:
+            context.set_error(f"Error: {exc}")
+
+    async def get_embeddings(self, context: Context, texts: list, model_type: str, model_name: str, model_id: str = None) -> bool:
+        try:
+            if not texts:
+                context.set_error("texts required")
+                return False
+
+            if len(texts) > self.max_batch_size:
+                context.set_error(f"batch size {len(texts)} exceeds limit {self.max_batch_size}", status_code=413)
+                return False
 
-            # get embedding function
-            emb_function = self.get_embedding_function_by_id(use_model_id)
+            emb_function = await self.get_embedding_function(context=context, model_type=model_type, model_name=model_name, model_id=model_id)
             if not emb_function:
-                context.set_error("model function not found")
                 return False
 
-            # get embedding
-            result = emb_function.get_embedding(context=context, text=text)
-            if result and isinstance(result, list) and len(result) > 0:
+            # get embeddings in one call
+            use_model_id = self.get_model_id(model_type=model_type, model_name=model_name, model_id=model_id)
+            result = await self.embed_texts(context=context, model_id=use_model_id, emb_function=emb_function, texts=texts)
+            if result is not None and len(result) == len(texts):
                 context.set_payload(result)
                 return True
             else:
-                context.set_error("invalid embedding detected")
+                if not context.reason:
+                    context.set_error("invalid embeddings detected")
                 return False
 
         except Exception as exc:
             context.set_error(f"Error: {exc}")
+            return False
         
-    def documents_query(self, context: Context, max_records: int = 5, document: str = None, embedding: list = None, metadata: dict = {}) -> bool:
+    async def get_vectordb(self, context: Context, collection: str = None, tenant: str = None, database: str = None, create: bool = False) -> VectorDBInterface:
+        """vectordb collection of a request, the startup collection if none is given
+
+        Other collections come from the bounded collection pool of the vectordb
+        and share its client and the loaded models. A missing collection is
+        only created for writes, reads answer with 404.
+        """
+        if not self.vdb_server:
+            context.set_error("no vector engine connected")
+            return None
+        if not collection and not tenant and not database:
+            return self.vdb_server
+        return await self.vdb_server.get_collection(context, collection=collection, tenant=tenant, database=database, create=create)
+
+    async def documents_query(self, context: Context, max_records: int = 5, document: str = None, embedding: list = None, metadata: dict = {}, collection: str = None, tenant: str = None, database: str = None, model: str = None) -> bool:
+        """queries the nearest documents of a document or an embedding
+
+        :param collection: optional: collection of the request, defaults to VECTORDB_COLLECTION
+        :type collection: str, optional
+        :param model: optional: id of the embedding model, defaults to VECTORDB_EMBEDDING
+        :type model: str, optional
+        """
         try:
-            if not self.vdb_server:
-                context.set_error("no vector engine connected")
+            vdb = await self.get_vectordb(context, collection=collection, tenant=tenant, database=database)
+            if not vdb:
                 return False
             
             if not embedding and not document:
                 context.set_error("document or embedding required")
                 return False
 
+            # repeated queries are answered without embedding and vectordb call
+            emb_name = model if model else vdb.get_embedding_name()
+            collection_key = vdb.get_collection_key()
+            generation = self.query_cache.get_generation(collection_key)
+            key = self._get_query_key(collection_key, emb_name, max_records, metadata, document=document, embedding=embedding)
+            result = self.query_cache.get(key)
+            if result is not None:
+                return result
+
             # check embedding
             if not embedding:
-                emb_name = self.vdb_server.get_embedding_name()
-                emb_func = self.get_embedding_function_by_id(emb_name)
+                emb_func = await self.get_embedding_function_by_id(emb_name)
                 if not emb_func:
                     context.set_error(f"valid embedding required - {emb_name} invalid")
                     return False
 
-                embedding = emb_func.get_embedding(context=context, text=document)
-                if not embedding:
-                    context.set_error(f"embedding genearation failed")
+                embedding = await self.embed_text(context=context, model_id=emb_name, emb_function=emb_func, text=document)
+                if embedding is None:
+                    if not context.reason:
+                        context.set_error(f"embedding genearation failed")
                     return False
 
-            return self.vdb_server.query_document(context=context, max_records=max_records, embedding=embedding, metadata=metadata)
+            result = await vdb.query_document(context=context, max_records=max_records, embedding=embedding, metadata=metadata)
+            if result is not False:
+                self.query_cache.put(key, generation, result)
+            return result
 
         except Exception as exc:
             context.set_error(f"Error: {exc}")
             return False
     
-    def document_learn(self, context: Context, id: str, document: str = None, embedding: list = None, uri: str = None, metatdata: dict = {}) -> bool:
+    async def documents_query_batch(self, context: Context, max_records: int = 5, documents: list = None, embeddings: list = None, metadata: dict = {}, merge: bool = False, collection: str = None, tenant: str = None, database: str = None, model: str = None) -> bool:
+        """queries several documents or embeddings with one vectordb call
+
+        :param merge: optional: merge the hits of all queries into one list, defaults to False
+        :type merge: bool, optional
+        :param collection: optional: collection of the request, defaults to VECTORDB_COLLECTION
+        :type collection: str, optional
+        :param model: optional: id of the embedding model, defaults to VECTORDB_EMBEDDING
+        :type model: str, optional
+        :return: list of records per query or one merged list
+        :rtype: list
+        """
+        try:
+            vdb = await self.get_vectordb(context, collection=collection, tenant=tenant, database=database)
+            if not vdb:
+                return False
+
+            if not embeddings and not documents:
+                context.set_error("documents or embeddings required")
+                return False
+
+            if len(embeddings or documents) > self.max_batch_size:
+                context.set_error(f"batch size {len(embeddings or documents)} exceeds limit {self.max_batch_size}", status_code=413)
+                return False
+
+            # only queries missing in the result cache are embedded and sent
+            emb_name = model if model else vdb.get_embedding_name()
+            collection_key = vdb.get_collection_key()
+            generation = self.query_cache.get_generation(collection_key)
+            count = len(embeddings) if embeddings else len(documents)
+            keys = [self._get_query_key(collection_key, emb_name, max_records, metadata, document=documents[index] if not embeddings else None, embedding=embeddings[index] if embeddings else None) for index in range(count)]
+            result = [self.query_cache.get(key) for key in keys]
+            missing = [index for index in range(count) if result[index] is None]
+
+            if missing:
+                # embed all query texts in one pass
+                if embeddings:
+                    query_embeddings = [embeddings[index] for index in missing]
+                else:
+                    emb_func = await self.get_embedding_function_by_id(emb_name)
+                    if not emb_func:
+                        context.set_error(f"valid embedding required - {emb_name} invalid")
+                        return False
+
+                    query_embeddings = await self.embed_texts(context=context, model_id=emb_name, emb_function=emb_func, texts=[documents[index] for index in missing])
+                    if query_embeddings is None:
+                        if not context.reason:
+                            context.set_error(f"embedding genearation failed")
+                        return False
+
+                found = await vdb.query_documents(context=context, max_records=max_records, embeddings=query_embeddings, metadata=metadata)
+                if found is False:
+                    return False
+                for index, records in zip(missing, found):
+                    result[index] = records
+                    self.query_cache.put(keys[index], generation, records)
+
+            if not merge:
+                return result
+            return self._merge_query_results(result, max_records)
+
+        except Exception as exc:
+            context.set_error(f"Error: {exc}")
+            return False
+
+    def _merge_query_results(self, results: list, max_records: int) -> list:
+        # keep the best hit per id, ranked by distance and number of matching queries
+        merged: dict[str, dict] = {}
+        for records in results:
+            for record in records:
+                current = merged.get(record["id"])
+                if current is None:
+                    merged[record["id"]] = dict(record, hits=1)
+                    continue
+                current["hits"] += 1
+                if record.get("distance") is not None and (current.get("distance") is None or record["distance"] < current["distance"]):
+                    current["distance"] = record["distance"]
+
+        ranked = sorted(merged.values(), key=lambda record: (record.get("distance") if record.get("distance") is not None else float("inf"), -record["hits"]))
+        return ranked[:max_records]
+
+    async def document_learn(self, context: Context, id: str, document: str = None, embedding: list = None, uri: str = None, metadata: dict = {}, chunk: bool = None, chunk_tokens: int = None, chunk_overlap: int = None, collection: str = None, tenant: str = None, database: str = None, model: str = None, durable: bool = None) -> bool:
+        """learns a document, optionally split into token windows
+
+        :param chunk: optional: split the document into chunks learned as id#n, defaults to CHUNKING_ENABLED
+        :type chunk: bool, optional
+        :param chunk_tokens: optional: target tokens per chunk, defaults to CHUNK_TOKENS
+        :type chunk_tokens: int, optional
+        :param chunk_overlap: optional: tokens shared by neighbouring chunks, defaults to CHUNK_OVERLAP
+        :type chunk_overlap: int, optional
+        :param collection: optional: collection of the request, defaults to VECTORDB_COLLECTION
+        :type collection: str, optional
+        :param model: optional: id of the embedding model, defaults to VECTORDB_EMBEDDING
+        :type model: str, optional
+        :param durable: optional: with the write buffer, answer after the document is written, defaults to WRITE_BUFFER_DURABLE
+        :type durable: bool, optional
+        """
         try:
             # check
-            if not self.vdb_server:
-                context.set_error("no vector engine connected")
+            vdb = await self.get_vectordb(context, collection=collection, tenant=tenant, database=database, create=True)
+            if not vdb:
                 return False
 
             if not id:
@@ -241,34 +758,336 @@ class ServiceHandler:
                 return False
 
             # check embedding
+            status = None
             if not embedding:
-                emb_name = self.vdb_server.get_embedding_name()
-                emb_func = self.get_embedding_function_by_id(emb_name)
+                emb_name = model if model else vdb.get_embedding_name()
+                emb_func = await self.get_embedding_function_by_id(emb_name)
                 if not emb_func:
                     context.set_error(f"valid embedding required - {emb_name} invalid")
                     return False
 
-                embedding = emb_func.get_embedding(context=context, text=document)
-                if not embedding:
-                    context.set_error(f"embedding genearation failed")
+                chunker = None
+                if chunk if chunk is not None else self.chunking_enabled:
+                    chunker = TextChunker(tokens=chunk_tokens if chunk_tokens else self.chunk_tokens, overlap=chunk_overlap if chunk_overlap is not None else self.chunk_overlap)
+
+                # unchanged documents are neither embedded nor written
+                if self.change_detection:
+                    model_key = self._get_model_key(emb_name)
+                    doc_hash = content_hash(document, uri, metadata, [chunker.tokens, chunker.overlap] if chunker else None)
+                    status = await self._get_learn_status(vdb, f"{id}#0" if chunker else id, doc_hash, model_key)
+                    if status == STATUS_SKIPPED:
+                        return get_counts([status])
+                    metadata = with_change_keys(metadata, doc_hash, model_key)
+
+                if chunker:
+                    if not await self._document_learn_chunks(context, vdb, emb_name, emb_func, chunker, id, document, uri, metadata):
+                        return False
+                    return get_counts([status]) if status else True
+
+                embedding = await self.embed_text(context=context, model_id=emb_name, emb_function=emb_func, text=document)
+                if embedding is None:
+                    if not context.reason:
+                        context.set_error(f"embedding genearation failed")
                     return False
-                
+            elif self.change_detection:
+                status = await self._get_learn_status(vdb, id)
 
-            # learn with embedding
-            return self.vdb_server.learn_document(context=context, id=id, document=document, embedding=embedding, uri=uri, metadata=metatdata)
+            # learn with embedding - the write buffer combines concurrent learns into one upsert
+            if self.write_buffer:
+                learned = await self.write_buffer.add(context, vdb, id=id, document=document, embedding=embedding, uri=uri, metadata=metadata, durable=durable if durable is not None else self.write_buffer_durable)
+            else:
+                learned = await vdb.learn_document(context=context, id=id, document=document, embedding=embedding, uri=uri, metadata=metadata)
+                self._on_vdb_write(vdb)
+            if not learned:
+                return False
+            return get_counts([status]) if status else True
 
         except Exception as exc:
             context.set_error(f"Error: {exc}")
             return False
     
 
-    def documemts_count(self, context: Context) -> bool:
+    async def _document_learn_chunks(self, context: Context, vdb: VectorDBInterface, emb_name: str, emb_func: EmbeddingFunctionInterface, chunker: TextChunker, id: str, document: str, uri: str, metadata: dict) -> bool:
+        # tokenizing is cpu bound like the inference
+        chunks = await self.executor.run(context, chunker.split, emb_func, document)
+        if not chunks:
+            if not context.reason:
+                context.set_error("document has no content")
+            return False
+
+        # all chunks in one batched embedding call
+        embeddings = await self.embed_texts(context=context, model_id=emb_name, emb_function=emb_func, texts=[item["text"] for item in chunks])
+        if embeddings is None:
+            if not context.reason:
+                context.set_error(f"embedding genearation failed")
+            return False
+
+        metadatas = []
+        for index, item in enumerate(chunks):
+            metadatas.append(dict(metadata if metadata else {}, parent_id=id, chunk_index=index, chunk_count=len(chunks), chunk_start=item["start"], chunk_end=item["end"]))
+        learned = await vdb.learn_documents(
+            context=context,
+            ids=[f"{id}#{index}" for index in range(len(chunks))],
+            documents=[item["text"] for item in chunks],
+            embeddings=embeddings,
+            uris=[uri] * len(chunks),
+            metadatas=metadatas
+        )
+        self._on_vdb_write(vdb)
+        if not learned:
+            return False
+
+        # chunks of a longer previous version of the document
+        await vdb.delete_documents(context=Context(), metadata={"$and": [{"parent_id": id}, {"chunk_index": {"$gte": len(chunks)}}]})
+        self._on_vdb_write(vdb)
+        context.set_success(f"document learned as {len(chunks)} chunks")
+        return True
+
+    def _get_query_key(self, collection_key: str, emb_name: str, max_records: int, metadata: dict, document: str = None, embedding: list = None) -> tuple:
+        if embedding is not None and len(embedding) > 0:
+            query = QueryResultCache.embedding_key(embedding)
+        else:
+            query = QueryResultCache.text_key(self._get_model_key(emb_name), document)
+        return QueryResultCache.make_key(collection_key, query, max_records, metadata)
+
+    def _on_vdb_write(self, vdb: VectorDBInterface):
+        # bumped after the write, queries that overlapped it can not store their result
+        self.query_cache.bump(vdb.get_collection_key())
+
+    def _get_model_key(self, model_id: str) -> str:
+        # identifies the model behind an id, a different model under the same id changes the key
+        entry = self.models.get_entry(model_id)
+        return f"{entry.model_type}:{entry.model_name}" if entry else model_id
+
+    async def _get_learn_status(self, vdb: VectorDBInterface, id: str, doc_hash: str = None, model_key: str = None) -> str:
+        existing = await vdb.get_metadatas(context=Context(), ids=[id])
+        if existing is None:
+            return None
+        return get_status(existing, id, doc_hash, model_key)
+
+    async def _detect_changes(self, vdb: VectorDBInterface, records: list, indexes: list, embed: set, model_key: str):
+        # adds the content hash to records embedded here and sets their status
+        hashes = {}
+        for index in indexes:
+            if index in embed:
+                record = records[index]
+                hashes[index] = content_hash(record.get("document"), record.get("uri"), record.get("metadata"))
+                record["metadata"] = with_change_keys(record.get("metadata"), hashes[index], model_key)
+
+        existing = await vdb.get_metadatas(context=Context(), ids=[records[index]["id"] for index in indexes])
+        if existing is None:
+            return
+        for index in indexes:
+            records[index]["_status"] = get_status(existing, records[index]["id"], hashes.get(index), model_key)
+
+    def _has_embedding(self, embedding) -> bool:
+        # works for json lists and numpy vectors
+        return embedding is not None and len(embedding) > 0
+
+    async def documents_embed(self, context: Context, records: list, vdb: VectorDBInterface = None, model: str = None) -> list:
+        """validates records and adds missing embeddings with one batched call
+
+        :param records: dicts with id, document and optional embedding, uri, metadata
+        :type records: list
+        :param vdb: optional: target collection, defaults to the startup collection
+        :param model: optional: id of the embedding model, defaults to the model of the collection
+        :type model: str, optional
+        :return: error reason per record, None for valid records
+        :rtype: list
+        """
+        errors = [None] * len(records)
+        vdb = vdb if vdb else self.vdb_server
+        if not vdb:
+            context.set_error("no vector engine connected")
+            return ["no vector engine connected"] * len(records)
+
+        todo = []
+        for index, record in enumerate(records):
+            if not record.get("id"):
+                errors[index] = "id required"
+            elif not self._has_embedding(record.get("embedding")) and not record.get("document"):
+                errors[index] = "document or embedding required"
+            elif not self._has_embedding(record.get("embedding")):
+                todo.append(index)
+
+        # one lookup for the whole batch, unchanged records are skipped
+        emb_name = model if model else vdb.get_embedding_name()
+        valid = [index for index, error in enumerate(errors) if error is None]
+        if self.change_detection and valid:
+            await self._detect_changes(vdb, records, valid, set(todo), self._get_model_key(emb_name))
+            todo = [index for index in todo if records[index].get("_status") != STATUS_SKIPPED]
+
+        if not todo:
+            return errors
+
+        emb_func = await self.get_embedding_function_by_id(emb_name)
+        if not emb_func:
+            for index in todo:
+                errors[index] = f"valid embedding required - {emb_name} invalid"
+            return errors
+
+        texts = [records[index]["document"] for index in todo]
+        embeddings = await self.embed_texts(context=context, model_id=emb_name, emb_function=emb_func, texts=texts)
+        if embeddings is None and len(todo) > 1:
+            # isolate the failing records instead of failing the whole batch
+            embeddings = []
+            for text in texts:
+                item_context = Context()
+                item_context.priority = context.priority
+                embeddings.append(await self.embed_text(context=item_context, model_id=emb_name, emb_function=emb_func, text=text))
+
+        for position, index in enumerate(todo):
+            embedding = embeddings[position] if embeddings is not None else None
+            if embedding is not None:
+                records[index]["embedding"] = embedding
+            else:
+                errors[index] = "embedding generation failed"
+        return errors
+
+    async def documents_upsert(self, context: Context, records: list, vdb: VectorDBInterface = None) -> bool:
+        vdb = vdb if vdb else self.vdb_server
+        if not vdb:
+            context.set_error("no vector engine connected")
+            return False
+
+        # chroma rejects a batch with duplicate ids, the last write of an id wins
+        records = list({record["id"]: record for record in records}.values())
+        learned = await vdb.learn_documents(
+            context=context,
+            ids=[record["id"] for record in records],
+            documents=[record.get("document") for record in records],
+            embeddings=[record["embedding"] for record in records],
+            uris=[record.get("uri") for record in records],
+            metadatas=[record.get("metadata") for record in records]
+        )
+        self._on_vdb_write(vdb)
+        return learned
+
+    async def job_submit(self, context: Context, chunks, batch_size: int = None, upsert_size: int = None) -> dict:
+        """queues a background ingestion of a streamed body of records
+
+        :return: status of the new job with its id
+        :rtype: dict
+        """
+        try:
+            if not self.vdb_server:
+                context.set_error("no vector engine connected")
+                return None
+
+            job = await self.jobs.submit_upload(context=context, chunks=chunks, batch_size=batch_size, upsert_size=upsert_size)
+            return self._job_status(context, job)
+        except Exception as exc:
+            context.set_error(f"Error: {exc}")
+            return None
+
+    def job_submit_file(self, context: Context, path: str, batch_size: int = None, upsert_size: int = None) -> dict:
+        try:
+            if not self.vdb_server:
+                context.set_error("no vector engine connected")
+                return None
+
+            job = self.jobs.submit_file(context=context, path=path, batch_size=batch_size, upsert_size=upsert_size)
+            return self._job_status(context, job)
+        except Exception as exc:
+            context.set_error(f"Error: {exc}")
+            return None
+
+    def job_migrate(self, context: Context, target: str, source: str = None, tenant: str = None, database: str = None, model: str = None, page_size: int = None, batch_size: int = None, upsert_size: int = None) -> dict:
+        """queues the re-embedding of all records of a collection into another collection
+
+        :param target: collection the re-embedded records are written to
+        :type target: str
+        :param source: optional: collection to read, defaults to VECTORDB_COLLECTION
+        :type source: str, optional
+        :param model: optional: id of the new embedding model, defaults to VECTORDB_EMBEDDING
+        :type model: str, optional
+        :return: status of the new job with its id
+        :rtype: dict
+        """
+        try:
+            if not self.vdb_server:
+                context.set_error("no vector engine connected")
+                return None
+
+            source = source if source else self.vdb_server.collection
+            if not target or target == source:
+                context.set_error("target collection required that differs from the source collection")
+                return None
+
+            emb_name = model if model else self.vdb_server.get_embedding_name()
+            if not self.models.contains(emb_name):
+                context.set_error(f"model {emb_name} not found", status_code=404)
+                return None
+
+            parameters = {
+                "source": source,
+                "target": target,
+                "tenant": tenant,
+                "database": database,
+                "model": emb_name,
+                "page_size": max(1, page_size) if page_size else None
+            }
+            job = self.jobs.submit_migration(context=context, parameters=parameters, batch_size=batch_size, upsert_size=upsert_size)
+            return self._job_status(context, job)
+        except Exception as exc:
+            context.set_error(f"Error: {exc}")
+            return None
+
+    def get_jobs(self, context: Context) -> list:
+        result = self.jobs.get_jobs()
+        context.set_payload(result)
+        return result
+
+    def get_job(self, context: Context, id: str) -> dict:
+        job = self.jobs.get(id)
+        if not job:
+            context.set_error(f"job {id} not found", status_code=404)
+            return None
+        result = job.get_status()
+        context.set_payload(result)
+        return result
+
+    def job_cancel(self, context: Context, id: str) -> dict:
+        return self._job_status(context, self.jobs.cancel(context=context, id=id))
+
+    def job_resume(self, context: Context, id: str) -> dict:
+        return self._job_status(context, self.jobs.resume(context=context, id=id))
+
+    def _job_status(self, context: Context, job) -> dict:
+        if not job:
+            return None
+        result = job.get_status(errors=False)
+        context.set_payload(result)
+        return result
+
+    async def documents_learn_stream(self, context: Context, chunks, batch_size: int = None, upsert_size: int = None) -> dict:
         try:
             if not self.vdb_server:
                 context.set_error("no vector engine connected")
+                return None
+
+            ingestor = BulkIngestor(
+                handler=self,
+                batch_size=batch_size if batch_size else self.ingest_batch_size,
+                upsert_size=upsert_size if upsert_size else self.ingest_upsert_size,
+                max_errors=self.ingest_max_errors,
+                priority=context.priority if context.priority else PRIORITY_BULK
+            )
+            result = await ingestor.run(chunks)
+            context.set_payload(result)
+            return result
+
+        except Exception as exc:
+            context.set_error(f"Error: {exc}")
+            return None
+
+    async def documemts_count(self, context: Context, collection: str = None, tenant: str = None, database: str = None) -> bool:
+        try:
+            vdb = await self.get_vectordb(context, collection=collection, tenant=tenant, database=database)
+            if not vdb:
                 return False
 
-            return self.vdb_server.count(context)
+            return await vdb.count(context)
 
         except Exception as exc:
             context.set_error(f"Error: {exc}")
@@ -285,4 +1104,5 @@ class Factory:
     
     @classmethod
     def new_context(cls) -> Context:
-        return Context()
\ No newline at end of file
+        # request contexts report their stage timings in the Server-Timing header
+        return track_context(Context())
\ No newline at end of file
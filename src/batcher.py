@@ -0,0 +1,142 @@
+from contextlib import nullcontext
+import asyncio
+import time
+import metrics
+from interfaces import EmbeddingFunctionInterface
+from executor import InferenceExecutor
+from admission import AdmissionScheduler, PRIORITIES
+from registry import ModelEntry
+from utils import Context
+
+
+class EmbeddingBatcher:
+    """collects concurrent single text requests of one model and runs them as one batch
+
+    A request waits at most ``max_wait_ms`` for other requests to join its batch,
+    a batch is started early as soon as ``max_batch_size`` texts are queued.
+    Up to ``get_concurrency()`` batches of the embedding function run at the same time.
+    A batch is admitted with the highest priority class of its requests.
+    While a batch runs the model ``entry`` is marked in use, so it is not evicted.
+    """
+
+    DEFAULT_MAX_BATCH_SIZE = 32
+    DEFAULT_MAX_WAIT_MS    = 5
+    DEFAULT_MAX_QUEUE      = 1024
+
+    def __init__(self, model_id: str, emb_function: EmbeddingFunctionInterface, executor: InferenceExecutor, admission: AdmissionScheduler = None, entry: ModelEntry = None, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_wait_ms: int = DEFAULT_MAX_WAIT_MS, max_queue: int = DEFAULT_MAX_QUEUE) -> None:
+        self.model_id: str = model_id
+        self.emb_function = emb_function
+        self.executor = executor
+        self.admission = admission
+        self.entry = entry
+        self.max_batch_size: int = max(1, max_batch_size)
+        self.max_wait_ms: int = max(0, max_wait_ms)
+        self.max_queue: int = max(1, max_queue)
+        self._queue: asyncio.Queue = None
+        self._worker: asyncio.Task = None
+        self._slots: asyncio.Semaphore = None
+        # running batches are kept referenced, they finish even after close
+        self._running: set = set()
+
+    def get_settings(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_queue": self.max_queue
+        }
+
+    async def submit(self, context: Context, text: str) -> list:
+        self._ensure_worker()
+        if self._queue.qsize() >= self.max_queue:
+            context.set_error("embedding queue is full - retry later", status_code=503)
+            return None
+        future = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self._queue.put((text, future, context.priority))
+        embedding, reason, status_code, seconds = await future
+        # the time until the batch ran counts as queue wait
+        context.add_timing("queue", time.perf_counter() - started - seconds)
+        context.add_timing("embed", seconds)
+        if embedding is None:
+            context.set_error(reason, status_code=status_code)
+        return embedding
+
+    def get_queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def close(self):
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+        if self._queue:
+            while not self._queue.empty():
+                _, future, _ = self._queue.get_nowait()
+                if not future.done():
+                    future.set_result((None, "model unloaded", 400, 0.0))
+            self._queue = None
+
+    def _ensure_worker(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(max(1, self.emb_function.get_concurrency()))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # while all slots are busy the next batch keeps growing in the queue
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+
+            # collect until the batch is full or the wait time is over
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            task = loop.create_task(self._process(batch))
+            self._running.add(task)
+            task.add_done_callback(self._release)
+
+    def _release(self, task: asyncio.Task):
+        self._running.discard(task)
+        self._slots.release()
+
+    async def _process(self, batch: list):
+        texts = [text for text, _, _ in batch]
+        context = Context()
+        context.priority = min((priority for _, _, priority in batch), key=lambda priority: PRIORITIES.index(priority) if priority in PRIORITIES else 0)
+        result = None
+        seconds = 0.0
+        with self.entry.use() if self.entry is not None else nullcontext():
+            if self.admission is None or await self.admission.acquire(context, context.priority):
+                started = time.perf_counter()
+                try:
+                    result = await self.emb_function.get_embeddings_async(context=context, texts=texts, executor=self.executor)
+                except Exception as exc:
+                    context.set_error(f"creating embedding failed: {exc}")
+                finally:
+                    if self.admission is not None:
+                        self.admission.release(context.priority)
+                seconds = time.perf_counter() - started
+                metrics.observe_embedding(self.model_id, len(texts), seconds)
+
+        valid = result is not None and len(result) == len(texts)
+        reason = context.reason if context.reason else "invalid embedding"
+        status_code = context.status_code if context.status_code else 400
+        for index, (_, future, _) in enumerate(batch):
+            if future.done():
+                continue
+            if valid:
+                future.set_result((result[index], None, None, seconds))
+            else:
+                future.set_result((None, reason, status_code, seconds))
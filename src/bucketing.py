@@ -0,0 +1,57 @@
+DEFAULT_MAX_BATCH_TOKENS = 8192
+DEFAULT_MAX_BATCH_ITEMS  = 32
+
+
+def token_lengths(tokenizer, texts: list, max_length: int = None) -> list:
+    """number of model tokens per text, estimated from characters without tokenizer"""
+    if tokenizer is not None:
+        try:
+            encoded = tokenizer(texts, add_special_tokens=True, truncation=bool(max_length), max_length=max_length, verbose=False)
+            return [len(ids) for ids in encoded["input_ids"]]
+        except Exception:
+            pass
+    lengths = [len(text) // 4 + 2 for text in texts]
+    return [min(length, max_length) for length in lengths] if max_length else lengths
+
+
+def plan_batches(lengths: list, max_tokens: int = DEFAULT_MAX_BATCH_TOKENS, max_items: int = DEFAULT_MAX_BATCH_ITEMS) -> list:
+    """groups text indexes into batches of similar length
+
+    A forward pass pads every text to the longest one of its batch, so texts
+    are sorted by token length and batches are capped by padded tokens. A
+    batch ends when adding the next text would exceed ``max_tokens`` padded
+    tokens or ``max_items`` texts. A single text longer than ``max_tokens``
+    gets a batch of its own.
+
+    :return: list of batches, each a list of indexes into lengths
+    :rtype: list
+    """
+    batches = []
+    current = []
+    for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+        length = max(1, lengths[index])
+        # texts come in ascending order, the new text is the longest of the batch
+        if current and (length * (len(current) + 1) > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def embed_bucketed(texts: list, lengths: list, embed, max_tokens: int = DEFAULT_MAX_BATCH_TOKENS, max_items: int = DEFAULT_MAX_BATCH_ITEMS) -> list:
+    """runs ``embed`` on length bucketed batches and restores the order of the texts
+
+    :param embed: called with a list of texts, returns one vector per text or None
+    :return: one vector per text in the original order, None if a batch failed
+    :rtype: list
+    """
+    result = [None] * len(texts)
+    for batch in plan_batches(lengths, max_tokens=max_tokens, max_items=max_items):
+        vectors = embed([texts[index] for index in batch])
+        if vectors is None or len(vectors) != len(batch):
+            return None
+        for index, vector in zip(batch, vectors):
+            result[index] = vector
+    return result
@@ -0,0 +1,348 @@
+from collections import OrderedDict
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+
+
+def text_hash(text: str) -> str:
+    """hash of the normalized text used as cache key
+
+    :param text: input text of the embedding
+    :type text: str
+    :return: hex digest of the NFC normalized and stripped text
+    :rtype: str
+    """
+    normalized = unicodedata.normalize("NFC", text).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """in memory LRU cache for embeddings keyed by model id and text hash
+
+    Vectors are stored as float32 arrays, least recently used entries are evicted
+    as soon as the stored vectors exceed ``max_bytes``.
+    """
+
+    DEFAULT_MAX_MB = 64
+    ENTRY_OVERHEAD = 160
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024) -> None:
+        self.max_bytes: int = max(0, max_bytes)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def is_enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, model_id: str, text: str) -> np.ndarray:
+        if not self.is_enabled():
+            return None
+        key = (model_id, text_hash(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model_id: str, text: str, embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        if not self.is_enabled():
+            return vector
+        size = vector.nbytes + self.ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return vector
+
+        key = (model_id, text_hash(text))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes + self.ENTRY_OVERHEAD
+            self._entries[key] = vector
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes + self.ENTRY_OVERHEAD
+                self.evictions += 1
+        return vector
+
+    def invalidate(self, model_id: str) -> int:
+        with self._lock:
+            keys = [key for key in self._entries.keys() if key[0] == model_id]
+            for key in keys:
+                vector = self._entries.pop(key)
+                self._bytes -= vector.nbytes + self.ENTRY_OVERHEAD
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "enabled": self.is_enabled(),
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / requests if requests else 0.0
+            }
+
+
+class EmbeddingDiskCache:
+    """persistent embedding cache in a SQLite file shared by all worker processes
+
+    Rows are keyed by model id, the cache key of the model and text hash. The
+    cache key holds the model type, the model name and every parameter that
+    changes the vectors, like quantization or pooling. The database runs in
+    WAL mode so several uvicorn workers can read and write the same file.
+    Least recently used rows are deleted when the stored vectors exceed ``max_bytes``.
+    """
+
+    DEFAULT_MAX_MB    = 1024
+    TOUCH_INTERVAL    = 3600
+    CHECK_SIZE_EVERY  = 256
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024) -> None:
+        self.path: str = path
+        self.max_bytes: int = max(0, max_bytes)
+        self._lock = threading.Lock()
+        self._puts_since_check: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model_id TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model_id, model_name, text_hash)
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+    def get_many(self, model_id: str, model_name: str, texts: list) -> dict:
+        """looks up several texts at once, errors are reported and count as misses
+
+        :return: found vectors by position in ``texts``
+        :rtype: dict[int, np.ndarray]
+        """
+        hashes = [text_hash(text) for text in texts]
+        now = time.time()
+        found = {}
+        with self._lock:
+            try:
+                rows = {}
+                for start in range(0, len(hashes), 500):
+                    chunk = hashes[start:start + 500]
+                    marks = ",".join("?" * len(chunk))
+                    cursor = self._conn.execute(
+                        f"SELECT text_hash, vector, last_used FROM embeddings WHERE model_id = ? AND model_name = ? AND text_hash IN ({marks})",
+                        [model_id, model_name] + chunk)
+                    for row in cursor:
+                        rows[row[0]] = row
+
+                touched = []
+                for index, hash_value in enumerate(hashes):
+                    row = rows.get(hash_value)
+                    if row is None:
+                        continue
+                    found[index] = np.frombuffer(row[1], dtype="<f4")
+                    if row[2] < now - self.TOUCH_INTERVAL:
+                        touched.append((now, model_id, model_name, hash_value))
+
+                # refresh lru position only once in a while to keep reads cheap
+                if touched:
+                    self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE model_id = ? AND model_name = ? AND text_hash = ?", touched)
+            except Exception as exc:
+                print(f"Reading from embedding disk cache failed: {exc}")
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model_id: str, model_name: str, items: list):
+        """stores (text, vector) pairs, errors are reported and ignored"""
+        now = time.time()
+        rows = [(model_id, model_name, text_hash(text), np.asarray(vector, dtype="<f4").tobytes(), now) for text, vector in items]
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (model_id, model_name, text_hash, vector, last_used) VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+                self._puts_since_check += len(rows)
+                if self._puts_since_check >= self.CHECK_SIZE_EVERY:
+                    self._puts_since_check = 0
+                    self._evict()
+            except Exception as exc:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                print(f"Writing to embedding disk cache failed: {exc}")
+
+    def _evict(self):
+        size = self._get_size()
+        if size <= self.max_bytes:
+            return
+
+        # delete the oldest rows down to 90% of the budget
+        target = int(self.max_bytes * 0.9)
+        self._conn.execute("BEGIN IMMEDIATE")
+        cursor = self._conn.execute("SELECT rowid, length(vector) FROM embeddings ORDER BY last_used")
+        delete = []
+        for rowid, length in cursor:
+            if size <= target:
+                break
+            delete.append((rowid,))
+            size -= length
+        self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", delete)
+        self._conn.execute("COMMIT")
+        self.evictions += len(delete)
+
+    def _get_size(self) -> int:
+        row = self._conn.execute("SELECT COALESCE(SUM(length(vector)), 0) FROM embeddings").fetchone()
+        return row[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            size = self._get_size()
+        requests = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / requests if requests else 0.0
+        }
+
+
+class QueryResultCache:
+    """LRU cache for vectordb query results
+
+    Results are keyed by collection, query, max_records and the canonical
+    where filter. Every collection has a write generation that is bumped after
+    each write, a result is only served while the generation it was read at
+    is current. The ttl bounds the staleness caused by writes this process
+    does not see, e.g. other workers or clients of the same chroma collection.
+    """
+
+    DEFAULT_MAX_ENTRIES = 1024
+    DEFAULT_TTL         = 300
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: int = DEFAULT_TTL) -> None:
+        self.max_entries: int = max(0, max_entries)
+        self.ttl: int = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+        self.expirations: int = 0
+
+    def is_enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def text_key(model_key: str, text: str) -> str:
+        # texts are only comparable for the same model
+        return f"text:{model_key}:{text_hash(text)}"
+
+    @staticmethod
+    def embedding_key(embedding) -> str:
+        return "embedding:" + hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+
+    @staticmethod
+    def make_key(collection: str, query: str, max_records: int, metadata: dict = None) -> tuple:
+        return (collection, query, max_records, json.dumps(metadata if metadata else {}, sort_keys=True, default=str))
+
+    def get_generation(self, collection: str) -> int:
+        with self._lock:
+            return self._generations.get(collection, 0)
+
+    def bump(self, collection: str):
+        with self._lock:
+            self._generations[collection] = self._generations.get(collection, 0) + 1
+
+    def get(self, key: tuple) -> list:
+        if not self.is_enabled():
+            return None
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            generation, expires, result = item
+            if generation != self._generations.get(key[0], 0):
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: tuple, generation: int, result: list):
+        """stores a result read at ``generation``, results of an outdated generation are dropped"""
+        if not self.is_enabled():
+            return
+        with self._lock:
+            if generation != self._generations.get(key[0], 0):
+                return
+            self._entries[key] = (generation, time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "enabled": self.is_enabled(),
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "generations": dict(self._generations),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "expirations": self.expirations,
+                "hit_ratio": self.hits / requests if requests else 0.0
+            }
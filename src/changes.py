@@ -0,0 +1,45 @@
+import hashlib
+import json
+
+
+CONTENT_HASH_KEY    = "content_hash"
+EMBEDDING_MODEL_KEY = "embedding_model"
+
+STATUS_INSERTED = "inserted"
+STATUS_UPDATED  = "updated"
+STATUS_SKIPPED  = "skipped"
+
+
+def content_hash(document: str, uri: str = None, metadata: dict = None, extra=None) -> str:
+    """hash of everything that ends up in a record, except the embedding
+
+    :param extra: optional: settings that change the stored result, e.g. chunk sizes
+    """
+    # the keys written by the service are not part of the content
+    metadata = {key: value for key, value in (metadata if metadata else {}).items() if key not in [CONTENT_HASH_KEY, EMBEDDING_MODEL_KEY]}
+    payload = json.dumps([document, uri, metadata, extra], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def with_change_keys(metadata: dict, doc_hash: str, model: str) -> dict:
+    return dict(metadata if metadata else {}, **{CONTENT_HASH_KEY: doc_hash, EMBEDDING_MODEL_KEY: model})
+
+
+def get_status(existing: dict, id: str, doc_hash: str = None, model: str = None) -> str:
+    """compares a record with the stored metadata of its id
+
+    :param existing: stored metadata by id, ids missing in the vectordb are not in the dict
+    :param doc_hash: content hash of the record, None if the record can not be skipped
+    :return: STATUS_INSERTED, STATUS_UPDATED or STATUS_SKIPPED
+    :rtype: str
+    """
+    if id not in existing:
+        return STATUS_INSERTED
+    metadata = existing[id] if existing[id] else {}
+    if doc_hash and metadata.get(CONTENT_HASH_KEY) == doc_hash and metadata.get(EMBEDDING_MODEL_KEY) == model:
+        return STATUS_SKIPPED
+    return STATUS_UPDATED
+
+
+def get_counts(statuses: list) -> dict:
+    return {status: sum(1 for item in statuses if item == status) for status in [STATUS_INSERTED, STATUS_UPDATED, STATUS_SKIPPED]}
@@ -2,6 +2,9 @@ from chromadb.utils import embedding_functions
 from chromadb import EmbeddingFunction
 from interfaces import EmbeddingFunctionInterface
 from utils import Context
+from chunking import tokenizer_offsets
+from bucketing import token_lengths, embed_bucketed, DEFAULT_MAX_BATCH_TOKENS, DEFAULT_MAX_BATCH_ITEMS
+import numpy as np
 
 
 class EmbeddingFunctionDefault(EmbeddingFunctionInterface):
@@ -14,6 +17,8 @@ class EmbeddingFunctionDefault(EmbeddingFunctionInterface):
             self.model_name = self.DEFAULT_EMB_MODEL
 
         self.emedding_function: EmbeddingFunction = embedding_function
+        self.max_batch_tokens: int = int(self.parameters.get("max_batch_tokens", DEFAULT_MAX_BATCH_TOKENS))
+        self.max_batch_items: int = int(self.parameters.get("max_batch_items", DEFAULT_MAX_BATCH_ITEMS))
     
     def load(self, context: Context) -> bool:
         if not self.model_name:
@@ -31,22 +36,61 @@ class EmbeddingFunctionDefault(EmbeddingFunctionInterface):
         
     
     def unload(self) -> bool:
+        # chroma keeps loaded models in a class level dict, drop it to free the memory
+        models = getattr(type(self.emedding_function), "models", None)
+        if isinstance(models, dict):
+            models.pop(self.model_name, None)
         self.emedding_function = None
         return True
+
+    def get_memory_usage(self) -> int:
+        model = getattr(self.emedding_function, "_model", None)
+        if model is None:
+            return 0
+        try:
+            size = sum(param.numel() * param.element_size() for param in model.parameters())
+            size += sum(buffer.numel() * buffer.element_size() for buffer in model.buffers())
+            return size
+        except Exception:
+            return 0
     
+    def get_token_offsets(self, text: str) -> list:
+        tokenizer = getattr(getattr(self.emedding_function, "_model", None), "tokenizer", None)
+        return tokenizer_offsets(tokenizer, text) if tokenizer else None
+
+    def get_max_tokens(self) -> int:
+        return getattr(getattr(self.emedding_function, "_model", None), "max_seq_length", None)
+
     def get_embedding(self, context: Context, text: str) -> list:
+        result = self.get_embeddings(context=context, texts=[text])
+        if result and len(result) == 1:
+            context.set_payload(result[0])
+            return result[0]
+        else:
+            return None
+
+    def get_embeddings(self, context: Context, texts: list) -> list:
         if not self.emedding_function:
             context.set_error(f"embedding function not available for {self.get_description()}")
             return None
         else:
             try:
-                result = self.emedding_function([text])
-                if result and isinstance(result, list) and len(result) == 1:
-                    context.set_payload(result[0])
-                    return result[0]
+                # texts of similar token length share a forward pass
+                texts = list(texts)
+                tokenizer = getattr(getattr(self.emedding_function, "_model", None), "tokenizer", None)
+                lengths = token_lengths(tokenizer, texts, self.get_max_tokens())
+                result = embed_bucketed(texts, lengths, self._encode, max_tokens=self.max_batch_tokens, max_items=self.max_batch_items)
+                if result is not None:
+                    return result
                 else:
                     context.set_error("invalid embedding")
-                    return None            
+                    return None
             except Exception as exc:
                 context.set_error(f"creating embedding failed: {exc}")
                 return None
+
+    def _encode(self, texts: list) -> list:
+        result = self.emedding_function(texts)
+        if result is None or len(result) != len(texts):
+            return None
+        return [np.asarray(embedding, dtype=np.float32) for embedding in result]
@@ -1,21 +1,39 @@
-from chromadb import HttpClient, Collection
-from interfaces import VectorDBInterface
+from chromadb import AsyncHttpClient
+from chromadb.api import AsyncClientAPI
+from chromadb.api.models.AsyncCollection import AsyncCollection
+from interfaces import VectorDBInterface, DEFAULT_TENANT, DEFAULT_DATABASE
 from utils import Context
+from collection_pool import CollectionPool, CollectionNotFound
+from chromadb.errors import NotFoundError
+import metrics
+import numpy as np
 
 class ChromaDBServer(VectorDBInterface):
+    """collection of a chroma server
+
+    The instance created at startup serves the default collection and hands
+    out instances for other collections. Those are kept in a bounded LRU and
+    share one client per tenant and database. The clients are kept in a bounded
+    LRU as well, all clients of a host share the http connection pool of the
+    chroma system. Only writes create a missing collection.
+    """
 
     def __init__(self, host: str = None, port: int = None, url: str = None, collection: str = "default", parameters: dict = {}) -> None:
         super().__init__(host, port, url, collection, parameters)
-        self.cdb_client: HttpClient = None
-        self.cdb_collection: Collection = None
-        
-
-    def is_valid(self) -> bool:
+        self.cdb_client: AsyncClientAPI = None
+        self.cdb_collection: AsyncCollection = None
+        self.tenant: str = self.parameters.get("tenant", DEFAULT_TENANT)
+        self.database: str = self.parameters.get("database", DEFAULT_DATABASE)
+        max_collections = int(self.parameters.get("max_collections", CollectionPool.DEFAULT_MAX_COLLECTIONS))
+        self._clients: CollectionPool = CollectionPool(max_collections)
+        self._collections: CollectionPool = CollectionPool(max_collections)
+
+    async def is_valid(self) -> bool:
         try:
             if not self.host:
                 return False
             
-            client = HttpClient(host=self.host, port=self.port)
+            client = await self._get_client(self.tenant, self.database)
             if not client:
                 return False
             
@@ -23,31 +41,72 @@ class ChromaDBServer(VectorDBInterface):
             if not coll_name:
                 coll_name = "default"
 
-            coll = client.get_or_create_collection(coll_name)
+            coll = await client.get_or_create_collection(coll_name)
             if not coll:
                 return False
             
             self.cdb_client = client
             self.cdb_collection = coll
             self.collection = coll_name
-            print(f"Connected to chromadb {self.host}:{self.port}/{self.collection} - embbedding {self.get_embedding_name()}")
+            print(f"Connected to chromadb {self.host}:{self.port}/{self.get_collection_key()} - embbedding {self.get_embedding_name()}")
             return True
 
         except Exception as exc:
             print(f"Error while connecting to chromadb server: {self.host}:{self.port}")
             return False
         
-    def count(self, context: Context) -> bool:
-        return self.cdb_collection.count()
+    def get_collection_key(self) -> str:
+        return f"{self.tenant}/{self.database}/{self.collection}"
+
+    async def get_collection(self, context: Context, collection: str = None, tenant: str = None, database: str = None, create: bool = False) -> VectorDBInterface:
+        key = (tenant if tenant else self.tenant, database if database else self.database, collection if collection else self.collection)
+        if key == (self.tenant, self.database, self.collection):
+            return self
+        for attempt in range(2):
+            try:
+                return await self._collections.get(key, lambda: self._open_collection(*key, create))
+            except CollectionNotFound:
+                # a read may have started the shared open call of a write
+                if not create or attempt:
+                    context.set_error(f"collection {'/'.join(key)} not found", status_code=404)
+                    return None
+            except Exception as exc:
+                context.set_error(f"Opening collection {'/'.join(key)} failed - {exc}")
+                return None
+
+    async def _get_client(self, tenant: str, database: str) -> AsyncClientAPI:
+        return await self._clients.get((tenant, database), lambda: AsyncHttpClient(host=self.host, port=self.port, tenant=tenant, database=database))
+
+    async def _open_collection(self, tenant: str, database: str, collection: str, create: bool = False) -> "ChromaDBServer":
+        client = await self._get_client(tenant, database)
+        with metrics.VECTORDB_SECONDS.time(operation="open"):
+            try:
+                handle = await (client.get_or_create_collection(collection) if create else client.get_collection(collection))
+            except NotFoundError:
+                raise CollectionNotFound(collection)
+        instance = ChromaDBServer(host=self.host, port=self.port, url=self.url, collection=collection, parameters=dict(self.parameters, tenant=tenant, database=database))
+        instance.cdb_client = client
+        instance.cdb_collection = handle
+        return instance
+
+    async def count(self, context: Context) -> bool:
+        with context.timing("vectordb"), metrics.VECTORDB_SECONDS.time(operation="count"):
+            return await self.cdb_collection.count()
     
     def get_embedding_name(self) -> str:
         return self.parameters.get("embedding", None)
 
-    def learn_document(self, context: Context, id: str, document: str = None, embedding: list = None, uri: str = None, metadata: dict = ...) -> bool:
+    def _as_vectors(self, embeddings: list) -> list:
+        # chroma only inspects the first item, so mixed lists and arrays must be unified
+        if embeddings is None:
+            return None
+        return [np.asarray(embedding, dtype=np.float32) for embedding in embeddings]
+
+    async def learn_document(self, context: Context, id: str, document: str = None, embedding: list = None, uri: str = None, metadata: dict = ...) -> bool:
         try:
             embeddings = None
-            if embedding:
-                embeddings = [embedding]
+            if embedding is not None and len(embedding) > 0:
+                embeddings = self._as_vectors([embedding])
 
             metadatas = None
             if metadata:
@@ -58,61 +117,136 @@ class ChromaDBServer(VectorDBInterface):
                 uris = [uri]
 
             # learn
-            self.cdb_collection.upsert(
-                documents=[document],
-                metadatas=metadatas,
-                uris=uris,
-                embeddings=embeddings,
-                ids=[id]
-            )
+            with context.timing("vectordb"), metrics.VECTORDB_SECONDS.time(operation="upsert"):
+                await self.cdb_collection.upsert(
+                    documents=[document],
+                    metadatas=metadatas,
+                    uris=uris,
+                    embeddings=embeddings,
+                    ids=[id]
+                )
             return True
         except Exception as exc:
+            metrics.VECTORDB_ERRORS.inc(operation="upsert")
             context.set_error(f"Learning document failed - {exc}")
             return False
 
-    def query_document(self, context: Context, max_records: int = 5, embedding: list = None, metadata: dict = None) -> bool:
+    async def learn_documents(self, context: Context, ids: list, documents: list = None, embeddings: list = None, uris: list = None, metadatas: list = None) -> bool:
         try:
-            # prepare
-            include = ["documents", "metadatas"]
+            # chroma rejects empty metadata dicts
+            if metadatas:
+                metadatas = [metadata if metadata else None for metadata in metadatas]
+                if not any(metadatas):
+                    metadatas = None
+
+            if uris and not any(uris):
+                uris = None
+
+            with context.timing("vectordb"), metrics.VECTORDB_SECONDS.time(operation="upsert_batch"):
+                await self.cdb_collection.upsert(
+                    documents=documents,
+                    metadatas=metadatas,
+                    uris=uris,
+                    embeddings=self._as_vectors(embeddings),
+                    ids=ids
+                )
+            return True
+        except Exception as exc:
+            metrics.VECTORDB_ERRORS.inc(operation="upsert_batch")
+            context.set_error(f"Learning documents failed - {exc}")
+            return False
+
+    async def get_metadatas(self, context: Context, ids: list) -> dict:
+        try:
+            with context.timing("vectordb"), metrics.VECTORDB_SECONDS.time(operation="get"):
+                result = await self.cdb_collection.get(ids=ids, include=["metadatas"])
+            metadatas = result.get("metadatas") or [None] * len(result["ids"])
+            return dict(zip(result["ids"], metadatas))
+        except Exception as exc:
+            metrics.VECTORDB_ERRORS.inc(operation="get")
+            context.set_error(f"Reading documents failed - {exc}")
+            return None
+
+    async def get_documents(self, context: Context, offset: int = 0, limit: int = 100) -> list:
+        try:
+            with context.timing("vectordb"), metrics.VECTORDB_SECONDS.time(operation="get_page"):
+                result = await self.cdb_collection.get(offset=offset, limit=limit, include=["documents", "metadatas", "uris"])
+            count = len(result["ids"])
+            documents = result.get("documents") or [None] * count
+            metadatas = result.get("metadatas") or [None] * count
+            uris = result.get("uris") or [None] * count
+            return [{"id": id, "document": document, "uri": uri, "metadata": metadata} for id, document, uri, metadata in zip(result["ids"], documents, uris, metadatas)]
+        except Exception as exc:
+            metrics.VECTORDB_ERRORS.inc(operation="get_page")
+            context.set_error(f"Reading documents failed - {exc}")
+            return None
 
+    async def delete_documents(self, context: Context, ids: list = None, metadata: dict = None) -> bool:
+        try:
+            with context.timing("vectordb"), metrics.VECTORDB_SECONDS.time(operation="delete"):
+                await self.cdb_collection.delete(ids=ids, where=metadata if metadata else None)
+            return True
+        except Exception as exc:
+            metrics.VECTORDB_ERRORS.inc(operation="delete")
+            context.set_error(f"Deleting documents failed - {exc}")
+            return False
 
-            # query
-            result = self.cdb_collection.query(
-                n_results=max_records,
-                query_embeddings=embedding,
-                where=metadata,
-                include=include
-            )
+    async def query_document(self, context: Context, max_records: int = 5, embedding: list = None, metadata: dict = None) -> bool:
+        result = await self.query_documents(context=context, max_records=max_records, embeddings=[embedding], metadata=metadata)
+        if result is False:
+            return False
+        return result[0]
+
+    async def query_documents(self, context: Context, max_records: int = 5, embeddings: list = None, metadata: dict = None) -> bool:
+        try:
+            # prepare
+            include = ["documents", "metadatas", "distances"]
+
+            # one query for all embeddings
+            with context.timing("vectordb"), metrics.VECTORDB_SECONDS.time(operation="query"):
+                result = await self.cdb_collection.query(
+                    n_results=max_records,
+                    query_embeddings=self._as_vectors(embeddings),
+                    where=metadata if metadata else None,
+                    include=include
+                )
 
             if not result or not "ids" in result:
                 context.set_error(f"vectordb embedding query failed - invalid result")
                 return False
 
-            # transform results
-            records = []
-            ids = result["ids"][0]
-            docs = result["documents"][0]
-            metas = result["metadatas"][0]
-            uris = None
-            if "uris" in result:
-                uris = result["uris"]
-                if uris and isinstance(uris, list):
-                    uris = result["uris"][0]
-
-            count = len(ids)
-            current = 0
-            while current < count:
-                record = {
-                   "id": ids[current],
-                   "document": docs[current],
-                   "metadata": metas[current]     
-                }
-                if uris:
-                    record["uri"] = uris[current]
-                records.append(record)
-                current += 1
-
-            return records
+            # transform results per query
+            all_records = []
+            for query_index in range(len(result["ids"])):
+                ids = result["ids"][query_index]
+                docs = result["documents"][query_index]
+                metas = result["metadatas"][query_index]
+                distances = None
+                if result.get("distances"):
+                    distances = result["distances"][query_index]
+                uris = None
+                if result.get("uris"):
+                    uris = result["uris"][query_index]
+
+                records = []
+                count = len(ids)
+                current = 0
+                while current < count:
+                    record = {
+                       "id": ids[current],
+                       "document": docs[current],
+                       "metadata": metas[current]     
+                    }
+                    if uris:
+                        record["uri"] = uris[current]
+                    if distances:
+                        record["distance"] = distances[current]
+                    records.append(record)
+                    current += 1
+                all_records.append(records)
+
+            return all_records
         except Exception as exc:
-            context.set_error(f"Learning document failed - {exc}")
-            return False        
\ No newline at end of file
+            metrics.VECTORDB_ERRORS.inc(operation="query")
+            context.set_error(f"Querying documents failed - {exc}")
+            return False
@@ -0,0 +1,73 @@
+import re
+from interfaces import EmbeddingFunctionInterface
+
+
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def get_token_spans(emb_function: EmbeddingFunctionInterface, text: str) -> list:
+    """character spans of the tokens of a text
+
+    Uses the tokenizer of the model, functions without a local tokenizer
+    fall back to whitespace separated words.
+    """
+    spans = emb_function.get_token_offsets(text)
+    if spans is None:
+        spans = [(match.start(), match.end()) for match in WORD_PATTERN.finditer(text)]
+    # special and empty tokens have no characters
+    return [(start, end) for start, end in spans if end > start]
+
+
+def tokenizer_offsets(tokenizer, text: str) -> list:
+    # fast huggingface tokenizers only, slow ones have no offset mapping
+    try:
+        encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, truncation=False, verbose=False)
+        return [tuple(span) for span in encoded["offset_mapping"]]
+    except Exception:
+        return None
+
+
+class TextChunker:
+    """splits documents into overlapping windows of model tokens
+
+    Chunks are cut at token boundaries and hold the original text between the
+    first and the last token of the window. The window is reduced to the max
+    sequence length of the model, so no chunk is truncated by the model.
+    """
+
+    DEFAULT_TOKENS  = 256
+    DEFAULT_OVERLAP = 32
+
+    # room for the special tokens added by the model
+    SPECIAL_TOKENS = 2
+
+    def __init__(self, tokens: int = DEFAULT_TOKENS, overlap: int = DEFAULT_OVERLAP) -> None:
+        self.tokens: int = max(1, tokens)
+        self.overlap: int = max(0, overlap)
+
+    def split(self, emb_function: EmbeddingFunctionInterface, text: str) -> list:
+        """
+        :return: list of dicts with text, start and end character offsets and token count
+        :rtype: list
+        """
+        tokens = self.tokens
+        max_tokens = emb_function.get_max_tokens()
+        if max_tokens:
+            tokens = max(1, min(tokens, max_tokens - self.SPECIAL_TOKENS))
+        overlap = min(self.overlap, tokens - 1)
+
+        spans = get_token_spans(emb_function, text)
+        if not spans:
+            return [{"text": text, "start": 0, "end": len(text), "tokens": 0}] if text else []
+
+        result = []
+        first = 0
+        while True:
+            last = min(first + tokens, len(spans))
+            start = spans[first][0]
+            end = spans[last - 1][1]
+            result.append({"text": text[start:end], "start": start, "end": end, "tokens": last - first})
+            if last >= len(spans):
+                break
+            first = last - overlap
+        return result
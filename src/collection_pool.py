@@ -0,0 +1,55 @@
+from collections import OrderedDict
+import asyncio
+
+
+class CollectionNotFound(Exception):
+    """raised by an open call for a collection that does not exist and may not be created"""
+
+
+class CollectionPool:
+    """bounded LRU of opened vectordb collections
+
+    Concurrent requests for a collection that is not open yet share one
+    open call. The least recently used collection is dropped when the pool
+    exceeds ``max_collections``, requests still using it finish normally.
+    """
+
+    DEFAULT_MAX_COLLECTIONS = 64
+
+    def __init__(self, max_collections: int = DEFAULT_MAX_COLLECTIONS) -> None:
+        self.max_collections: int = max(1, max_collections)
+        self._collections: OrderedDict = OrderedDict()
+        self._opening: dict = {}
+        self.opened: int = 0
+        self.evictions: int = 0
+
+    async def get(self, key, open):
+        """returns the collection of ``key``, ``open`` is awaited on a miss and may raise"""
+        collection = self._collections.get(key)
+        if collection is not None:
+            self._collections.move_to_end(key)
+            return collection
+
+        task = self._opening.get(key)
+        if task is None:
+            task = asyncio.ensure_future(open())
+            self._opening[key] = task
+            task.add_done_callback(lambda _: self._opening.pop(key, None))
+        collection = await asyncio.shield(task)
+
+        if key not in self._collections:
+            self.opened += 1
+        self._collections[key] = collection
+        self._collections.move_to_end(key)
+        while len(self._collections) > self.max_collections:
+            self._collections.popitem(last=False)
+            self.evictions += 1
+        return collection
+
+    def get_stats(self) -> dict:
+        return {
+            "collections": len(self._collections),
+            "max_collections": self.max_collections,
+            "opened": self.opened,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,136 @@
+from fastapi.responses import Response
+import base64
+import json
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+FORMAT_JSON    = "json"
+FORMAT_FLOAT32 = "float32"
+FORMAT_FLOAT16 = "float16"
+FORMAT_BASE64  = "base64"
+FORMAT_MSGPACK = "msgpack"
+
+VALID_FORMATS = [FORMAT_JSON, FORMAT_FLOAT32, FORMAT_FLOAT16, FORMAT_BASE64, FORMAT_MSGPACK]
+
+MEDIA_TYPES = {
+    "application/json": FORMAT_JSON,
+    "application/octet-stream": FORMAT_FLOAT32,
+    "application/x-float32": FORMAT_FLOAT32,
+    "application/x-float16": FORMAT_FLOAT16,
+    "application/msgpack": FORMAT_MSGPACK,
+    "application/x-msgpack": FORMAT_MSGPACK
+}
+
+
+def parse_accept(accept: str) -> list:
+    """splits an Accept header into ``(media_type, q)`` tuples in listed order
+
+    Entries with an invalid or zero q-value are not acceptable and dropped.
+    """
+    result = []
+    for part in accept.split(","):
+        params = part.split(";")
+        media_type = params[0].strip().lower()
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            result.append((media_type, q))
+    return result
+
+
+def negotiate_format(accept: str = None, format: str = None) -> str:
+    """selects the response format of embedding vectors
+
+    An explicit ``format`` query parameter wins over the Accept header. Of the
+    Accept header the supported type with the highest q-value is used, the
+    first listed one on a tie. JSON is used if neither asks for a supported
+    binary format.
+
+    :return: one of VALID_FORMATS or None if the requested format is not available
+    :rtype: str
+    """
+    if format:
+        format = format.lower()
+        if format not in VALID_FORMATS:
+            return None
+    elif accept:
+        format = FORMAT_JSON
+        best = 0.0
+        for media_type, q in parse_accept(accept):
+            if media_type in MEDIA_TYPES:
+                candidate = MEDIA_TYPES[media_type]
+            elif media_type in ["*/*", "application/*"]:
+                candidate = FORMAT_JSON
+            else:
+                continue
+            # msgpack is only offered when it is installed
+            if candidate == FORMAT_MSGPACK and msgpack is None:
+                continue
+            if q > best:
+                format = candidate
+                best = q
+    else:
+        format = FORMAT_JSON
+
+    if format == FORMAT_MSGPACK and msgpack is None:
+        return None
+    return format
+
+
+def encode_embeddings(vectors: np.ndarray, format: str = FORMAT_JSON, key: str = None) -> Response:
+    """writes a vector or a matrix of vectors in the negotiated format
+
+    Binary formats are written from the array buffer without converting to
+    python floats. Raw float32/float16 bodies are little endian and row major,
+    the shape is sent in the X-Embedding-Shape header.
+
+    :param vectors: one vector (1 dim) or one vector per text (2 dim)
+    :type vectors: np.ndarray
+    :param format: one of VALID_FORMATS
+    :type format: str
+    :param key: optional: wraps json, base64 and msgpack payloads in an object with this key
+    :type key: str
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    shape = ",".join(str(size) for size in vectors.shape)
+    headers = {"X-Embedding-Shape": shape}
+
+    if format == FORMAT_FLOAT32:
+        headers["X-Embedding-Dtype"] = "float32"
+        return Response(content=vectors.astype("<f4", copy=False).tobytes(), media_type="application/octet-stream", headers=headers)
+
+    if format == FORMAT_FLOAT16:
+        headers["X-Embedding-Dtype"] = "float16"
+        return Response(content=vectors.astype("<f2").tobytes(), media_type="application/x-float16", headers=headers)
+
+    if format == FORMAT_MSGPACK:
+        payload = {"dtype": "float32", "shape": list(vectors.shape), "data": vectors.astype("<f4", copy=False).tobytes()}
+        if key:
+            payload = {key: payload}
+        return Response(content=msgpack.packb(payload, use_bin_type=True), media_type="application/msgpack", headers=headers)
+
+    if format == FORMAT_BASE64:
+        # one base64 string per vector
+        if vectors.ndim == 1:
+            payload = base64.b64encode(vectors.astype("<f4", copy=False).tobytes()).decode("ascii")
+        else:
+            payload = [base64.b64encode(row.astype("<f4", copy=False).tobytes()).decode("ascii") for row in vectors]
+    else:
+        payload = vectors.tolist()
+
+    if key:
+        payload = {key: payload}
+    return Response(content=json.dumps(payload), media_type="application/json", headers=headers)
@@ -0,0 +1,38 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from utils import Context
+
+
+class InferenceExecutor:
+    """bounded thread pool for cpu bound model calls
+
+    Keeps inference off the asyncio event loop. At most ``max_workers`` calls run
+    at the same time and at most ``max_queue`` calls may wait for a free worker,
+    further calls are rejected with status 503 instead of piling up.
+    """
+
+    DEFAULT_MAX_WORKERS = 1
+    DEFAULT_MAX_QUEUE   = 256
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE) -> None:
+        self.max_workers: int = max(1, max_workers)
+        self.max_queue: int = max(0, max_queue)
+        self._pending: int = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+
+    def get_pending(self) -> int:
+        return self._pending
+
+    async def run(self, context: Context, func, *args):
+        if self._pending >= self.max_workers + self.max_queue:
+            context.set_error("inference queue is full - retry later", status_code=503)
+            return None
+
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
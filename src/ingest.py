@@ -0,0 +1,320 @@
+import asyncio
+import codecs
+import json
+from utils import Context
+from changes import STATUS_INSERTED, STATUS_UPDATED, STATUS_SKIPPED
+from admission import PRIORITY_BULK
+
+
+async def iter_json_records(chunks, max_record_bytes: int = 16 * 1024 * 1024):
+    """parses a streamed body of NDJSON lines or one JSON array record by record
+
+    Yields ``(index, record, error)`` tuples, only one record is held in memory.
+    Invalid records are reported with an error instead of stopping the stream.
+
+    :param chunks: async iterator over the raw body bytes
+    :param max_record_bytes: max size of a single record
+    :type max_record_bytes: int
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    is_array = None
+    index = 0
+
+    async for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+
+        # detect the format with the first non blank character
+        if is_array is None:
+            buffer = buffer.lstrip()
+            if not buffer:
+                continue
+            is_array = buffer.startswith("[")
+            if is_array:
+                buffer = buffer[1:]
+
+        if is_array:
+            position = 0
+            while True:
+                position = _skip_separators(buffer, position)
+                if position >= len(buffer) or buffer[position] == "]":
+                    break
+                try:
+                    record, position_end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as exc:
+                    end = _find_element_end(buffer, position)
+                    if end is None:
+                        # record not complete yet
+                        if len(buffer) - position > max_record_bytes:
+                            yield index, None, "record too large"
+                            return
+                        break
+                    # the element is complete but invalid, continue after it
+                    yield index, None, f"invalid json: {exc.msg}"
+                    index += 1
+                    position = end
+                    continue
+                position = position_end
+                yield index, record, None
+                index += 1
+            buffer = buffer[position:]
+        else:
+            lines = buffer.split("\n")
+            buffer = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield index, *_parse_line(decoder, line)
+                    index += 1
+            if len(buffer) > max_record_bytes:
+                yield index, None, "record too large"
+                return
+
+    buffer += text_decoder.decode(b"", final=True)
+    if is_array:
+        rest = buffer.strip()
+        if rest and rest != "]":
+            yield index, None, "invalid json at end of array"
+    elif buffer.strip():
+        yield index, *_parse_line(decoder, buffer)
+
+
+def _find_element_end(buffer: str, position: int) -> int:
+    """position of the ``,`` or ``]`` that ends the array element at ``position``, None if it is not buffered yet"""
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(position, len(buffer)):
+        char = buffer[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            if depth == 0:
+                return index
+            depth -= 1
+        elif char == "," and depth == 0:
+            return index
+    return None
+
+
+def _skip_separators(buffer: str, position: int) -> int:
+    while position < len(buffer) and buffer[position] in " \t\r\n,":
+        position += 1
+    return position
+
+
+async def iter_collection_records(vdb, page_size: int = 256, offset: int = 0):
+    """pages through a vectordb collection, yields ``(index, record, error)`` tuples like ``iter_json_records``
+
+    The next page is read while the records of the current page are processed,
+    at most two pages are held in memory.
+
+    :param vdb: collection that supports ``get_documents``
+    :param offset: optional: number of leading records to leave out
+    :type offset: int, optional
+    """
+    page_size = max(1, page_size)
+
+    async def read(start: int) -> list:
+        context = Context()
+        records = await vdb.get_documents(context=context, offset=start, limit=page_size)
+        if records is None:
+            raise RuntimeError(context.reason if context.reason else "reading the collection is not supported by the vectordb")
+        return records
+
+    index = max(0, offset)
+    task = asyncio.ensure_future(read(index))
+    try:
+        while task:
+            records = await task
+            task = asyncio.ensure_future(read(index + len(records))) if len(records) == page_size else None
+            for record in records:
+                yield index, record, None
+                index += 1
+    finally:
+        if task:
+            task.cancel()
+
+
+def _parse_line(decoder: json.JSONDecoder, line: str) -> tuple:
+    try:
+        return decoder.decode(line), None
+    except json.JSONDecodeError as exc:
+        return None, f"invalid json: {exc}"
+
+
+class BulkIngestor:
+    """embeds and upserts a stream of documents with bounded memory
+
+    Records are embedded in batches of ``batch_size`` and written in chunks of
+    ``upsert_size``. One upsert runs in the background while the next batch is
+    embedded. Failed records are counted and reported, they never stop the load.
+    Records repeating an id within one upsert chunk collapse to the last one,
+    ``learned`` counts the distinct ids written and ``collapsed`` the others.
+    Unchanged records are skipped by the change detection of the handler.
+    Embedding calls are admitted in the ``priority`` class, bulk by default.
+    ``vdb`` and ``model`` select another target than the startup collection.
+
+    ``stop`` ends a load after the records read so far are written.
+    ``get_committed`` tells how many leading records are finished, a load can
+    be continued from there with the ``skip`` parameter of ``run``.
+    """
+
+    DEFAULT_BATCH_SIZE  = 64
+    DEFAULT_UPSERT_SIZE = 256
+    DEFAULT_MAX_ERRORS  = 1000
+
+    def __init__(self, handler, batch_size: int = DEFAULT_BATCH_SIZE, upsert_size: int = DEFAULT_UPSERT_SIZE, max_errors: int = DEFAULT_MAX_ERRORS, priority: str = PRIORITY_BULK, vdb=None, model: str = None) -> None:
+        self.handler = handler
+        self.vdb = vdb
+        self.model: str = model
+        self.priority: str = priority
+        self.batch_size: int = max(1, batch_size)
+        self.upsert_size: int = max(1, upsert_size)
+        self.max_errors: int = max(0, max_errors)
+        self.received: int = 0
+        self.learned: int = 0
+        self.collapsed: int = 0
+        self.failed: int = 0
+        self.inserted: int = 0
+        self.updated: int = 0
+        self.skipped: int = 0
+        self.errors: list = []
+        self._batch: list = []
+        self._pending: list = []
+        self._inflight: list = []
+        self._processed: int = 0
+        self._upsert_task: asyncio.Task = None
+        self.stopped: bool = False
+
+    async def run(self, chunks, skip: int = 0) -> dict:
+        """
+        :param chunks: async iterator over the raw body bytes
+        :param skip: optional: number of leading records to ignore, e.g. the committed records of an earlier run
+        :type skip: int, optional
+        """
+        return await self.run_records(iter_json_records(chunks), skip=skip)
+
+    async def run_records(self, records, skip: int = 0) -> dict:
+        """
+        :param records: async iterator over ``(index, record, error)`` tuples
+        :param skip: optional: number of leading records to ignore
+        :type skip: int, optional
+        """
+        try:
+            async for index, record, error in records:
+                if self.stopped:
+                    break
+                self._processed = index + 1
+                if index < skip:
+                    continue
+                self.received += 1
+                if error:
+                    self._add_error(index, None, error)
+                    continue
+                if not isinstance(record, dict):
+                    self._add_error(index, None, "record must be an object")
+                    continue
+
+                self._batch.append((index, record))
+                if len(self._batch) >= self.batch_size:
+                    await self._embed_batch()
+
+            if self._batch:
+                await self._embed_batch()
+            while self._pending:
+                await self._start_upsert()
+        finally:
+            await self._wait_upsert()
+        return self.get_summary()
+
+    def stop(self):
+        self.stopped = True
+
+    def get_committed(self) -> int:
+        # records before the first unfinished one are learned, skipped or failed
+        unfinished = [items[0][0] for items in [self._batch, self._pending, self._inflight] if items]
+        return min(unfinished) if unfinished else self._processed
+
+    def get_summary(self) -> dict:
+        return {
+            "received": self.received,
+            "learned": self.learned,
+            "collapsed": self.collapsed,
+            "failed": self.failed,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors)
+        }
+
+    async def _embed_batch(self):
+        batch = self._batch
+        records = [record for _, record in batch]
+        context = Context()
+        context.priority = self.priority
+        errors = await self.handler.documents_embed(context=context, records=records, vdb=self.vdb, model=self.model)
+        for (index, record), error in zip(batch, errors):
+            if error:
+                self._add_error(index, record.get("id"), error)
+            elif record.get("_status") == STATUS_SKIPPED:
+                self.skipped += 1
+            else:
+                self._pending.append((index, record))
+        self._batch = []
+
+        while len(self._pending) >= self.upsert_size:
+            await self._start_upsert()
+
+    async def _start_upsert(self):
+        # only one upsert is in flight, it overlaps with embedding the next batch
+        await self._wait_upsert()
+        chunk = self._pending[:self.upsert_size]
+        self._pending = self._pending[self.upsert_size:]
+        self._inflight = chunk
+        self._upsert_task = asyncio.get_running_loop().create_task(self._upsert(chunk))
+
+    async def _wait_upsert(self):
+        if self._upsert_task:
+            task = self._upsert_task
+            self._upsert_task = None
+            await task
+
+    async def _upsert(self, chunk: list):
+        context = Context()
+        try:
+            success = await self.handler.documents_upsert(context=context, records=[record for _, record in chunk], vdb=self.vdb)
+        except Exception as exc:
+            success = False
+            context.set_error(f"upsert failed: {exc}")
+
+        if success:
+            # the upsert keeps the last record of an id
+            written = {record.get("id"): record for _, record in chunk}
+            self.learned += len(written)
+            self.collapsed += len(chunk) - len(written)
+            for record in written.values():
+                if record.get("_status") == STATUS_INSERTED:
+                    self.inserted += 1
+                elif record.get("_status") == STATUS_UPDATED:
+                    self.updated += 1
+        else:
+            reason = context.reason if context.reason else "upsert failed"
+            for index, record in chunk:
+                self._add_error(index, record.get("id"), reason)
+        self._inflight = []
+
+    def _add_error(self, index: int, id: str, reason: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"index": index, "id": id, "reason": reason})
@@ -1,10 +1,11 @@
 from utils import Context
+from executor import InferenceExecutor
 class EmbeddingFunctionInterface:
     def __init__(self, type_desc: str, model_name: str, model_desc: str = None, parameters: dict = {}) -> None:
         self.model_name = model_name
         self.model_desc = model_desc
         self.type_desc  = type_desc
-        self.parameters: dict = {}
+        self.parameters: dict = parameters if parameters else {}
         if not self.model_desc:
             self.model_desc = self.model_name
 
@@ -14,6 +15,26 @@ class EmbeddingFunctionInterface:
     def unload(self) -> bool:
         return True
 
+    def get_memory_usage(self) -> int:
+        # bytes held by the model, 0 if unknown
+        return 0
+
+    def get_concurrency(self) -> int:
+        # number of batches the function can compute at the same time
+        return 1
+
+    def get_token_offsets(self, text: str) -> list:
+        # character spans of the model tokens, None without a local tokenizer
+        return None
+
+    def get_max_tokens(self) -> int:
+        # max sequence length of the model, None if unknown
+        return None
+
+    def get_cache_key(self) -> str:
+        # identifies the vectors of the model in persistent caches, with every parameter that changes them
+        return self.model_name
+
     def load(self, context: Context) -> bool:
         context.set_error("abstract interface used")
         return False
@@ -22,6 +43,24 @@ class EmbeddingFunctionInterface:
         context.set_error("abstract interface used")
         return None
 
+    def get_embeddings(self, context: Context, texts: list) -> list:
+        # fallback for functions without native batch support
+        result = []
+        for text in texts:
+            embedding = self.get_embedding(context=context, text=text)
+            if embedding is None or embedding is False:
+                return None
+            result.append(embedding)
+        return result
+
+    async def get_embeddings_async(self, context: Context, texts: list, executor: InferenceExecutor) -> list:
+        # in process models run on the inference executor, i/o bound functions override this
+        return await executor.run(context, self.get_embeddings, context, texts)
+
+
+DEFAULT_TENANT   = "default_tenant"
+DEFAULT_DATABASE = "default_database"
+
 
 class VectorDBInterface:
     def __init__(self, host: str = None, port: int = None, url: str = None, collection: str = "default", parameters: dict = {}) -> None:
@@ -31,17 +70,45 @@ class VectorDBInterface:
         self.collection: str = collection
         self.parameters: dict = parameters
         
-    def is_valid(self) -> bool:
+    async def is_valid(self) -> bool:
+        return False
+    
+    async def learn_document(self, context: Context, id: str, document: str = None, embedding: list = None, uri: str = None, metadata: dict = {}) -> bool:
+        return False
+    
+    async def learn_documents(self, context: Context, ids: list, documents: list = None, embeddings: list = None, uris: list = None, metadatas: list = None) -> bool:
         return False
     
-    def learn_document(self, context: Context, id: str, document: str = None, embedding: list = None, uri: str = None, metadata: dict = {}) -> bool:
+    async def query_document(self, context: Context, max_records: int = 5, embedding: list = None, metadata: dict = None) -> bool:
         return False
     
-    def query_document(self, context: Context, max_records: int = 5, embedding: list = None, metadata: dict = None) -> bool:
+    async def query_documents(self, context: Context, max_records: int = 5, embeddings: list = None, metadata: dict = None) -> bool:
         return False
+
+    async def delete_documents(self, context: Context, ids: list = None, metadata: dict = None) -> bool:
+        return False
+
+    async def get_metadatas(self, context: Context, ids: list) -> dict:
+        # stored metadata by id for the existing ids, None if not supported
+        return None
+
+    async def get_documents(self, context: Context, offset: int = 0, limit: int = 100) -> list:
+        # one page of records with id, document, uri and metadata in a stable order, None if not supported
+        return None
     
-    def count(self, context: Context) -> bool:
+    async def count(self, context: Context) -> bool:
         return False
+
+    def get_collection_key(self) -> str:
+        # unique name of the collection within the process
+        return self.collection
+
+    async def get_collection(self, context: Context, collection: str = None, tenant: str = None, database: str = None, create: bool = False) -> "VectorDBInterface":
+        # instance for another collection, None if not available - only writes create a missing collection
+        if collection in [None, self.collection] and tenant is None and database is None:
+            return self
+        context.set_error("collection routing is not supported by the vectordb")
+        return None
     
     def get_embedding_name(self) -> str:
         return self.parameters.get("embedding", "default")
\ No newline at end of file
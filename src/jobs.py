@@ -0,0 +1,416 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from ingest import BulkIngestor, iter_collection_records
+from utils import Context
+
+
+STATE_QUEUED      = "queued"
+STATE_RUNNING     = "running"
+STATE_COMPLETED   = "completed"
+STATE_FAILED      = "failed"
+STATE_CANCELLED   = "cancelled"
+STATE_INTERRUPTED = "interrupted"
+
+FINISHED_STATES  = [STATE_COMPLETED, STATE_FAILED, STATE_CANCELLED, STATE_INTERRUPTED]
+RESUMABLE_STATES = [STATE_FAILED, STATE_CANCELLED, STATE_INTERRUPTED]
+
+SOURCE_UPLOAD    = "upload"
+SOURCE_FILE      = "file"
+SOURCE_MIGRATION = "migration"
+
+COUNTERS = ["received", "learned", "collapsed", "failed", "inserted", "updated", "skipped"]
+
+
+class IngestJob:
+    """one background load of a records file or of the records of a collection
+
+    ``checkpoint`` is the number of leading records that are finished. A
+    resumed job continues there, the counts of all runs are added up. Only a
+    job interrupted by a shutdown may count records after its checkpoint twice.
+    A migration has no file, its ``parameters`` name the source and target.
+    """
+
+    def __init__(self, id: str, path: str, source: str = SOURCE_UPLOAD, batch_size: int = None, upsert_size: int = None, parameters: dict = None) -> None:
+        self.id: str = id
+        self.path: str = path
+        self.source: str = source
+        self.parameters: dict = parameters if parameters else {}
+        self.batch_size: int = batch_size
+        self.upsert_size: int = upsert_size
+        self.state: str = STATE_QUEUED
+        self.reason: str = None
+        self.created: float = time.time()
+        self.started: float = None
+        self.finished: float = None
+        self.checkpoint: int = 0
+        self.runs: int = 0
+        self.run_seconds: float = 0.0
+        self.bytes_read: int = 0
+        self.bytes_total: int = 0
+        self.records_total: int = 0
+        self.counts: dict = dict.fromkeys(COUNTERS, 0)
+        self.errors: list = []
+        self.ingestor: BulkIngestor = None
+        self.task: asyncio.Task = None
+        self._run_started: float = None
+
+    def get_counts(self) -> dict:
+        result = dict(self.counts)
+        if self.ingestor:
+            for name in COUNTERS:
+                result[name] += getattr(self.ingestor, name)
+        return result
+
+    def get_status(self, errors: bool = True) -> dict:
+        counts = self.get_counts()
+        seconds = self.run_seconds + (time.monotonic() - self._run_started if self._run_started else 0.0)
+        checkpoint = self.ingestor.get_committed() if self.ingestor else self.checkpoint
+        if self.source == SOURCE_MIGRATION:
+            progress = min(1.0, checkpoint / self.records_total) if self.records_total else 0.0
+        else:
+            progress = min(1.0, self.bytes_read / self.bytes_total) if self.bytes_total else 0.0
+        result = {
+            "id": self.id,
+            "state": self.state,
+            "source": self.source,
+            "reason": self.reason,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "runs": self.runs,
+            "checkpoint": checkpoint,
+            "bytes_read": self.bytes_read,
+            "bytes_total": self.bytes_total,
+            "progress": progress,
+            "seconds": seconds,
+            "throughput": counts["learned"] / seconds if seconds > 0 else 0.0,
+            **counts
+        }
+        if self.source == SOURCE_FILE:
+            result["path"] = self.path
+        if self.source == SOURCE_MIGRATION:
+            result["records_total"] = self.records_total
+            result.update(self.parameters)
+        if errors:
+            job_errors = self.errors + (self.ingestor.errors if self.ingestor else [])
+            result["errors"] = job_errors
+            result["errors_truncated"] = counts["failed"] > len(job_errors)
+        return result
+
+    def start_run(self, ingestor: BulkIngestor):
+        self.state = STATE_RUNNING
+        self.reason = None
+        self.started = self.started if self.started else time.time()
+        self.finished = None
+        self.runs += 1
+        self.bytes_read = 0
+        self.ingestor = ingestor
+        self._run_started = time.monotonic()
+
+    def end_run(self, state: str, max_errors: int):
+        # fold the counters of the run into the job
+        ingestor = self.ingestor
+        self.counts = self.get_counts()
+        self.errors = (self.errors + ingestor.errors)[:max_errors]
+        self.checkpoint = ingestor.get_committed()
+        self.run_seconds += time.monotonic() - self._run_started
+        self.ingestor = None
+        self._run_started = None
+        self.state = state
+        self.finished = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "path": self.path, "source": self.source, "batch_size": self.batch_size, "upsert_size": self.upsert_size, "parameters": self.parameters,
+            "state": self.state, "reason": self.reason, "created": self.created, "started": self.started, "finished": self.finished,
+            "checkpoint": self.get_status(errors=False)["checkpoint"], "runs": self.runs, "run_seconds": self.run_seconds,
+            "bytes_total": self.bytes_total, "records_total": self.records_total, "counts": self.get_counts(), "errors": self.errors
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "IngestJob":
+        job = IngestJob(id=data["id"], path=data["path"], source=data.get("source", SOURCE_UPLOAD), batch_size=data.get("batch_size"), upsert_size=data.get("upsert_size"), parameters=data.get("parameters"))
+        for name in ["state", "reason", "created", "started", "finished", "checkpoint", "runs", "run_seconds", "bytes_total", "records_total", "errors"]:
+            setattr(job, name, data.get(name, getattr(job, name)))
+        job.counts.update(data.get("counts", {}))
+        return job
+
+
+class JobManager:
+    """bounded queue of ingestion jobs run by background workers
+
+    Uploads are spooled to ``directory`` before the job is queued, so waiting
+    jobs hold no memory and a full queue rejects new jobs. ``workers`` jobs
+    run at the same time, each through a ``BulkIngestor`` of the handler.
+    Migrations page through a source collection instead of reading a file.
+    Job states are saved as json next to the spooled records. Jobs that were
+    queued or running when the process stopped come back as interrupted and
+    can be resumed from their checkpoint.
+    """
+
+    DEFAULT_DIRECTORY     = "jobs"
+    DEFAULT_WORKERS       = 1
+    DEFAULT_MAX_QUEUE     = 16
+    DEFAULT_MAX_UPLOAD_MB = 1024
+    DEFAULT_PAGE_SIZE     = 256
+    MAX_FINISHED_JOBS     = 1000
+    READ_SIZE             = 64 * 1024
+    SAVE_INTERVAL         = 1.0
+
+    def __init__(self, handler, directory: str = DEFAULT_DIRECTORY, workers: int = DEFAULT_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE, max_upload_bytes: int = DEFAULT_MAX_UPLOAD_MB * 1024 * 1024, file_root: str = None) -> None:
+        self.handler = handler
+        self.directory: str = directory
+        self.workers: int = max(1, workers)
+        self.max_queue: int = max(1, max_queue)
+        self.max_upload_bytes: int = max_upload_bytes
+        self.file_root: str = os.path.realpath(file_root) if file_root else None
+        self._jobs: dict[str, IngestJob] = {}
+        self._queue: asyncio.Queue = None
+        self._tasks: list = []
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    job = IngestJob.from_dict(json.load(file))
+            except Exception as exc:
+                print(f"Skipping unreadable job file {name}: {exc}")
+                continue
+            if job.state not in FINISHED_STATES:
+                job.state = STATE_INTERRUPTED
+                self._save(job)
+            self._jobs[job.id] = job
+
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.get_running_loop().create_task(self._work()) for _ in range(self.workers)]
+        print(f"Ingestion jobs started with {self.workers} workers - {len(self._jobs)} jobs in {self.directory}")
+
+    async def stop(self):
+        # running jobs are interrupted and keep their checkpoint
+        for job in self._jobs.values():
+            if job.task:
+                job.task.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def is_full(self) -> bool:
+        return self._queue is None or self._queue.full()
+
+    def get(self, id: str) -> IngestJob:
+        return self._jobs.get(id)
+
+    def get_jobs(self) -> list:
+        return [job.get_status(errors=False) for job in sorted(self._jobs.values(), key=lambda job: job.created)]
+
+    async def submit_upload(self, context: Context, chunks, batch_size: int = None, upsert_size: int = None) -> IngestJob:
+        """spools a request body of records to a file and queues a job for it"""
+        if self.is_full():
+            context.set_error("ingestion queue is full - retry later", status_code=429)
+            return None
+
+        id = uuid.uuid4().hex
+        path = os.path.join(self.directory, f"{id}.records")
+        size = 0
+        loop = asyncio.get_running_loop()
+        with open(path, "wb") as file:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > self.max_upload_bytes:
+                    break
+                await loop.run_in_executor(None, file.write, chunk)
+        if size > self.max_upload_bytes:
+            os.remove(path)
+            context.set_error(f"upload exceeds {self.max_upload_bytes} bytes", status_code=413)
+            return None
+
+        job = IngestJob(id=id, path=path, source=SOURCE_UPLOAD, batch_size=batch_size, upsert_size=upsert_size)
+        if not self._enqueue(context, job):
+            os.remove(path)
+            return None
+        return job
+
+    def submit_file(self, context: Context, path: str, batch_size: int = None, upsert_size: int = None) -> IngestJob:
+        """queues a job for a records file on the server below ``file_root``"""
+        if not self.file_root:
+            context.set_error("file references are disabled - set JOBS_FILE_ROOT", status_code=403)
+            return None
+        real_path = os.path.realpath(os.path.join(self.file_root, path))
+        if os.path.commonpath([self.file_root, real_path]) != self.file_root:
+            context.set_error(f"file {path} is outside of the jobs file root", status_code=403)
+            return None
+        if not os.path.isfile(real_path):
+            context.set_error(f"file {path} not found", status_code=404)
+            return None
+
+        job = IngestJob(id=uuid.uuid4().hex, path=real_path, source=SOURCE_FILE, batch_size=batch_size, upsert_size=upsert_size)
+        if not self._enqueue(context, job):
+            return None
+        return job
+
+    def submit_migration(self, context: Context, parameters: dict, batch_size: int = None, upsert_size: int = None) -> IngestJob:
+        """queues the re-embedding of a collection into a target collection
+
+        :param parameters: source, target, tenant, database, model and page_size of the migration
+        :type parameters: dict
+        """
+        job = IngestJob(id=uuid.uuid4().hex, path=None, source=SOURCE_MIGRATION, batch_size=batch_size, upsert_size=upsert_size, parameters=parameters)
+        if not self._enqueue(context, job):
+            return None
+        return job
+
+    def cancel(self, context: Context, id: str) -> IngestJob:
+        job = self._get_job(context, id)
+        if not job:
+            return None
+        if job.state in FINISHED_STATES:
+            context.set_error(f"job {id} is already {job.state}", status_code=409)
+            return None
+        if job.ingestor:
+            # the records read so far are still written, the checkpoint stays exact
+            job.ingestor.stop()
+        else:
+            # still queued, the worker drops it
+            job.state = STATE_CANCELLED
+            job.finished = time.time()
+            self._save(job)
+        return job
+
+    def resume(self, context: Context, id: str) -> IngestJob:
+        job = self._get_job(context, id)
+        if not job:
+            return None
+        if job.state not in RESUMABLE_STATES:
+            context.set_error(f"job {id} is {job.state} and can not be resumed", status_code=409)
+            return None
+        if job.path and not os.path.isfile(job.path):
+            context.set_error(f"records of job {id} are gone", status_code=410)
+            return None
+        if not self._enqueue(context, job):
+            return None
+        return job
+
+    def _get_job(self, context: Context, id: str) -> IngestJob:
+        job = self._jobs.get(id)
+        if not job:
+            context.set_error(f"job {id} not found", status_code=404)
+        return job
+
+    def _enqueue(self, context: Context, job: IngestJob) -> bool:
+        if self.is_full():
+            context.set_error("ingestion queue is full - retry later", status_code=429)
+            return False
+        job.state = STATE_QUEUED
+        job.reason = None
+        job.bytes_total = os.path.getsize(job.path) if job.path else 0
+        self._queue.put_nowait(job.id)
+        self._jobs[job.id] = job
+        self._save(job)
+        self._prune()
+        return True
+
+    async def _work(self):
+        while True:
+            job = self._jobs.get(await self._queue.get())
+            if not job or job.state != STATE_QUEUED:
+                continue
+            job.task = asyncio.get_running_loop().create_task(self._run(job))
+            try:
+                await asyncio.shield(job.task)
+            except asyncio.CancelledError:
+                # the worker is stopped, the job task handles its own cancel
+                if not job.task.done():
+                    job.task.cancel()
+                    await asyncio.gather(job.task, return_exceptions=True)
+                raise
+            finally:
+                job.task = None
+
+    async def _run(self, job: IngestJob):
+        ingestor = BulkIngestor(
+            handler=self.handler,
+            batch_size=job.batch_size if job.batch_size else self.handler.ingest_batch_size,
+            upsert_size=job.upsert_size if job.upsert_size else self.handler.ingest_upsert_size,
+            max_errors=self.handler.ingest_max_errors
+        )
+        job.start_run(ingestor)
+        self._save(job)
+        state = STATE_COMPLETED
+        try:
+            if job.source == SOURCE_MIGRATION:
+                await ingestor.run_records(await self._read_collection(job, ingestor), skip=job.checkpoint)
+            else:
+                await ingestor.run(self._read(job), skip=job.checkpoint)
+            if ingestor.stopped:
+                state = STATE_CANCELLED
+        except asyncio.CancelledError:
+            state = STATE_INTERRUPTED
+        except Exception as exc:
+            state = STATE_FAILED
+            job.reason = f"{exc}"
+        job.end_run(state, self.handler.ingest_max_errors)
+        self._save(job)
+        print(f"Ingestion job {job.id} {state} - {job.counts['learned']} learned, {job.counts['failed']} failed, {job.counts['skipped']} skipped")
+        if state == STATE_COMPLETED and job.source == SOURCE_UPLOAD:
+            os.remove(job.path)
+
+    async def _read(self, job: IngestJob):
+        loop = asyncio.get_running_loop()
+        saved = time.monotonic()
+        with open(job.path, "rb") as file:
+            while True:
+                chunk = await loop.run_in_executor(None, file.read, self.READ_SIZE)
+                if not chunk:
+                    break
+                job.bytes_read += len(chunk)
+                # a crash loses at most the progress since the last save
+                if time.monotonic() - saved > self.SAVE_INTERVAL:
+                    self._save(job)
+                    saved = time.monotonic()
+                yield chunk
+
+    async def _read_collection(self, job: IngestJob, ingestor: BulkIngestor):
+        # collections are opened for every run, the pool may have dropped them in between
+        parameters = job.parameters
+        context = Context()
+        source = await self.handler.get_vectordb(context, collection=parameters.get("source"), tenant=parameters.get("tenant"), database=parameters.get("database"))
+        target = await self.handler.get_vectordb(context, collection=parameters.get("target"), tenant=parameters.get("tenant"), database=parameters.get("database"), create=True) if source else None
+        if not target:
+            raise RuntimeError(context.reason if context.reason else "collection not available")
+        ingestor.vdb = target
+        ingestor.model = parameters.get("model")
+        job.records_total = await source.count(context) or 0
+        return self._saving(job, iter_collection_records(source, page_size=parameters.get("page_size") or self.DEFAULT_PAGE_SIZE, offset=job.checkpoint))
+
+    async def _saving(self, job: IngestJob, records):
+        # a crash loses at most the progress since the last save
+        saved = time.monotonic()
+        async for item in records:
+            if time.monotonic() - saved > self.SAVE_INTERVAL:
+                self._save(job)
+                saved = time.monotonic()
+            yield item
+
+    def _save(self, job: IngestJob):
+        path = os.path.join(self.directory, f"{job.id}.json")
+        try:
+            with open(f"{path}.tmp", "w") as file:
+                json.dump(job.to_dict(), file)
+            os.replace(f"{path}.tmp", path)
+        except Exception as exc:
+            print(f"Saving ingestion job {job.id} failed: {exc}")
+
+    def _prune(self):
+        finished = sorted([job for job in self._jobs.values() if job.state in FINISHED_STATES and not job.task], key=lambda job: job.finished or job.created)
+        for job in finished[:max(0, len(finished) - self.MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+            for path in [os.path.join(self.directory, f"{job.id}.json"), job.path if job.source == SOURCE_UPLOAD else None]:
+                if path and os.path.exists(path):
+                    os.remove(path)
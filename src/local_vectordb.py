@@ -0,0 +1,624 @@
+from interfaces import VectorDBInterface, DEFAULT_TENANT, DEFAULT_DATABASE
+from utils import Context
+from collection_pool import CollectionPool, CollectionNotFound
+import metrics
+import asyncio
+import itertools
+import json
+import os
+import re
+import threading
+import weakref
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+SPACE_L2     = "l2"
+SPACE_COSINE = "cosine"
+SPACE_IP     = "ip"
+VALID_SPACES = [SPACE_L2, SPACE_COSINE, SPACE_IP]
+
+# names become directories, like chroma no path separators and no ..
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]|\.(?!\.))*$")
+
+INDEX_AUTO    = "auto"
+INDEX_HNSW    = "hnsw"
+INDEX_NONE    = "none"
+VALID_INDEXES = [INDEX_AUTO, INDEX_HNSW, INDEX_NONE]
+
+_COMPARISONS = {
+    "$eq":  lambda value, operand: value == operand,
+    "$ne":  lambda value, operand: value != operand,
+    "$gt":  lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt":  lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+    "$in":  lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def match_where(metadata: dict, where: dict) -> bool:
+    """evaluates a chroma style where filter against the metadata of a record
+
+    Supports ``$and``, ``$or`` and the operators ``$eq``, ``$ne``, ``$gt``,
+    ``$gte``, ``$lt``, ``$lte``, ``$in`` and ``$nin``. A plain value compares
+    for equality and several keys in one dict must all match. Records without
+    the key never match a condition on it.
+    """
+    metadata = metadata if metadata else {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, item) for item in condition):
+                return False
+        elif key == "$or":
+            if not any(match_where(metadata, item) for item in condition):
+                return False
+        else:
+            if key not in metadata:
+                return False
+            operators = condition if isinstance(condition, dict) else {"$eq": condition}
+            for operator, operand in operators.items():
+                compare = _COMPARISONS.get(operator)
+                if compare is None:
+                    raise ValueError(f"unsupported where operator {operator}")
+                try:
+                    if not compare(metadata[key], operand):
+                        return False
+                except TypeError:
+                    return False
+    return True
+
+
+class LocalVectorDB(VectorDBInterface):
+    """in process vector store for edge and single node deployments
+
+    Vectors are appended as float32 rows to a file that is memory mapped for
+    search, documents, uris and metadata go to an append only log with one
+    json line per write. Replaced and deleted records leave dead rows behind
+    until the collection is compacted into a new generation of files.
+
+    Rows are synced before the log line that references them and a write is
+    a single line, so after a crash a torn line and unreferenced rows are
+    dropped on the next start. Compaction switches generations by atomically
+    replacing ``collection.json``.
+
+    Queries run vectorized brute force over the mapped rows. With hnswlib
+    installed an HNSW index is built once the collection reaches
+    ``index_threshold`` records and serves queries without a where filter,
+    filtered queries scan the matching rows only.
+
+    Other collections are opened on demand, a tenant and a database other
+    than the defaults become sub directories of ``path``.
+
+    parameters: path, embedding, space (l2, cosine, ip), sync, index (auto,
+    hnsw, none), index_threshold, compact_ratio, tenant, database,
+    max_collections
+    """
+
+    DEFAULT_PATH            = "vectordb"
+    DEFAULT_INDEX_THRESHOLD = 20000
+    DEFAULT_COMPACT_RATIO   = 0.5
+    COMPACT_MIN_ROWS        = 1024
+    BLOCK_ROWS              = 65536
+    HNSW_M                  = 16
+    HNSW_EF_CONSTRUCTION    = 200
+    HNSW_EF_SEARCH          = 64
+
+    # one instance per directory, two would append to the same files
+    _instances = weakref.WeakValueDictionary()
+
+    def __init__(self, host: str = None, port: int = None, url: str = None, collection: str = "default", parameters: dict = {}) -> None:
+        super().__init__(host, port, url, collection if collection else "default", parameters)
+        self.path: str = self.parameters.get("path", self.DEFAULT_PATH)
+        self.tenant: str = self.parameters.get("tenant")
+        self.database: str = self.parameters.get("database")
+        self.directory: str = self.get_directory(self.path, self.tenant, self.database, self.collection)
+        self.space: str = self.parameters.get("space", SPACE_L2)
+        self.sync: bool = bool(self.parameters.get("sync", True))
+        self.index_type: str = self.parameters.get("index", INDEX_AUTO)
+        self.index_threshold: int = int(self.parameters.get("index_threshold", self.DEFAULT_INDEX_THRESHOLD))
+        self.compact_ratio: float = float(self.parameters.get("compact_ratio", self.DEFAULT_COMPACT_RATIO))
+        self.dimension: int = None
+        self.generation: int = 0
+        self._records: dict = {}
+        self._row_ids: dict = {}
+        self._rows: int = 0
+        self._vectors: np.ndarray = None
+        self._norms: np.ndarray = np.zeros(0, dtype=np.float32)
+        self._live: np.ndarray = np.zeros(0, dtype=bool)
+        self._vector_file = None
+        self._log_file = None
+        self._index = None
+        self._lock = threading.RLock()
+        self._collections: CollectionPool = CollectionPool(int(self.parameters.get("max_collections", CollectionPool.DEFAULT_MAX_COLLECTIONS)))
+
+    async def is_valid(self) -> bool:
+        try:
+            if self.space not in VALID_SPACES:
+                print(f"invalid space {self.space} - valid values: {VALID_SPACES}")
+                return False
+            if self.index_type not in VALID_INDEXES:
+                print(f"invalid index {self.index_type} - valid values: {VALID_INDEXES}")
+                return False
+            if self.index_type == INDEX_HNSW and hnswlib is None:
+                print("hnsw index requires the hnswlib package")
+                return False
+
+            await asyncio.get_running_loop().run_in_executor(None, self._open)
+            self._instances[self.directory] = self
+            print(f"Opened local vectordb {self.directory} - {len(self._records)} records, space {self.space}, embbedding {self.get_embedding_name()}")
+            return True
+        except Exception as exc:
+            print(f"Error while opening local vectordb {self.directory}: {exc}")
+            return False
+
+    def get_embedding_name(self) -> str:
+        return self.parameters.get("embedding", None)
+
+    @staticmethod
+    def get_directory(path: str, tenant: str, database: str, collection: str) -> str:
+        parts = [part for part in [tenant, database] if part and part not in [DEFAULT_TENANT, DEFAULT_DATABASE]]
+        return os.path.join(path, *parts, collection)
+
+    def get_collection_key(self) -> str:
+        return self.directory
+
+    async def get_collection(self, context: Context, collection: str = None, tenant: str = None, database: str = None, create: bool = False) -> VectorDBInterface:
+        tenant = tenant if tenant else self.tenant
+        database = database if database else self.database
+        collection = collection if collection else self.collection
+        for name in [tenant, database, collection]:
+            if name and not NAME_PATTERN.match(name):
+                context.set_error(f"invalid collection, tenant or database name {name}")
+                return None
+        directory = self.get_directory(self.path, tenant, database, collection)
+        if directory == self.directory:
+            return self
+        for attempt in range(2):
+            try:
+                return await self._collections.get(directory, lambda: self._open_collection(tenant, database, collection, create))
+            except CollectionNotFound:
+                # a read may have started the shared open call of a write
+                if not create or attempt:
+                    context.set_error(f"collection {directory} not found", status_code=404)
+                    return None
+            except Exception as exc:
+                context.set_error(f"Opening collection {directory} failed - {exc}")
+                return None
+
+    async def _open_collection(self, tenant: str, database: str, collection: str, create: bool = False) -> "LocalVectorDB":
+        directory = self.get_directory(self.path, tenant, database, collection)
+        instance = self._instances.get(directory)
+        if instance is None:
+            if not create and not os.path.isdir(directory):
+                raise CollectionNotFound(directory)
+            instance = LocalVectorDB(collection=collection, parameters=dict(self.parameters, tenant=tenant, database=database))
+            with metrics.VECTORDB_SECONDS.time(operation="open"):
+                await asyncio.get_running_loop().run_in_executor(None, instance._open)
+            self._instances[directory] = instance
+        return instance
+
+    async def count(self, context: Context) -> bool:
+        return len(self._records)
+
+    async def learn_document(self, context: Context, id: str, document: str = None, embedding: list = None, uri: str = None, metadata: dict = {}) -> bool:
+        embeddings = None
+        if embedding is not None and len(embedding) > 0:
+            embeddings = [embedding]
+        return await self.learn_documents(context=context, ids=[id], documents=[document], embeddings=embeddings, uris=[uri], metadatas=[metadata if metadata else None])
+
+    async def learn_documents(self, context: Context, ids: list, documents: list = None, embeddings: list = None, uris: list = None, metadatas: list = None) -> bool:
+        return await self._run(context, "upsert_batch", "Learning documents failed", False, self._upsert, ids, documents, embeddings, uris, metadatas)
+
+    async def get_metadatas(self, context: Context, ids: list) -> dict:
+        return await self._run(context, "get", "Reading documents failed", None, self._get_metadatas, ids)
+
+    async def get_documents(self, context: Context, offset: int = 0, limit: int = 100) -> list:
+        return await self._run(context, "get_page", "Reading documents failed", None, self._get_documents, offset, limit)
+
+    async def delete_documents(self, context: Context, ids: list = None, metadata: dict = None) -> bool:
+        return await self._run(context, "delete", "Deleting documents failed", False, self._delete, ids, metadata)
+
+    async def query_document(self, context: Context, max_records: int = 5, embedding: list = None, metadata: dict = None) -> bool:
+        result = await self.query_documents(context=context, max_records=max_records, embeddings=[embedding], metadata=metadata)
+        if result is False:
+            return False
+        return result[0]
+
+    async def query_documents(self, context: Context, max_records: int = 5, embeddings: list = None, metadata: dict = None) -> bool:
+        return await self._run(context, "query", "Querying documents failed", False, self._query, embeddings, max_records, metadata)
+
+    async def _run(self, context: Context, operation: str, message: str, failed, func, *args):
+        try:
+            with context.timing("vectordb"), metrics.VECTORDB_SECONDS.time(operation=operation):
+                return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+        except Exception as exc:
+            metrics.VECTORDB_ERRORS.inc(operation=operation)
+            context.set_error(f"{message} - {exc}")
+            return failed
+
+    # files
+
+    def _config_path(self) -> str:
+        return os.path.join(self.directory, "collection.json")
+
+    def _vector_path(self, generation: int = None) -> str:
+        return os.path.join(self.directory, f"vectors-{self.generation if generation is None else generation}.f32")
+
+    def _log_path(self, generation: int = None) -> str:
+        return os.path.join(self.directory, f"records-{self.generation if generation is None else generation}.jsonl")
+
+    def _write_config(self):
+        # write and rename, a crash leaves either the old or the new file
+        path = self._config_path()
+        with open(f"{path}.tmp", "w") as file:
+            json.dump({"dimension": self.dimension, "space": self.space, "generation": self.generation}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{path}.tmp", path)
+        self._sync_directory()
+
+    def _sync_directory(self):
+        descriptor = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def _write(self, file, data: bytes):
+        file.write(data)
+        file.flush()
+        if self.sync:
+            os.fsync(file.fileno())
+
+    def _open(self):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if os.path.exists(self._config_path()):
+                with open(self._config_path()) as file:
+                    config = json.load(file)
+                if config.get("space", SPACE_L2) != self.space:
+                    raise ValueError(f"collection was created with space {config.get('space')}")
+                self.dimension = config.get("dimension")
+                self.generation = config.get("generation", 0)
+            self._close_files()
+            self._remove_other_generations()
+            self._load()
+            self._vector_file = open(self._vector_path(), "ab")
+            self._log_file = open(self._log_path(), "ab")
+
+    def _close_files(self):
+        for file in [self._vector_file, self._log_file]:
+            if file:
+                file.close()
+        self._vector_file = None
+        self._log_file = None
+
+    def _remove_other_generations(self):
+        # leftovers of an interrupted compaction
+        current = [os.path.basename(self._vector_path()), os.path.basename(self._log_path())]
+        for name in os.listdir(self.directory):
+            if (name.startswith("vectors-") or name.startswith("records-") or name.endswith(".tmp")) and name not in current:
+                os.remove(os.path.join(self.directory, name))
+
+    def _load(self):
+        row_size = self.dimension * 4 if self.dimension else 0
+        vector_path = self._vector_path()
+        rows = os.path.getsize(vector_path) // row_size if row_size and os.path.exists(vector_path) else 0
+
+        records = {}
+        used_rows = 0
+        valid_size = 0
+        lines = []
+        if os.path.exists(self._log_path()):
+            with open(self._log_path(), "rb") as file:
+                lines = file.read().splitlines(keepends=True)
+        size = sum(len(line) for line in lines)
+        for line in lines:
+            try:
+                entry = json.loads(line) if line.endswith(b"\n") else None
+            except ValueError:
+                entry = None
+            # a torn line or rows missing on disk end the log
+            if entry is None or any(record["row"] >= rows for record in entry.get("records", [])):
+                break
+            if entry.get("op") == "upsert":
+                for record in entry["records"]:
+                    records[record["id"]] = (record["row"], record.get("document"), record.get("uri"), record.get("metadata"))
+                    used_rows = max(used_rows, record["row"] + 1)
+            elif entry.get("op") == "delete":
+                for id in entry["ids"]:
+                    records.pop(id, None)
+            valid_size += len(line)
+
+        if valid_size < size:
+            print(f"Dropping {size - valid_size} bytes of an incomplete write from {self._log_path()}")
+            with open(self._log_path(), "r+b") as file:
+                file.truncate(valid_size)
+        if used_rows < rows:
+            with open(vector_path, "r+b") as file:
+                file.truncate(used_rows * row_size)
+
+        self._records = records
+        self._row_ids = {record[0]: id for id, record in records.items()}
+        self._rows = used_rows
+        self._remap()
+        self._norms = np.zeros(self._rows, dtype=np.float32)
+        for start in range(0, self._rows, self.BLOCK_ROWS):
+            block = self._vectors[start:start + self.BLOCK_ROWS]
+            self._norms[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+        self._live = np.zeros(self._rows, dtype=bool)
+        for row, _, _, _ in records.values():
+            self._live[row] = True
+        self._index = None
+
+    def _remap(self):
+        if self._rows and self.dimension:
+            self._vectors = np.memmap(self._vector_path(), dtype=np.float32, mode="r", shape=(self._rows, self.dimension))
+        else:
+            self._vectors = np.zeros((0, self.dimension if self.dimension else 0), dtype=np.float32)
+
+    # writes
+
+    def _upsert(self, ids: list, documents: list = None, embeddings: list = None, uris: list = None, metadatas: list = None) -> bool:
+        count = len(ids)
+        documents = documents if documents else [None] * count
+        uris = uris if uris else [None] * count
+        metadatas = metadatas if metadatas else [None] * count
+        if embeddings is None:
+            embeddings = [None] * count
+        if not (len(documents) == len(uris) == len(metadatas) == len(embeddings) == count):
+            raise ValueError("ids, documents, embeddings, uris and metadatas differ in length")
+
+        with self._lock:
+            vectors = [np.asarray(embedding, dtype=np.float32).reshape(-1) for embedding in embeddings if embedding is not None and len(embedding) > 0]
+            matrix = np.stack(vectors) if vectors else None
+            if matrix is not None:
+                if self.dimension is None:
+                    self.dimension = matrix.shape[1]
+                    self._write_config()
+                elif matrix.shape[1] != self.dimension:
+                    raise ValueError(f"embedding dimension {matrix.shape[1]} does not match collection dimension {self.dimension}")
+
+            records = []
+            row = self._rows
+            for id, document, embedding, uri, metadata in zip(ids, documents, embeddings, uris, metadatas):
+                old = self._records.get(id)
+                if embedding is not None and len(embedding) > 0:
+                    target = row
+                    row += 1
+                elif old:
+                    target = old[0]
+                else:
+                    raise ValueError(f"embedding required for new document {id}")
+                # like chroma, missing fields keep the stored values
+                if old:
+                    document = document if document is not None else old[1]
+                    uri = uri if uri is not None else old[2]
+                    metadata = metadata if metadata is not None else old[3]
+                records.append({"id": id, "row": target, "document": document, "uri": uri, "metadata": metadata})
+
+            if matrix is not None:
+                self._append_rows(matrix)
+            self._write(self._log_file, (json.dumps({"op": "upsert", "records": records}, ensure_ascii=False) + "\n").encode("utf-8"))
+
+            for record in records:
+                old = self._records.get(record["id"])
+                if old and old[0] != record["row"]:
+                    self._kill_row(old[0])
+                self._records[record["id"]] = (record["row"], record["document"], record["uri"], record["metadata"])
+                self._row_ids[record["row"]] = record["id"]
+                self._live[record["row"]] = True
+            self._update_index(self._rows - (len(matrix) if matrix is not None else 0))
+            self._check_compaction()
+            return True
+
+    def _append_rows(self, matrix: np.ndarray):
+        offset = self._rows * self.dimension * 4
+        try:
+            self._write(self._vector_file, np.ascontiguousarray(matrix, dtype="<f4").tobytes())
+        except Exception:
+            # no partial rows, the next append must start at a row boundary
+            self._vector_file.truncate(offset)
+            raise
+        first_row = self._rows
+        self._reserve(first_row + len(matrix))
+        self._norms[first_row:first_row + len(matrix)] = np.einsum("ij,ij->i", matrix, matrix)
+        self._live[first_row:first_row + len(matrix)] = False
+        self._rows += len(matrix)
+        self._remap()
+
+    def _reserve(self, rows: int):
+        # norms and live flags are capacity arrays, only the first _rows entries are used
+        if rows <= len(self._norms):
+            return
+        capacity = max(rows, 2 * len(self._norms), 1024)
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[:self._rows] = self._norms[:self._rows]
+        live = np.zeros(capacity, dtype=bool)
+        live[:self._rows] = self._live[:self._rows]
+        self._norms = norms
+        self._live = live
+
+    def _kill_row(self, row: int):
+        self._live[row] = False
+        self._row_ids.pop(row, None)
+        if self._index is not None:
+            try:
+                self._index.mark_deleted(row)
+            except RuntimeError:
+                pass
+
+    def _delete(self, ids: list = None, where: dict = None) -> bool:
+        with self._lock:
+            candidates = ids if ids is not None else list(self._records.keys())
+            targets = [id for id in candidates if id in self._records and (not where or match_where(self._records[id][3], where))]
+            if not targets:
+                return True
+            self._write(self._log_file, (json.dumps({"op": "delete", "ids": targets}, ensure_ascii=False) + "\n").encode("utf-8"))
+            for id in targets:
+                row = self._records.pop(id)[0]
+                self._kill_row(row)
+            self._check_compaction()
+            return True
+
+    def _check_compaction(self):
+        dead = self._rows - len(self._records)
+        if self._rows >= self.COMPACT_MIN_ROWS and dead > self._rows * self.compact_ratio:
+            self._compact()
+
+    def _compact(self):
+        """rewrites the live records into the files of the next generation"""
+        generation = self.generation + 1
+        ids = list(self._records.keys())
+        records = []
+        with open(self._vector_path(generation), "wb") as file:
+            for start in range(0, len(ids), self.BLOCK_ROWS):
+                block = ids[start:start + self.BLOCK_ROWS]
+                rows = np.array([self._records[id][0] for id in block], dtype=np.int64)
+                file.write(np.ascontiguousarray(self._vectors[rows], dtype="<f4").tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        for row, id in enumerate(ids):
+            _, document, uri, metadata = self._records[id]
+            records.append({"id": id, "row": row, "document": document, "uri": uri, "metadata": metadata})
+        with open(self._log_path(generation), "wb") as file:
+            file.write((json.dumps({"op": "upsert", "records": records}, ensure_ascii=False) + "\n").encode("utf-8"))
+            file.flush()
+            os.fsync(file.fileno())
+
+        # switch generations, then reload from the new files
+        self.generation = generation
+        self._write_config()
+        self._vectors = None
+        self._open()
+        print(f"Compacted local vectordb {self.directory} to {len(self._records)} records")
+
+    # reads
+
+    def _get_metadatas(self, ids: list) -> dict:
+        with self._lock:
+            return {id: self._records[id][3] for id in ids if id in self._records}
+
+    def _get_documents(self, offset: int, limit: int) -> list:
+        # records keep their insertion order, updates do not move them
+        with self._lock:
+            items = itertools.islice(self._records.items(), max(0, offset), max(0, offset) + max(0, limit))
+            return [{"id": id, "document": document, "uri": uri, "metadata": metadata} for id, (_, document, uri, metadata) in items]
+
+    def _query(self, embeddings: list, max_records: int, where: dict = None) -> list:
+        with self._lock:
+            queries = np.stack([np.asarray(embedding, dtype=np.float32).reshape(-1) for embedding in embeddings])
+            if not self._records or max_records <= 0:
+                return [[] for _ in range(len(queries))]
+            if queries.shape[1] != self.dimension:
+                raise ValueError(f"embedding dimension {queries.shape[1]} does not match collection dimension {self.dimension}")
+
+            found = None
+            if where:
+                rows = np.array([record[0] for record in self._records.values() if match_where(record[3], where)], dtype=np.int64)
+                found = self._search(queries, max_records, rows)
+            elif self._use_index():
+                found = self._search_index(queries, max_records)
+            if found is None:
+                found = self._search(queries, max_records)
+
+            result = []
+            for distances, rows in zip(*found):
+                records = []
+                for distance, row in zip(distances, rows):
+                    id = self._row_ids.get(int(row))
+                    if id is None or not np.isfinite(distance):
+                        continue
+                    _, document, uri, metadata = self._records[id]
+                    record = {"id": id, "document": document, "metadata": metadata, "distance": float(distance)}
+                    if uri:
+                        record["uri"] = uri
+                    records.append(record)
+                result.append(records)
+            return result
+
+    def _distances(self, queries: np.ndarray, vectors: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        products = queries @ vectors.T
+        if self.space == SPACE_IP:
+            return 1.0 - products
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        if self.space == SPACE_COSINE:
+            scale = np.sqrt(query_norms)[:, None] * np.sqrt(norms)[None, :]
+            return 1.0 - products / np.maximum(scale, 1e-12)
+        return np.maximum(query_norms[:, None] + norms[None, :] - 2.0 * products, 0.0)
+
+    def _search(self, queries: np.ndarray, k: int, rows: np.ndarray = None) -> tuple:
+        """brute force top k over all live rows or the given rows, block by block
+
+        :return: distances and rows, each a matrix with one line per query
+        :rtype: tuple
+        """
+        total = self._rows if rows is None else len(rows)
+        best_distances = np.zeros((len(queries), 0), dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, total, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, total)
+            if rows is None:
+                block_rows = np.arange(start, end)
+                distances = self._distances(queries, self._vectors[start:end], self._norms[start:end])
+                distances[:, ~self._live[start:end]] = np.inf
+            else:
+                block_rows = rows[start:end]
+                distances = self._distances(queries, self._vectors[block_rows], self._norms[block_rows])
+
+            best_distances = np.hstack([best_distances, distances])
+            best_rows = np.hstack([best_rows, np.broadcast_to(block_rows, distances.shape)])
+            if best_distances.shape[1] > k:
+                keep = np.argpartition(best_distances, k - 1, axis=1)[:, :k]
+                best_distances = np.take_along_axis(best_distances, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(best_distances, axis=1, kind="stable")
+        return np.take_along_axis(best_distances, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    # hnsw index
+
+    def _use_index(self) -> bool:
+        if hnswlib is None or self.index_type == INDEX_NONE:
+            return False
+        if self._index is None:
+            if self.index_type == INDEX_AUTO and len(self._records) < self.index_threshold:
+                return False
+            self._build_index()
+        return True
+
+    def _build_index(self):
+        index = hnswlib.Index(space=self.space, dim=self.dimension)
+        index.init_index(max_elements=max(1024, self._rows * 2), ef_construction=self.HNSW_EF_CONSTRUCTION, M=self.HNSW_M)
+        live = np.flatnonzero(self._live[:self._rows])
+        for start in range(0, len(live), self.BLOCK_ROWS):
+            rows = live[start:start + self.BLOCK_ROWS]
+            index.add_items(self._vectors[rows], rows)
+        self._index = index
+        print(f"Built hnsw index for local vectordb {self.directory} with {len(live)} records")
+
+    def _update_index(self, first_row: int):
+        if self._index is None or first_row >= self._rows:
+            return
+        if self._rows > self._index.get_max_elements():
+            self._index.resize_index(self._rows * 2)
+        rows = np.arange(first_row, self._rows)
+        rows = rows[self._live[first_row:self._rows]]
+        if len(rows):
+            self._index.add_items(self._vectors[rows], rows)
+
+    def _search_index(self, queries: np.ndarray, k: int) -> tuple:
+        k = min(k, len(self._records))
+        self._index.set_ef(max(self.HNSW_EF_SEARCH, k))
+        try:
+            rows, distances = self._index.knn_query(queries, k=k)
+        except RuntimeError:
+            # too few reachable neighbours, the exact search always answers
+            return None
+        return distances, rows.astype(np.int64)
@@ -1,13 +1,40 @@
 import uvicorn
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from backend import Factory, ServiceHandler
 from pydantic import BaseModel
-from utils import getenv, getenv_as_int
+from utils import getenv, getenv_as_int, start_request_timing, TimedJSONResponse
+from encoding import negotiate_format, encode_embeddings
+from admission import parse_priority, PRIORITY_INTERACTIVE, PRIORITY_BULK
+import metrics
+import time
 
 
 # ======================= FastAPI Configuration
-app = FastAPI()
-Factory.get_service_handler().startup()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await Factory.get_service_handler().startup()
+    yield
+    await Factory.get_service_handler().shutdown()
+
+app = FastAPI(lifespan=lifespan, default_response_class=TimedJSONResponse)
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    started = time.perf_counter()
+    contexts = start_request_timing()
+    response = await call_next(request)
+    seconds = time.perf_counter() - started
+    # use the route template to keep the label cardinality low
+    route = request.scope.get("route")
+    path = route.path if route else "unmatched"
+    metrics.HTTP_SECONDS.observe(seconds, method=request.method, path=path)
+
+    # stage timings of the request context, e.g. queue, embed, vectordb, serialize
+    timings = [contexts[0].get_server_timing()] if contexts and contexts[0].timings else []
+    response.headers["Server-Timing"] = ", ".join(timings + [f"total;dur={seconds * 1000:.3f}"])
+    return response
 
 
 # ======================= FastAPI Methods
@@ -27,12 +54,13 @@ class LoadModelInput(BaseModel):
     name: str = "default"
     id: str = None
     parameters: dict = {}
+    lazy: bool = False
 
 @app.post("/model_load", tags=["model"])
 async def load_model(data: LoadModelInput):
     context = Factory.new_context()
     handler = Factory.get_service_handler()
-    if handler.load_model(context=context, model_type=data.type, model_name=data.name, model_id=data.id, parameters=data.parameters):
+    if await handler.load_model(context=context, model_type=data.type, model_name=data.name, model_id=data.id, parameters=data.parameters, lazy=data.lazy):
         return context.create_success_message()
     else:
         return context.create_error_message()
@@ -69,12 +97,61 @@ async def unload_all_models():
 
 
 # -------------- Embedding
+def get_response_format(context, request: Request, format: str = None) -> str:
+    result = negotiate_format(accept=request.headers.get("accept"), format=format)
+    if not result:
+        context.set_error(f"unsupported response format {format if format else request.headers.get('accept')}", status_code=406)
+    return result
+
+def set_priority(context, request: Request, default: str = PRIORITY_INTERACTIVE) -> bool:
+    """sets the admission class of the request, the X-Priority header overrides the endpoint default"""
+    value = request.headers.get("x-priority")
+    priority = parse_priority(value, default=default)
+    if not priority:
+        context.set_error(f"unsupported priority {value}")
+        return False
+    context.priority = priority
+    return True
+
 @app.post("/embedding", tags=["embedding"])
-async def get_embedding(data: EmbedModelInput):
+async def get_embedding(data: EmbedModelInput, request: Request, format: str = None):
+    """get the embedding of one text
+
+    The vector is returned as json list by default. Binary formats are selected
+    with the Accept header or the format parameter: float32, float16, base64, msgpack.
+    """
     context = Factory.new_context()
     handler = Factory.get_service_handler()
-    if handler.get_embedding(context=context, text=data.text, model_type=data.type, model_name=data.name, model_id=data.id):
-        return context.create_success_message()
+    response_format = get_response_format(context, request, format)
+    if response_format and set_priority(context, request) and await handler.get_embedding(context=context, text=data.text, model_type=data.type, model_name=data.name, model_id=data.id):
+        with context.timing("serialize"):
+            return encode_embeddings(context.payload, format=response_format)
+    else:
+        return context.create_error_message()    
+
+class EmbedBatchModelInput(BaseModel):
+    texts: list[str]
+    id: str = None
+    type: str = "default"
+    name: str = "default"
+
+@app.post("/embeddings_batch", tags=["embedding"])
+async def get_embeddings_batch(data: EmbedBatchModelInput, request: Request, format: str = None):
+    """get embeddings for a list of texts in one call
+
+    :param data: texts and model selection
+    :type data: EmbedBatchModelInput
+    :param format: optional: json, float32, float16, base64 or msgpack - overrides the Accept header
+    :type format: str
+    :return: embedding vectors in the order of the texts, binary formats as row major matrix
+    :rtype: json
+    """
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    response_format = get_response_format(context, request, format)
+    if response_format and set_priority(context, request) and await handler.get_embeddings(context=context, texts=data.texts, model_type=data.type, model_name=data.name, model_id=data.id):
+        with context.timing("serialize"):
+            return encode_embeddings(context.payload, format=response_format)
     else:
         return context.create_error_message()    
 
@@ -83,7 +160,7 @@ class EmbedModelOllamaInput(BaseModel):
     prompt: str
 
 @app.post("/embeddings", tags=["embedding"])
-async def get_embedding_ollama(data: EmbedModelOllamaInput):
+async def get_embedding_ollama(data: EmbedModelOllamaInput, request: Request, format: str = None):
     """get embedding in ollama format
 
     :param data: _description_
@@ -93,20 +170,86 @@ async def get_embedding_ollama(data: EmbedModelOllamaInput):
     """
     context = Factory.new_context()
     handler = Factory.get_service_handler()
-    if handler.get_embedding(context=context, model_type="", model_name="", text=data.prompt, model_id=data.model):
-        payload = context.payload
-        context.set_payload({"embedding": payload})
+    response_format = get_response_format(context, request, format)
+    if response_format and set_priority(context, request) and await handler.get_embedding(context=context, model_type="", model_name="", text=data.prompt, model_id=data.model):
+        with context.timing("serialize"):
+            return encode_embeddings(context.payload, format=response_format, key="embedding")
+    else:
+        return context.create_error_message()    
+
+
+# -------------- Cache
+@app.get("/cache_stats", tags=["cache"])
+async def get_cache_stats():
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    result = handler.get_cache_stats(context)
+    if result is None:
+        return context.create_error_message()
+    else: 
+        return result
+
+@app.post("/cache_clear", tags=["cache"])
+async def clear_cache():
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    if handler.clear_cache(context=context):
         return context.create_success_message()
     else:
         return context.create_error_message()    
 
 
+# -------------- Metrics
+@app.get("/metrics", tags=["metrics"])
+async def get_metrics():
+    return PlainTextResponse(content=metrics.REGISTRY.render(), media_type=metrics.REGISTRY.CONTENT_TYPE)
+
+@app.get("/profile", tags=["metrics"])
+async def get_profile(seconds: float = None, interval_ms: float = None):
+    """sample the stacks of all threads of the live process
+
+    :param seconds: optional: duration of the profile, default 10
+    :param interval_ms: optional: time between two samples, default 5
+    :return: folded stacks, e.g. for flamegraph.pl or speedscope
+    :rtype: text
+    """
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    result = await handler.profile(context, seconds=seconds, interval_ms=interval_ms)
+    if result is None:
+        return context.create_error_message()
+    else:
+        return PlainTextResponse(content=result)
+
+@app.get("/admission_stats", tags=["metrics"])
+async def get_admission_stats():
+    """running, waiting, admitted and rejected embedding calls per priority class"""
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    result = handler.get_admission_stats(context)
+    if result is None:
+        return context.create_error_message()
+    else: 
+        return result
+
+@app.get("/write_buffer_stats", tags=["metrics"])
+async def get_write_buffer_stats():
+    """pending, flushed and failed records of the write buffer, failed non durable learns are only visible here and in the log"""
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    result = handler.get_write_buffer_stats(context)
+    if result is None:
+        return context.create_error_message()
+    else: 
+        return result
+
+
 # -------------- Documents vectordb
 @app.get("/documents_count", tags=["vectordb"])
-async def count_documents():
+async def count_documents(collection: str = None, tenant: str = None, database: str = None):
     context = Factory.new_context()
     handler = Factory.get_service_handler()
-    result = handler.documemts_count(context)
+    result = await handler.documemts_count(context, collection=collection, tenant=tenant, database=database)
     if result is None:
         return context.create_error_message()
     else: 
@@ -119,12 +262,52 @@ class DocumentUpsertInput(BaseModel):
     uri: str = None
     metadata: dict = {}
     embedding: list = None
+    chunk: bool = None
+    chunk_tokens: int = None
+    chunk_overlap: int = None
+    collection: str = None
+    tenant: str = None
+    database: str = None
+    model: str = None
+    durable: bool = None
 
 @app.post("/document_learn", tags=["vectordb"])
-async def learn_document(data: DocumentUpsertInput):
+async def learn_document(data: DocumentUpsertInput, request: Request):
+    """learn a document, its embedding is created with the model of the collection
+
+    With the write buffer and ``durable`` false the document is acknowledged
+    before it is written. Such a write can fail silently, a failed flush is only
+    logged and counted as failed in /write_buffer_stats.
+
+    :return: true, or the inserted, updated and skipped counts with change detection
+    :rtype: json
+    """
     context = Factory.new_context()
     handler = Factory.get_service_handler()
-    result = handler.document_learn(context=context, id=data.id, document=data.document, embedding=data.embedding, uri=data.uri, metatdata=data.metadata)
+    if not set_priority(context, request):
+        return context.create_error_message()
+    result = await handler.document_learn(context=context, id=data.id, document=data.document, embedding=data.embedding, uri=data.uri, metadata=data.metadata, chunk=data.chunk, chunk_tokens=data.chunk_tokens, chunk_overlap=data.chunk_overlap, collection=data.collection, tenant=data.tenant, database=data.database, model=data.model, durable=data.durable)
+    if result is None:
+        return context.create_error_message()
+    else: 
+        return result
+
+@app.post("/documents_learn_bulk", tags=["vectordb"])
+async def learn_documents_bulk(request: Request, batch_size: int = None, upsert_size: int = None):
+    """learn a stream of documents sent as NDJSON lines or as JSON array
+
+    Each record has the fields of /document_learn. Failed records are reported
+    in the result and do not stop the load. Records repeating an id within one
+    upsert chunk collapse to the last one and are counted as collapsed.
+
+    :return: received, learned, collapsed and failed counts and the item errors
+    :rtype: json
+    """
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    if not set_priority(context, request, default=PRIORITY_BULK):
+        return context.create_error_message()
+    result = await handler.documents_learn_stream(context=context, chunks=request.stream(), batch_size=batch_size, upsert_size=upsert_size)
     if result is None:
         return context.create_error_message()
     else: 
@@ -135,12 +318,142 @@ class DocumentQueryInput(BaseModel):
     document: str
     embedding: list = None
     metadata: dict = {}
+    collection: str = None
+    tenant: str = None
+    database: str = None
+    model: str = None
 
 @app.post("/document_query", tags=["vectordb"])
-async def query_document(data: DocumentQueryInput):
+async def query_document(data: DocumentQueryInput, request: Request):
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    if not set_priority(context, request):
+        return context.create_error_message()
+    result = await handler.documents_query(context=context, max_records=data.max_records, document=data.document, embedding=data.embedding, metadata=data.metadata, collection=data.collection, tenant=data.tenant, database=data.database, model=data.model)
+    if result is None:
+        return context.create_error_message()
+    else: 
+        return result
+
+class DocumentQueryBatchInput(BaseModel):
+    max_records: int = 5
+    documents: list[str] = None
+    embeddings: list[list[float]] = None
+    metadata: dict = {}
+    merge: bool = False
+    collection: str = None
+    tenant: str = None
+    database: str = None
+    model: str = None
+
+@app.post("/document_query_batch", tags=["vectordb"])
+async def query_documents_batch(data: DocumentQueryBatchInput, request: Request):
+    """query several documents with one embedding pass and one vectordb call
+
+    :return: list of records per query, or one deduplicated list if merge is set
+    :rtype: json
+    """
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    if not set_priority(context, request):
+        return context.create_error_message()
+    result = await handler.documents_query_batch(context=context, max_records=data.max_records, documents=data.documents, embeddings=data.embeddings, metadata=data.metadata, merge=data.merge, collection=data.collection, tenant=data.tenant, database=data.database, model=data.model)
+    if result is None or result is False:
+        return context.create_error_message()
+    else: 
+        return result
+
+# -------------- Ingestion jobs
+@app.post("/job_ingest", tags=["jobs"])
+async def submit_ingest_job(request: Request, batch_size: int = None, upsert_size: int = None):
+    """queue a background load of NDJSON lines or a JSON array of /document_learn records
+
+    The body is stored and the job id is returned right away. A full queue
+    answers with 429.
+    """
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    result = await handler.job_submit(context=context, chunks=request.stream(), batch_size=batch_size, upsert_size=upsert_size)
+    if result is None:
+        return context.create_error_message()
+    else: 
+        return result
+
+class JobFileInput(BaseModel):
+    path: str
+    batch_size: int = None
+    upsert_size: int = None
+
+@app.post("/job_ingest_file", tags=["jobs"])
+async def submit_ingest_file_job(data: JobFileInput):
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    result = handler.job_submit_file(context=context, path=data.path, batch_size=data.batch_size, upsert_size=data.upsert_size)
+    if result is None:
+        return context.create_error_message()
+    else: 
+        return result
+
+class JobMigrateInput(BaseModel):
+    target: str
+    source: str = None
+    tenant: str = None
+    database: str = None
+    model: str = None
+    page_size: int = None
+    batch_size: int = None
+    upsert_size: int = None
+
+@app.post("/job_migrate", tags=["jobs"])
+async def submit_migrate_job(data: JobMigrateInput):
+    """queue the re-embedding of a whole collection with a model into a target collection
+
+    The source is read page by page, progress and resume work like for other jobs.
+    """
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    result = handler.job_migrate(context=context, target=data.target, source=data.source, tenant=data.tenant, database=data.database, model=data.model, page_size=data.page_size, batch_size=data.batch_size, upsert_size=data.upsert_size)
+    if result is None:
+        return context.create_error_message()
+    else: 
+        return result
+
+@app.get("/jobs", tags=["jobs"])
+async def get_jobs():
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    return handler.get_jobs(context)
+
+@app.get("/job_status", tags=["jobs"])
+async def get_job_status(id: str):
+    """progress, throughput and item errors of a job"""
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    result = handler.get_job(context=context, id=id)
+    if result is None:
+        return context.create_error_message()
+    else: 
+        return result
+
+class JobInput(BaseModel):
+    id: str
+
+@app.post("/job_cancel", tags=["jobs"])
+async def cancel_job(data: JobInput):
+    context = Factory.new_context()
+    handler = Factory.get_service_handler()
+    result = handler.job_cancel(context=context, id=data.id)
+    if result is None:
+        return context.create_error_message()
+    else: 
+        return result
+
+@app.post("/job_resume", tags=["jobs"])
+async def resume_job(data: JobInput):
+    """continues a cancelled, failed or interrupted job from its checkpoint"""
     context = Factory.new_context()
     handler = Factory.get_service_handler()
-    result = handler.documents_query(context=context, max_records=data.max_records, document=data.document, embedding=data.embedding, metadata=data.metadata)
+    result = handler.job_resume(context=context, id=data.id)
     if result is None:
         return context.create_error_message()
     else: 
@@ -0,0 +1,181 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _format_labels(names: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs += list(extra.items())
+    if not pairs:
+        return ""
+    text = ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs)
+    return "{" + text + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    TYPE = "untyped"
+
+    def __init__(self, name: str, description: str, labels: tuple = ()) -> None:
+        self.name: str = name
+        self.description: str = description
+        self.labels: tuple = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.TYPE}"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        # mirrors a counter that is maintained by another component
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    SIZE_BUCKETS    = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+    def __init__(self, name: str, description: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> None:
+        super().__init__(name, description, labels)
+        self.buckets: tuple = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = state
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.TYPE}"]
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels, key, {"le": _format_value(float(bound))})
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """collection of metrics rendered in the prometheus text format
+
+    Collectors are called before rendering to refresh gauges that are read
+    from other components, like queue depths and cache counters.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self) -> None:
+        self._metrics: list = []
+        self._collectors: list = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as exc:
+                print(f"Collecting metrics failed: {exc}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+EMBEDDING_SECONDS  = REGISTRY.register(Histogram("cdbembed_embedding_seconds", "Latency of one embedding inference call", ("model",)))
+EMBEDDED_TEXTS     = REGISTRY.register(Counter("cdbembed_embedded_texts_total", "Number of texts embedded by inference", ("model",)))
+BATCH_SIZE         = REGISTRY.register(Histogram("cdbembed_embedding_batch_size", "Number of texts per inference call", ("model",), buckets=Histogram.SIZE_BUCKETS))
+QUEUE_DEPTH        = REGISTRY.register(Gauge("cdbembed_queue_depth", "Number of requests waiting in a queue", ("queue",)))
+VECTORDB_SECONDS   = REGISTRY.register(Histogram("cdbembed_vectordb_seconds", "Latency of vector database calls", ("operation",)))
+VECTORDB_ERRORS    = REGISTRY.register(Counter("cdbembed_vectordb_errors_total", "Number of failed vector database calls", ("operation",)))
+MODEL_LOAD_SECONDS = REGISTRY.register(Histogram("cdbembed_model_load_seconds", "Duration of model loads", ("model",), buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)))
+MODELS_RESIDENT    = REGISTRY.register(Gauge("cdbembed_model_resident_bytes", "Memory footprint of resident models", ("model",)))
+CACHE_REQUESTS     = REGISTRY.register(Counter("cdbembed_cache_requests_total", "Embedding cache lookups by result", ("tier", "result")))
+CACHE_HIT_RATIO    = REGISTRY.register(Gauge("cdbembed_cache_hit_ratio", "Embedding cache hit ratio", ("tier",)))
+CACHE_BYTES        = REGISTRY.register(Gauge("cdbembed_cache_bytes", "Bytes stored in the embedding cache", ("tier",)))
+ERRORS             = REGISTRY.register(Counter("cdbembed_errors_total", "Number of error responses by status code", ("status_code",)))
+HTTP_SECONDS       = REGISTRY.register(Histogram("cdbembed_http_request_seconds", "Latency of http requests", ("method", "path")))
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram("cdbembed_admission_wait_seconds", "Time an embedding call waited for a slot of its priority class", ("priority",)))
+ADMISSION_REJECTED     = REGISTRY.register(Counter("cdbembed_admission_rejected_total", "Number of embedding calls rejected by admission control", ("priority", "reason")))
+ADMISSION_RUNNING      = REGISTRY.register(Gauge("cdbembed_admission_running", "Number of running embedding calls per priority class", ("priority",)))
+WRITE_BUFFER_RECORDS    = REGISTRY.register(Counter("cdbembed_write_buffer_records_total", "Records of the write behind buffer by result", ("result",)))
+WRITE_BUFFER_FLUSH_SIZE = REGISTRY.register(Histogram("cdbembed_write_buffer_flush_size", "Number of records per write behind flush", buckets=Histogram.SIZE_BUCKETS))
+
+
+def observe_embedding(model_id: str, count: int, seconds: float):
+    EMBEDDING_SECONDS.observe(seconds, model=model_id)
+    EMBEDDED_TEXTS.inc(count, model=model_id)
+    BATCH_SIZE.observe(count, model=model_id)
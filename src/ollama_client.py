@@ -1,50 +1,291 @@
 from interfaces import EmbeddingFunctionInterface
-from utils import Context, getenv
-import requests
-import json
+from executor import InferenceExecutor
+from utils import Context
+import httpx
+import asyncio
+import math
+import random
+import threading
+import time
+import weakref
 
 
 class EmbeddingFunctionOllama(EmbeddingFunctionInterface):
+    """embedding proxy to an ollama server
+
+    Uses pooled keep-alive http clients with timeouts and retries. By default
+    every text is sent to /api/embeddings, which returns raw vectors. The
+    batched /api/embed route returns unit length vectors, so it is only used
+    with ``normalize``, which scales the vectors of both routes to unit length.
+    Servers without /api/embed are detected on the first 404 and served per
+    text. The number of in-flight requests is limited per upstream url, shared
+    by all models on it.
+
+    parameters: url, normalize, timeout, connect_timeout, retries, backoff_ms,
+    max_connections, max_concurrency, batch_size
+    """
 
     DEFAULT_EMB_MODEL   = "llama2"
 
+    DEFAULT_TIMEOUT         = 60.0
+    DEFAULT_CONNECT_TIMEOUT = 5.0
+    DEFAULT_RETRIES         = 2
+    DEFAULT_BACKOFF_MS      = 200
+    DEFAULT_MAX_CONNECTIONS = 16
+    DEFAULT_MAX_CONCURRENCY = 8
+    DEFAULT_BATCH_SIZE      = 64
+
+    RETRY_STATUS_CODES = [429, 502, 503, 504]
+
+    # in-flight limits per upstream url - asyncio semaphores are bound to their event loop
+    _async_limits: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+    _sync_limits: dict = {}
+    _limits_lock = threading.Lock()
+
     def __init__(self, model_name: str = "default", parameters: dict = {}) -> None:
         super().__init__(type_desc="Ollama Embedding Proxy", model_name=model_name, parameters=parameters)
-        self.url: str = parameters.get("url", None)
+        self.url: str = self.parameters.get("url", None)
+        if self.url:
+            self.url = self.url.rstrip("/")
+        self.timeout: float = float(self.parameters.get("timeout", self.DEFAULT_TIMEOUT))
+        self.connect_timeout: float = float(self.parameters.get("connect_timeout", self.DEFAULT_CONNECT_TIMEOUT))
+        self.retries: int = max(0, int(self.parameters.get("retries", self.DEFAULT_RETRIES)))
+        self.backoff_ms: int = max(0, int(self.parameters.get("backoff_ms", self.DEFAULT_BACKOFF_MS)))
+        self.max_connections: int = max(1, int(self.parameters.get("max_connections", self.DEFAULT_MAX_CONNECTIONS)))
+        self.max_concurrency: int = max(1, int(self.parameters.get("max_concurrency", self.DEFAULT_MAX_CONCURRENCY)))
+        self.batch_size: int = max(1, int(self.parameters.get("batch_size", self.DEFAULT_BATCH_SIZE)))
+        self.normalize: bool = str(self.parameters.get("normalize", "false")).lower() in ["true", "1", "yes"]
+        # None until the first batched call tells if /api/embed exists
+        self.batch_supported: bool = None
+        self._async_client: httpx.AsyncClient = None
+        self._sync_client: httpx.Client = None
         if model_name == "default":
             self.model_name = self.DEFAULT_EMB_MODEL
-    
-    def load(self, context: Context) -> bool:        
+
+    def load(self, context: Context) -> bool:
         if not self.model_name or not self.url:
             context.set_error("model name or url in params is missing")
             return False
         else:
             return True
-        
-    
+
+
     def unload(self) -> bool:
+        client = self._async_client
+        self._async_client = None
+        if client:
+            try:
+                asyncio.get_running_loop().create_task(client.aclose())
+            except RuntimeError:
+                pass
+        if self._sync_client:
+            self._sync_client.close()
+            self._sync_client = None
         return True
-    
+
+    def get_cache_key(self) -> str:
+        return f"{self.model_name}|normalize={self.normalize}"
+
+    def _get_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+    def _get_limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if not self._async_client:
+            self._async_client = httpx.AsyncClient(timeout=self._get_timeout(), limits=self._get_limits())
+        return self._async_client
+
+    def _get_sync_client(self) -> httpx.Client:
+        if not self._sync_client:
+            self._sync_client = httpx.Client(timeout=self._get_timeout(), limits=self._get_limits())
+        return self._sync_client
+
+    def _get_async_limit(self) -> asyncio.Semaphore:
+        with self._limits_lock:
+            limits = self._async_limits.setdefault(asyncio.get_running_loop(), {})
+            if self.url not in limits:
+                limits[self.url] = asyncio.Semaphore(self.max_concurrency)
+            return limits[self.url]
+
+    def _get_sync_limit(self) -> threading.Semaphore:
+        with self._limits_lock:
+            if self.url not in self._sync_limits:
+                self._sync_limits[self.url] = threading.Semaphore(self.max_concurrency)
+            return self._sync_limits[self.url]
+
+    def _get_backoff(self, attempt: int) -> float:
+        # exponential backoff with jitter, in seconds
+        return self.backoff_ms * (2 ** attempt) * random.uniform(0.5, 1.0) / 1000
+
+    def _is_retryable(self, response: httpx.Response) -> bool:
+        return response.status_code in self.RETRY_STATUS_CODES
+
+    def _is_missing_route(self, response: httpx.Response) -> bool:
+        # old servers answer unknown routes with a plain 404, unknown models come with a json error
+        if response.status_code != 404 or self.batch_supported is not None:
+            return False
+        try:
+            return "error" not in response.json()
+        except Exception:
+            return True
+
+    def _set_batch_unsupported(self):
+        print(f"Ollama {self.url} does not support /api/embed - using /api/embeddings per text")
+        self.batch_supported = False
+
+    def _split(self, texts: list) -> list:
+        return [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+
+    def _parse_embed(self, context: Context, response: httpx.Response, count: int) -> list:
+        embeddings = response.json().get("embeddings")
+        if not embeddings or len(embeddings) != count:
+            context.set_error("invalid ollama embeddings", status_code=502)
+            return None
+        return [self._normalize(embedding) for embedding in embeddings]
+
+    def _parse_embedding(self, context: Context, response: httpx.Response) -> list:
+        embedding = response.json().get("embedding")
+        if not embedding:
+            context.set_error("invalid ollama embedding", status_code=502)
+            return None
+        return self._normalize(embedding) if self.normalize else embedding
+
+    @staticmethod
+    def _normalize(embedding: list) -> list:
+        norm = math.sqrt(sum(value * value for value in embedding))
+        if not norm:
+            return embedding
+        return [value / norm for value in embedding]
+
+    def _set_failed(self, context: Context, response: httpx.Response):
+        context.set_error(f"call to ollama failed: {response.status_code} - {response.reason_phrase}", status_code=502)
+
+    # -------------- synchronous calls
+    def _post(self, context: Context, route: str, payload: dict) -> httpx.Response:
+        client = self._get_sync_client()
+        with self._get_sync_limit():
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    response = client.post(url=f"{self.url}{route}", json=payload)
+                except httpx.TransportError as exc:
+                    if last:
+                        context.set_error(f"calling ollama failed: {exc}", status_code=502)
+                        return None
+                else:
+                    if last or not self._is_retryable(response):
+                        return response
+                time.sleep(self._get_backoff(attempt))
+
     def get_embedding(self, context: Context, text: str) -> list:
+        result = self.get_embeddings(context=context, texts=[text])
+        return result[0] if result else None
+
+    def get_embeddings(self, context: Context, texts: list) -> list:
         if not self.url:
             context.set_error("invalid route to ollama")
-            return False
+            return None
+
         try:
-            url = f"{self.url}/api/embeddings"
-            payload = {"model":self.model_name, "prompt":text}
-            response = requests.post(url=url, json=payload)
-            if not response.ok:
-                context.set_error(f"call to ollama failed: {response.status_code} - {response.reason}")
+            result = []
+            for chunk in self._split(texts):
+                embeddings = None
+                if self.normalize and self.batch_supported is not False:
+                    response = self._post(context, "/api/embed", {"model": self.model_name, "input": chunk})
+                    if response is None:
+                        return None
+                    if self._is_missing_route(response):
+                        self._set_batch_unsupported()
+                    elif not response.is_success:
+                        self._set_failed(context, response)
+                        return None
+                    else:
+                        self.batch_supported = True
+                        embeddings = self._parse_embed(context, response, len(chunk))
+                        if embeddings is None:
+                            return None
+
+                if embeddings is None:
+                    embeddings = []
+                    for text in chunk:
+                        response = self._post(context, "/api/embeddings", {"model": self.model_name, "prompt": text})
+                        if response is None:
+                            return None
+                        if not response.is_success:
+                            self._set_failed(context, response)
+                            return None
+                        embedding = self._parse_embedding(context, response)
+                        if embedding is None:
+                            return None
+                        embeddings.append(embedding)
+                result.extend(embeddings)
+            return result
+        except Exception as exc:
+            context.set_error(f"calling ollama failed: {exc}", status_code=502)
+            return None
+
+    # -------------- asynchronous calls
+    async def _post_async(self, context: Context, route: str, payload: dict) -> httpx.Response:
+        client = self._get_async_client()
+        async with self._get_async_limit():
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    response = await client.post(url=f"{self.url}{route}", json=payload)
+                except httpx.TransportError as exc:
+                    if last:
+                        context.set_error(f"calling ollama failed: {exc}", status_code=502)
+                        return None
+                else:
+                    if last or not self._is_retryable(response):
+                        return response
+                await asyncio.sleep(self._get_backoff(attempt))
+
+    async def _embed_chunk_async(self, context: Context, texts: list) -> list:
+        if self.normalize and self.batch_supported is not False:
+            response = await self._post_async(context, "/api/embed", {"model": self.model_name, "input": texts})
+            if response is None:
+                return None
+            if self._is_missing_route(response):
+                self._set_batch_unsupported()
+            elif not response.is_success:
+                self._set_failed(context, response)
                 return None
             else:
-                result = response.json()
-                embedding = result.get("embedding")
-                if embedding:
-                    return embedding
-                else:
-                    context.set_error(f"invalid ollama embedding")
-                    return None
+                self.batch_supported = True
+                return self._parse_embed(context, response, len(texts))
+
+        # raw vectors or legacy server - one request per text, in parallel up to the upstream limit
+        return await self._embed_single_async(context, texts)
+
+    async def _embed_single_async(self, context: Context, texts: list) -> list:
+        async def embed(text: str) -> list:
+            response = await self._post_async(context, "/api/embeddings", {"model": self.model_name, "prompt": text})
+            if response is None:
+                return None
+            if not response.is_success:
+                self._set_failed(context, response)
+                return None
+            return self._parse_embedding(context, response)
+
+        result = await asyncio.gather(*[embed(text) for text in texts])
+        if any(embedding is None for embedding in result):
+            return None
+        return list(result)
+
+    async def get_embeddings_async(self, context: Context, texts: list, executor: InferenceExecutor) -> list:
+        # network bound - runs on the event loop, not on the inference executor
+        if not self.url:
+            context.set_error("invalid route to ollama")
+            return None
+
+        try:
+            chunks = await asyncio.gather(*[self._embed_chunk_async(context, chunk) for chunk in self._split(texts)])
+            if any(chunk is None for chunk in chunks):
+                return None
+            return [embedding for chunk in chunks for embedding in chunk]
         except Exception as exc:
-            context.set_error(f"calling ollama failed: {exc}")
+            context.set_error(f"calling ollama failed: {exc}", status_code=502)
             return None
-        
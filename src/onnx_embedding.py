@@ -0,0 +1,280 @@
+from interfaces import EmbeddingFunctionInterface
+from chroma import EmbeddingFunctionDefault
+from utils import Context
+from chunking import tokenizer_offsets
+from bucketing import token_lengths, embed_bucketed, DEFAULT_MAX_BATCH_TOKENS, DEFAULT_MAX_BATCH_ITEMS
+import inspect
+import json
+import os
+import re
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+
+class EmbeddingFunctionOnnx(EmbeddingFunctionInterface):
+    """sentence transformer model running on ONNX Runtime (CPU)
+
+    The transformer is exported from the sentence transformer model on its first
+    load and cached with the tokenizer in ``cache_dir/<model name>``. Pooling and
+    normalization are applied in numpy, matching the sentence transformer
+    modules of the model. Optional dynamic int8 quantization of the weights.
+    Every export is checked against the PyTorch output, a failed parity check
+    fails the load.
+
+    parameters: cache_dir, quantize, threads, max_length, parity_threshold,
+    max_batch_tokens, max_batch_items
+    """
+
+    DEFAULT_CACHE_DIR = "onnx_cache"
+    ONNX_FILE         = "model.onnx"
+    ONNX_INT8_FILE    = "model.int8.onnx"
+    CONFIG_FILE       = "embedding_config.json"
+    OPSET_VERSION     = 14
+
+    # min cosine similarity between the pytorch and the onnx embeddings
+    PARITY_THRESHOLD      = 0.9999
+    PARITY_THRESHOLD_INT8 = 0.98
+
+    PARITY_SAMPLES = [
+        "The quick brown fox jumps over the lazy dog.",
+        "Vector databases store embeddings for similarity search.",
+        "short",
+        "A considerably longer sentence that needs more tokens than the others, so the padding and the attention mask matter for pooling."
+    ]
+
+    def __init__(self, model_name: str = "default", parameters: dict = {}) -> None:
+        super().__init__(type_desc="ONNX Runtime sentence transformer", model_name=model_name, parameters=parameters)
+        if model_name == "default":
+            self.model_name = EmbeddingFunctionDefault.DEFAULT_EMB_MODEL
+        self.cache_dir: str = self.parameters.get("cache_dir", os.getenv("ONNX_CACHE_DIR", self.DEFAULT_CACHE_DIR))
+        self.quantize: bool = str(self.parameters.get("quantize", "false")).lower() in ["true", "1", "yes"]
+        self.threads: int = int(self.parameters.get("threads", 0))
+        self.max_length: int = int(self.parameters.get("max_length", 0))
+        self.max_batch_tokens: int = int(self.parameters.get("max_batch_tokens", DEFAULT_MAX_BATCH_TOKENS))
+        self.max_batch_items: int = int(self.parameters.get("max_batch_items", DEFAULT_MAX_BATCH_ITEMS))
+        default_threshold = self.PARITY_THRESHOLD_INT8 if self.quantize else self.PARITY_THRESHOLD
+        self.parity_threshold: float = float(self.parameters.get("parity_threshold", default_threshold))
+        self.model_desc = f"{self.model_name}{' int8' if self.quantize else ''}"
+        self.config: dict = None
+        self.parity: dict = None
+        self._session = None
+        self._tokenizer = None
+        self._input_names: list = []
+
+    def get_model_dir(self) -> str:
+        return os.path.join(self.cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", self.model_name))
+
+    def get_model_path(self) -> str:
+        return os.path.join(self.get_model_dir(), self.ONNX_INT8_FILE if self.quantize else self.ONNX_FILE)
+
+    def load(self, context: Context) -> bool:
+        if ort is None:
+            context.set_error("onnxruntime is not installed", status_code=500)
+            return False
+        try:
+            model_dir = self.get_model_dir()
+            if not os.path.exists(os.path.join(model_dir, self.ONNX_FILE)):
+                print(f"Exporting model {self.model_name} to ONNX in {model_dir}")
+                if not self._export(context, model_dir):
+                    return False
+            if self.quantize and not os.path.exists(os.path.join(model_dir, self.ONNX_INT8_FILE)):
+                print(f"Quantizing ONNX model {self.model_name} to int8")
+                self._quantize(model_dir)
+
+            with open(os.path.join(model_dir, self.CONFIG_FILE)) as file:
+                self.config = json.load(file)
+            if not self.max_length:
+                self.max_length = int(self.config.get("max_length") or 512)
+            self._open_session(model_dir)
+
+            # compare with pytorch after each export or quantization
+            if self.quantize and not self.config.get("parity_int8"):
+                self.config["parity_int8"] = self._check_parity()
+                self._save_config(model_dir)
+            self.parity = self.config.get("parity_int8") if self.quantize else self.config.get("parity")
+            if self.parity and self.parity.get("min_cosine", 0) < self.parity_threshold:
+                context.set_error(f"ONNX model {self.model_desc} failed the parity check: min cosine similarity {self.parity.get('min_cosine')}", status_code=500)
+                self.unload()
+                return False
+            return True
+        except Exception as exc:
+            context.set_error(f"Loading ONNX model {self.model_name} failed - {exc}", status_code=500)
+            self.unload()
+            return False
+
+    def unload(self) -> bool:
+        self._session = None
+        self._tokenizer = None
+        return True
+
+    def get_memory_usage(self) -> int:
+        # the weights dominate, the session holds them once
+        try:
+            return os.path.getsize(self.get_model_path()) if self._session else 0
+        except OSError:
+            return 0
+
+    def get_description(self) -> str:
+        description = super().get_description()
+        if self.parity:
+            description += f" - parity min cosine {self.parity.get('min_cosine'):.6f}"
+        return description
+
+    def get_token_offsets(self, text: str) -> list:
+        return tokenizer_offsets(self._tokenizer, text) if self._tokenizer else None
+
+    def get_max_tokens(self) -> int:
+        return self.max_length if self._session else None
+
+    def get_cache_key(self) -> str:
+        config = self.config if self.config else {}
+        return f"{self.model_name}|quantize={self.quantize}|pooling={config.get('pooling')}|normalize={config.get('normalize')}|max_length={self.max_length}"
+
+    def get_embedding(self, context: Context, text: str) -> list:
+        result = self.get_embeddings(context=context, texts=[text])
+        return result[0] if result is not None else None
+
+    def get_embeddings(self, context: Context, texts: list) -> list:
+        if not self._session:
+            context.set_error(f"embedding function not available for {self.get_description()}")
+            return None
+        try:
+            return self._encode(list(texts))
+        except Exception as exc:
+            context.set_error(f"creating embedding failed: {exc}")
+            return None
+
+    def _encode(self, texts: list) -> np.ndarray:
+        # texts of similar token length share a forward pass
+        lengths = token_lengths(self._tokenizer, texts, self.max_length)
+        return np.stack(embed_bucketed(texts, lengths, self._encode_batch, max_tokens=self.max_batch_tokens, max_items=self.max_batch_items))
+
+    def _encode_batch(self, texts: list) -> np.ndarray:
+        encoded = self._tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        inputs = {name: encoded[name].astype(np.int64) for name in self._input_names}
+        hidden = self._session.run(None, inputs)[0]
+        return self._pool(hidden, encoded["attention_mask"])
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooling = self.config.get("pooling", "mean")
+        if pooling == "cls":
+            result = hidden[:, 0]
+        elif pooling == "max":
+            result = np.where(mask > 0, hidden, -np.inf).max(axis=1)
+        else:
+            result = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config.get("normalize"):
+            result = result / np.clip(np.linalg.norm(result, axis=1, keepdims=True), 1e-12, None)
+        return result.astype(np.float32)
+
+    def _open_session(self, model_dir: str):
+        from transformers import AutoTokenizer
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(self.get_model_path(), sess_options=options, providers=["CPUExecutionProvider"])
+        self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self._input_names = [item.name for item in self._session.get_inputs()]
+
+    def _save_config(self, model_dir: str):
+        path = os.path.join(model_dir, self.CONFIG_FILE)
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(self.config, file, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def _export(self, context: Context, model_dir: str) -> bool:
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(self.model_name, device="cpu")
+        transformer = model[0]
+        pooling = "mean"
+        normalize = False
+        for module in list(model)[1:]:
+            if hasattr(module, "get_pooling_mode_str"):
+                pooling = module.get_pooling_mode_str()
+            elif type(module).__name__ == "Normalize":
+                normalize = True
+        if pooling not in ["mean", "cls", "max"]:
+            context.set_error(f"pooling mode {pooling} of model {self.model_name} is not supported by the ONNX backend")
+            return False
+
+        os.makedirs(model_dir, exist_ok=True)
+        tokenizer = transformer.tokenizer
+        encoded = tokenizer(self.PARITY_SAMPLES, padding=True, truncation=True, return_tensors="pt")
+        input_names = [name for name in ["input_ids", "attention_mask", "token_type_ids"] if name in encoded]
+
+        class HiddenStates(torch.nn.Module):
+            def __init__(self, auto_model):
+                super().__init__()
+                self.auto_model = auto_model
+
+            def forward(self, *inputs):
+                return self.auto_model(**dict(zip(input_names, inputs))).last_hidden_state
+
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+        path = os.path.join(model_dir, self.ONNX_FILE)
+        # the torchscript exporter handles dynamic axes of transformers without onnxscript
+        export_options = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        transformer.auto_model.eval()
+        with torch.no_grad():
+            torch.onnx.export(
+                HiddenStates(transformer.auto_model),
+                tuple(encoded[name] for name in input_names),
+                f"{path}.tmp",
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=self.OPSET_VERSION,
+                **export_options
+            )
+        tokenizer.save_pretrained(model_dir)
+        os.replace(f"{path}.tmp", path)
+
+        self.config = {
+            "model_name": self.model_name,
+            "pooling": pooling,
+            "normalize": normalize,
+            "max_length": transformer.max_seq_length,
+            "reference": model.encode(self.PARITY_SAMPLES, convert_to_numpy=True).tolist()
+        }
+        self._save_config(model_dir)
+
+        # fp32 parity with the model still in memory
+        quantize = self.quantize
+        self.quantize = False
+        try:
+            self.max_length = self.max_length or int(transformer.max_seq_length or 512)
+            self._open_session(model_dir)
+            self.config["parity"] = self._check_parity()
+            self._save_config(model_dir)
+        finally:
+            self.quantize = quantize
+            self.unload()
+        return True
+
+    def _quantize(self, model_dir: str):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        path = os.path.join(model_dir, self.ONNX_INT8_FILE)
+        quantize_dynamic(os.path.join(model_dir, self.ONNX_FILE), f"{path}.tmp", weight_type=QuantType.QInt8)
+        os.replace(f"{path}.tmp", path)
+
+    def _check_parity(self) -> dict:
+        # reference embeddings were computed with pytorch at export time
+        reference = np.asarray(self.config["reference"], dtype=np.float32)
+        result = self._encode(self.PARITY_SAMPLES)
+        norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(result, axis=1)
+        cosine = (reference * result).sum(axis=1) / np.clip(norms, 1e-12, None)
+        parity = {
+            "min_cosine": float(cosine.min()),
+            "max_abs_diff": float(np.abs(reference - result).max())
+        }
+        print(f"ONNX parity check {self.model_desc}: {parity}")
+        return parity
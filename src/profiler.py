@@ -0,0 +1,64 @@
+import os
+import sys
+import threading
+import time
+
+
+class SamplingProfiler:
+    """samples the stacks of all threads of the process
+
+    Every ``interval_ms`` the current frame of each thread is read with
+    ``sys._current_frames``. Equal stacks are counted and written as folded
+    stacks, one ``root;...;leaf count`` line per stack, the input format of
+    flamegraph.pl and speedscope. Only one profile runs at a time.
+    """
+
+    DEFAULT_SECONDS     = 10
+    DEFAULT_INTERVAL_MS = 5
+    MAX_SECONDS         = 300
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.samples: int = 0
+
+    def is_running(self) -> bool:
+        return self._lock.locked()
+
+    def sample(self, seconds: float = DEFAULT_SECONDS, interval_ms: float = DEFAULT_INTERVAL_MS) -> dict:
+        """blocks for ``seconds`` and returns the sample count per folded stack, None if a profile is running"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            stacks: dict[str, int] = {}
+            interval = max(0.001, interval_ms / 1000)
+            deadline = time.monotonic() + min(max(0.0, seconds), self.MAX_SECONDS)
+            own = threading.get_ident()
+            self.samples = 0
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = self._fold(names.get(ident, str(ident)), frame)
+                    stacks[stack] = stacks.get(stack, 0) + 1
+                self.samples += 1
+                time.sleep(interval)
+            return stacks
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def format_folded(stacks: dict) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+    @staticmethod
+    def _fold(thread_name: str, frame) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            name = getattr(code, "co_qualname", code.co_name)
+            frames.append(f"{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        frames.append(f"thread {thread_name}")
+        # separators would split a frame
+        return ";".join(item.replace(";", ":") for item in reversed(frames))
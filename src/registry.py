@@ -0,0 +1,253 @@
+from contextlib import contextmanager
+import asyncio
+import os
+import time
+import metrics
+from interfaces import EmbeddingFunctionInterface
+from utils import Context
+
+
+def get_process_memory(pid: int = None) -> int:
+    """resident set size of this or the given process in bytes, 0 if unknown"""
+    try:
+        with open(f"/proc/{pid if pid else 'self'}/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return 0
+
+
+class ModelEntry:
+    def __init__(self, model_id: str, model_type: str, model_name: str, parameters: dict = {}) -> None:
+        self.model_id: str = model_id
+        self.model_type: str = model_type
+        self.model_name: str = model_name
+        self.parameters: dict = parameters if parameters else {}
+        self.emb_function: EmbeddingFunctionInterface = None
+        self.loaded_at: float = None
+        self.load_seconds: float = None
+        self.last_used: float = None
+        self.memory_bytes: int = 0
+        self.load_task: asyncio.Task = None
+        # running embedding calls, a model in use is never evicted
+        self.in_use: int = 0
+
+    def is_loaded(self) -> bool:
+        return self.emb_function is not None
+
+    @contextmanager
+    def use(self):
+        self.in_use += 1
+        try:
+            yield self
+        finally:
+            self.in_use -= 1
+            self.last_used = time.time()
+
+    def is_same_model(self, model_type: str, model_name: str, parameters: dict) -> bool:
+        return self.model_type == model_type and self.model_name == model_name and self.parameters == (parameters if parameters else {})
+
+    def get_info(self) -> dict:
+        return {
+            "id": self.model_id,
+            "type": self.model_type,
+            "name": self.model_name,
+            "loaded": self.is_loaded(),
+            "memory_bytes": self.memory_bytes,
+            "load_seconds": self.load_seconds,
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+            "in_use": self.in_use
+        }
+
+
+class ModelRegistry:
+    """keeps track of registered and resident models
+
+    Models are loaded lazily on first use, concurrent loads of one model id share
+    a single load. Resident models are evicted least recently used first when the
+    memory budget is exceeded, or when they were idle for longer than the idle ttl.
+    Models with a running embedding call (see ``use``) are never evicted.
+    Evicted models stay registered and are loaded again on their next use.
+
+    :param factory: creates the (not yet loaded) embedding function for an entry
+    :param memory_budget: max bytes of all resident models, 0 for no limit
+    :param idle_ttl: seconds after which an unused model is unloaded, 0 to keep models
+    :param on_load: called with the entry after a model was loaded
+    :param on_unload: called with the entry before a model is unloaded
+    """
+
+    IDLE_CHECK_SECONDS = 30
+
+    def __init__(self, factory, memory_budget: int = 0, idle_ttl: int = 0, on_load=None, on_unload=None) -> None:
+        self.factory = factory
+        self.memory_budget: int = max(0, memory_budget)
+        self.idle_ttl: int = max(0, idle_ttl)
+        self.on_load = on_load
+        self.on_unload = on_unload
+        self._entries: dict[str, ModelEntry] = {}
+        self._idle_task: asyncio.Task = None
+
+    def register(self, model_id: str, model_type: str, model_name: str, parameters: dict = {}) -> ModelEntry:
+        entry = self._entries.get(model_id)
+        if entry and entry.is_same_model(model_type, model_name, parameters):
+            return entry
+
+        # a different model under the same id replaces the old one
+        if entry:
+            self.unload(model_id)
+        entry = ModelEntry(model_id=model_id, model_type=model_type, model_name=model_name, parameters=parameters)
+        self._entries[model_id] = entry
+        return entry
+
+    def get_entry(self, model_id: str) -> ModelEntry:
+        return self._entries.get(model_id)
+
+    def contains(self, model_id: str) -> bool:
+        return model_id in self._entries
+
+    def is_loaded(self, model_id: str) -> bool:
+        entry = self._entries.get(model_id)
+        return entry is not None and entry.is_loaded()
+
+    def get_entries(self) -> list:
+        return list(self._entries.values())
+
+    def get_resident_bytes(self) -> int:
+        return sum(entry.memory_bytes for entry in self._entries.values() if entry.is_loaded())
+
+    @contextmanager
+    def use(self, model_id: str):
+        """marks a model as in use for the duration of an embedding call"""
+        entry = self._entries.get(model_id)
+        if entry is None:
+            yield None
+        else:
+            with entry.use():
+                yield entry
+
+    async def get(self, context: Context, model_id: str) -> EmbeddingFunctionInterface:
+        entry = self._entries.get(model_id)
+        if not entry:
+            context.set_error(f"model {model_id} not registered")
+            return None
+        if not entry.is_loaded() and not await self.load(context, model_id):
+            return None
+        entry.last_used = time.time()
+        return entry.emb_function
+
+    async def load(self, context: Context, model_id: str) -> bool:
+        entry = self._entries.get(model_id)
+        if not entry:
+            context.set_error(f"model {model_id} not registered")
+            return False
+        if entry.is_loaded():
+            return True
+
+        # single flight - concurrent callers wait for the running load
+        if entry.load_task is None:
+            entry.load_task = asyncio.get_running_loop().create_task(self._load_entry(entry))
+
+        success, reason, status_code = await asyncio.shield(entry.load_task)
+        if not success:
+            context.set_error(reason, status_code=status_code)
+        return success
+
+    async def _load_entry(self, entry: ModelEntry) -> tuple:
+        try:
+            return await self._load_function(entry)
+        except Exception as exc:
+            return False, f"Loading model failed - {exc}", 500
+        finally:
+            entry.load_task = None
+
+    async def _load_function(self, entry: ModelEntry) -> tuple:
+        emb_function = self.factory(entry.model_type, entry.model_name, entry.parameters)
+        if not emb_function:
+            return False, f"invalid embedding function: loader type {entry.model_type} model name {entry.model_name}", 400
+
+        # make room using the size of the last load as estimate
+        self._evict_for(entry.memory_bytes, keep=entry.model_id)
+
+        load_context = Context()
+        started = time.perf_counter()
+        memory_before = get_process_memory()
+        # loading reads weights from disk - keep it off the event loop
+        loaded = await asyncio.get_running_loop().run_in_executor(None, emb_function.load, load_context)
+        if not loaded:
+            reason = load_context.reason if load_context.reason else "Loading model failed"
+            return False, reason, load_context.status_code if load_context.status_code else 400
+
+        if self._entries.get(entry.model_id) is not entry:
+            emb_function.unload()
+            return False, f"model {entry.model_id} was replaced while loading", 409
+
+        entry.emb_function = emb_function
+        entry.load_seconds = time.perf_counter() - started
+        metrics.MODEL_LOAD_SECONDS.observe(entry.load_seconds, model=entry.model_id)
+        entry.loaded_at = time.time()
+        entry.last_used = entry.loaded_at
+        entry.memory_bytes = emb_function.get_memory_usage()
+        if not entry.memory_bytes:
+            entry.memory_bytes = max(0, get_process_memory() - memory_before)
+        if self.on_load:
+            self.on_load(entry)
+
+        self._evict_for(0, keep=entry.model_id)
+        return True, None, None
+
+    def _evict_for(self, required_bytes: int, keep: str):
+        if not self.memory_budget:
+            return
+        while self.get_resident_bytes() + required_bytes > self.memory_budget:
+            candidates = [entry for entry in self._entries.values() if entry.is_loaded() and not entry.in_use and entry.model_id != keep]
+            if not candidates:
+                return
+            victim = min(candidates, key=lambda entry: entry.last_used or 0)
+            print(f"Unloading model {victim.model_id} - memory budget exceeded")
+            self.unload(victim.model_id, remove=False)
+
+    def unload(self, model_id: str, remove: bool = True) -> bool:
+        entry = self._entries.get(model_id)
+        if not entry:
+            return False
+        if entry.is_loaded():
+            if self.on_unload:
+                self.on_unload(entry)
+            entry.emb_function.unload()
+            entry.emb_function = None
+        if remove:
+            del self._entries[model_id]
+        return True
+
+    def unload_all(self) -> int:
+        count = 0
+        for model_id in list(self._entries.keys()):
+            if self.unload(model_id):
+                count += 1
+        return count
+
+    def evict_idle(self) -> int:
+        if not self.idle_ttl:
+            return 0
+        limit = time.time() - self.idle_ttl
+        count = 0
+        for entry in list(self._entries.values()):
+            if entry.is_loaded() and not entry.in_use and (entry.last_used or 0) < limit:
+                print(f"Unloading model {entry.model_id} - idle for more than {self.idle_ttl}s")
+                self.unload(entry.model_id, remove=False)
+                count += 1
+        return count
+
+    def start(self):
+        if self.idle_ttl and not self._idle_task:
+            self._idle_task = asyncio.get_running_loop().create_task(self._run_idle_check())
+
+    def stop(self):
+        if self._idle_task:
+            self._idle_task.cancel()
+            self._idle_task = None
+
+    async def _run_idle_check(self):
+        while True:
+            await asyncio.sleep(min(self.IDLE_CHECK_SECONDS, self.idle_ttl))
+            self.evict_idle()
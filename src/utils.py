@@ -1,6 +1,10 @@
-from fastapi.responses import HTMLResponse 
+from fastapi.responses import HTMLResponse, JSONResponse
+from contextlib import contextmanager
+from contextvars import ContextVar
 import json
 import os
+import time
+import metrics
 
 def getenv(name:str, default=None, desc: str = None, console_out: bool = True):
     result = os.getenv(name, None)
@@ -32,6 +36,10 @@ class Context:
         self.reason: str = reason
         self.status_code: int = status_code
         self.payload = None
+        # admission class of the embedding calls, see admission.PRIORITIES
+        self.priority: str = None
+        # seconds spent per stage, e.g. queue, embed, vectordb, serialize
+        self.timings: dict = {}
 
     def set_payload(self, payload):
         self.payload = payload
@@ -44,6 +52,21 @@ class Context:
     def get_payload(self):
         return self.payload
 
+    def add_timing(self, stage: str, seconds: float):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timing(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(stage, time.perf_counter() - started)
+
+    def get_server_timing(self) -> str:
+        # Server-Timing header value, durations in ms
+        return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in self.timings.items())
+
     def set_error(self, reason: str, status_code: int = 400):
         self.reason = reason
         self.status_code = status_code
@@ -77,9 +100,41 @@ class Context:
         status = 400
         if self.status_code:
             status = self.status_code
+        metrics.ERRORS.inc(status_code=status)
 
         payload = json.dumps({
             "message": message
         })    
 
         return HTMLResponse(content=payload, status_code=status)
+
+
+# contexts created while serving the current http request
+_request_contexts: ContextVar = ContextVar("request_contexts", default=None)
+
+def start_request_timing() -> list:
+    """starts collecting the contexts of a request, call before the request is handled"""
+    contexts = []
+    _request_contexts.set(contexts)
+    return contexts
+
+def track_context(context: Context) -> Context:
+    contexts = _request_contexts.get()
+    if contexts is not None:
+        contexts.append(context)
+    return context
+
+def add_request_timing(stage: str, seconds: float):
+    contexts = _request_contexts.get()
+    if contexts:
+        contexts[0].add_timing(stage, seconds)
+
+class TimedJSONResponse(JSONResponse):
+    """json response that records its rendering as serialize stage of the request"""
+
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        try:
+            return super().render(content)
+        finally:
+            add_request_timing("serialize", time.perf_counter() - started)
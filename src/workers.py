@@ -0,0 +1,224 @@
+from interfaces import EmbeddingFunctionInterface
+from chroma import EmbeddingFunctionDefault
+from executor import InferenceExecutor
+from registry import get_process_memory
+from utils import Context
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+import multiprocessing
+import asyncio
+import itertools
+import os
+import queue
+import threading
+import numpy as np
+
+
+def _worker_main(index: int, model_name: str, parameters: dict, threads: int, requests, responses):
+    """entry point of a worker process - loads the model and serves embedding requests
+
+    Results are written to a new shared memory block per request, the parent
+    copies them out and unlinks the block.
+    """
+    # thread settings must be in place before torch is imported
+    for name in ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]:
+        os.environ[name] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except Exception:
+        pass
+
+    emb_function = EmbeddingFunctionDefault(model_name=model_name, parameters=parameters)
+    context = Context()
+    if not emb_function.load(context):
+        responses.put((None, index, None, None, context.reason if context.reason else "Loading model failed"))
+        return
+    responses.put((None, index, None, None, None))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, texts = request
+        context = Context()
+        try:
+            result = emb_function.get_embeddings(context=context, texts=texts)
+            if result is None:
+                responses.put((request_id, index, None, None, context.reason if context.reason else "invalid embedding"))
+                continue
+            matrix = np.ascontiguousarray(np.stack(result), dtype=np.float32)
+            block = shared_memory.SharedMemory(create=True, size=max(1, matrix.nbytes))
+            np.ndarray(matrix.shape, dtype=np.float32, buffer=block.buf)[:] = matrix
+            responses.put((request_id, index, block.name, matrix.shape, None))
+            block.close()
+        except Exception as exc:
+            responses.put((request_id, index, None, None, f"creating embedding failed: {exc}"))
+
+
+class EmbeddingFunctionProcessPool(EmbeddingFunctionInterface):
+    """sentence transformer hosted in a pool of worker processes
+
+    Every worker loads its own copy of the model and pins torch to ``threads``
+    threads, so the workers scale with the cores instead of sharing the GIL of
+    the api process. Requests are dispatched over one shared queue and the idle
+    worker takes the next one. Embeddings come back as float32 matrices in
+    shared memory.
+
+    parameters: processes, threads (per process, defaults to cores / processes),
+    max_queue, load_timeout
+    """
+
+    DEFAULT_MAX_QUEUE    = 256
+    DEFAULT_LOAD_TIMEOUT = 600
+
+    def __init__(self, model_name: str = "default", parameters: dict = {}) -> None:
+        super().__init__(type_desc="ChromaDB sentence transformer process pool", model_name=model_name, parameters=parameters)
+        if model_name == "default":
+            self.model_name = EmbeddingFunctionDefault.DEFAULT_EMB_MODEL
+        self.processes: int = max(1, int(self.parameters.get("processes", 1)))
+        cores = os.cpu_count() or 1
+        self.threads: int = max(1, int(self.parameters.get("threads", 0)) or cores // self.processes)
+        self.max_queue: int = max(0, int(self.parameters.get("max_queue", self.DEFAULT_MAX_QUEUE)))
+        self.load_timeout: int = int(self.parameters.get("load_timeout", self.DEFAULT_LOAD_TIMEOUT))
+        self._workers: list = []
+        self._requests = None
+        self._responses = None
+        self._reader: threading.Thread = None
+        self._pending: dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._running: bool = False
+
+    def get_description(self) -> str:
+        return f"{super().get_description()} - {self.processes} processes x {self.threads} threads"
+
+    def get_concurrency(self) -> int:
+        return self.processes
+
+    def load(self, context: Context) -> bool:
+        # spawn - forking a process with torch threads is not safe
+        mp = multiprocessing.get_context("spawn")
+        self._requests = mp.Queue()
+        self._responses = mp.Queue()
+        self._workers = [
+            mp.Process(target=_worker_main, args=(index, self.model_name, self.parameters, self.threads, self._requests, self._responses), name=f"embedding-worker-{index}", daemon=True)
+            for index in range(self.processes)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+        # wait until every worker has loaded the model
+        for _ in self._workers:
+            try:
+                _, index, _, _, error = self._responses.get(timeout=self.load_timeout)
+            except queue.Empty:
+                error = f"timeout after {self.load_timeout}s"
+            if error:
+                context.set_error(f"Loading model {self.model_name} in worker process failed - {error}", status_code=500)
+                self._stop_workers()
+                return False
+
+        self._running = True
+        self._reader = threading.Thread(target=self._read_responses, name="embedding-worker-results", daemon=True)
+        self._reader.start()
+        print(f"Model {self.model_name} loaded in {self.processes} worker processes with {self.threads} threads each")
+        return True
+
+    def unload(self) -> bool:
+        self._running = False
+        self._stop_workers()
+        self._fail_pending("model unloaded")
+        return True
+
+    def get_memory_usage(self) -> int:
+        total = 0
+        for worker in self._workers:
+            total += get_process_memory(worker.pid) if worker.pid else 0
+        return total
+
+    def get_embedding(self, context: Context, text: str) -> list:
+        result = self.get_embeddings(context=context, texts=[text])
+        return result[0] if result is not None else None
+
+    def get_embeddings(self, context: Context, texts: list) -> list:
+        future = self._submit(context, texts)
+        if future is None:
+            return None
+        return self._get_result(context, future.result())
+
+    async def get_embeddings_async(self, context: Context, texts: list, executor: InferenceExecutor) -> list:
+        # the workers do the inference, the event loop only waits
+        future = self._submit(context, texts)
+        if future is None:
+            return None
+        return self._get_result(context, await asyncio.wrap_future(future))
+
+    def _submit(self, context: Context, texts: list) -> Future:
+        if not self._running:
+            context.set_error(f"embedding function not available for {self.get_description()}")
+            return None
+        with self._lock:
+            if len(self._pending) >= self.processes + self.max_queue:
+                context.set_error("inference queue is full - retry later", status_code=503)
+                return None
+            request_id = next(self._ids)
+            future = Future()
+            self._pending[request_id] = future
+        self._requests.put((request_id, list(texts)))
+        return future
+
+    def _get_result(self, context: Context, result: tuple):
+        embeddings, error = result
+        if error:
+            context.set_error(error, status_code=500)
+            return None
+        return embeddings
+
+    def _read_responses(self):
+        while self._running:
+            try:
+                request_id, index, name, shape, error = self._responses.get(timeout=1)
+            except queue.Empty:
+                if self._running and not all(worker.is_alive() for worker in self._workers):
+                    print(f"Worker process of model {self.model_name} exited")
+                    self._running = False
+                    self._fail_pending("worker process exited")
+                continue
+            except (EOFError, OSError):
+                break
+
+            embeddings = None
+            if name:
+                block = shared_memory.SharedMemory(name=name)
+                try:
+                    # copy out so the block can be released right away
+                    embeddings = np.ndarray(shape, dtype=np.float32, buffer=block.buf).copy()
+                finally:
+                    block.close()
+                    block.unlink()
+
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future and not future.done():
+                future.set_result((embeddings, error))
+
+    def _fail_pending(self, reason: str):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            if not future.done():
+                future.set_result((None, reason))
+
+    def _stop_workers(self):
+        for worker in self._workers:
+            if worker.is_alive():
+                self._requests.put(None)
+        for worker in self._workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
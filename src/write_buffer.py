@@ -0,0 +1,174 @@
+import asyncio
+import metrics
+from utils import Context
+
+
+class _CollectionBuffer:
+    def __init__(self, vdb) -> None:
+        self.vdb = vdb
+        self.records: dict = {}
+        self.waiters: list = []
+        self.lock = asyncio.Lock()
+        self.timer: asyncio.TimerHandle = None
+        self.scheduled: bool = False
+
+
+class WriteBehindBuffer:
+    """collects single document upserts per collection and writes them as one batched upsert
+
+    A collection is flushed as soon as ``max_records`` records are pending or
+    ``max_delay_ms`` after its first pending record. Pending records of the same
+    id collapse to the last write. A durable add returns after its flush with
+    the result of the upsert, other adds return right away. One flush per
+    collection runs at a time, adds wait while ``max_pending`` records are pending.
+    """
+
+    DEFAULT_MAX_RECORDS  = 256
+    DEFAULT_MAX_DELAY_MS = 50
+    DEFAULT_MAX_PENDING  = 10000
+
+    def __init__(self, max_records: int = DEFAULT_MAX_RECORDS, max_delay_ms: int = DEFAULT_MAX_DELAY_MS, max_pending: int = DEFAULT_MAX_PENDING, on_flush=None) -> None:
+        self.max_records: int = max(1, max_records)
+        self.max_delay_ms: int = max(0, max_delay_ms)
+        self.max_pending: int = max(self.max_records, max_pending)
+        self.on_flush = on_flush
+        self.added: int = 0
+        self.collapsed: int = 0
+        self.flushes: int = 0
+        self.flushed: int = 0
+        self.failed: int = 0
+        self._buffers: dict[str, _CollectionBuffer] = {}
+        self._tasks: set = set()
+
+    async def add(self, context: Context, vdb, id: str, document: str = None, embedding=None, uri: str = None, metadata: dict = None, durable: bool = True) -> bool:
+        """queues the upsert of one record
+
+        :param durable: optional: wait until the record is written
+        :type durable: bool, optional
+        :return: result of the flush if durable, True otherwise - a failed flush of non durable adds is only logged and counted in ``failed``
+        :rtype: bool
+        """
+        while True:
+            buffer = self._get_buffer(vdb)
+            if len(buffer.records) < self.max_pending:
+                break
+            await self._flush(buffer)
+
+        # the last write of an id wins and keeps the position of the write
+        if buffer.records.pop(id, None) is not None:
+            self.collapsed += 1
+            metrics.WRITE_BUFFER_RECORDS.inc(result="collapsed")
+        buffer.records[id] = (document, embedding, uri, metadata)
+        self.added += 1
+        future = None
+        if durable:
+            future = asyncio.get_running_loop().create_future()
+            buffer.waiters.append(future)
+        self._schedule(buffer)
+
+        if future is None:
+            return True
+        success, reason = await future
+        if not success:
+            context.set_error(reason)
+        return success
+
+    async def flush(self):
+        for buffer in list(self._buffers.values()):
+            await self._flush(buffer)
+
+    async def close(self):
+        # pending records are written before the service stops
+        for buffer in self._buffers.values():
+            if buffer.timer:
+                buffer.timer.cancel()
+                buffer.timer = None
+        await self.flush()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_pending(self) -> int:
+        return sum(len(buffer.records) for buffer in self._buffers.values())
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": self.get_pending(),
+            "added": self.added,
+            "collapsed": self.collapsed,
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "avg_flush_size": round(self.flushed / self.flushes, 3) if self.flushes else 0.0
+        }
+
+    def _get_buffer(self, vdb) -> _CollectionBuffer:
+        key = vdb.get_collection_key()
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = _CollectionBuffer(vdb)
+            self._buffers[key] = buffer
+        return buffer
+
+    def _schedule(self, buffer: _CollectionBuffer):
+        if buffer.scheduled:
+            # the started flush takes the new records as well
+            return
+        if len(buffer.records) >= self.max_records:
+            if buffer.timer:
+                buffer.timer.cancel()
+                buffer.timer = None
+            self._start_flush(buffer)
+        elif buffer.timer is None and buffer.records:
+            buffer.timer = asyncio.get_running_loop().call_later(self.max_delay_ms / 1000, self._start_flush, buffer)
+
+    def _start_flush(self, buffer: _CollectionBuffer):
+        buffer.timer = None
+        buffer.scheduled = True
+        task = asyncio.get_running_loop().create_task(self._flush(buffer))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, buffer: _CollectionBuffer):
+        async with buffer.lock:
+            buffer.scheduled = False
+            if not buffer.records:
+                return
+            records, waiters = buffer.records, buffer.waiters
+            buffer.records, buffer.waiters = {}, []
+            if buffer.timer:
+                buffer.timer.cancel()
+                buffer.timer = None
+
+            context = Context()
+            try:
+                success = await buffer.vdb.learn_documents(
+                    context=context,
+                    ids=list(records.keys()),
+                    documents=[record[0] for record in records.values()],
+                    embeddings=[record[1] for record in records.values()],
+                    uris=[record[2] for record in records.values()],
+                    metadatas=[record[3] for record in records.values()]
+                )
+            except Exception as exc:
+                success = False
+                context.set_error(f"Learning documents failed - {exc}")
+
+            self.flushes += 1
+            if success:
+                self.flushed += len(records)
+            else:
+                self.failed += len(records)
+                print(f"Write buffer flush of {len(records)} records to {buffer.vdb.get_collection_key()} failed: {context.reason}")
+            metrics.WRITE_BUFFER_RECORDS.inc(len(records), result="flushed" if success else "failed")
+            metrics.WRITE_BUFFER_FLUSH_SIZE.observe(len(records))
+            if self.on_flush:
+                self.on_flush(buffer.vdb)
+            reason = context.reason if context.reason else "Learning documents failed"
+            for future in waiters:
+                if not future.done():
+                    future.set_result((success, reason))
+
+        # records added during the flush
+        if buffer.records:
+            self._schedule(buffer)
+        elif self._buffers.get(buffer.vdb.get_collection_key()) is buffer:
+            del self._buffers[buffer.vdb.get_collection_key()]
@@ -0,0 +1,109 @@
+import contextlib
+import io
+import os
+import sys
+import time
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from fastapi.testclient import TestClient
+from fakes import FakeEmbeddingFunction, FakeVectorDB
+from changes import STATUS_INSERTED, STATUS_UPDATED
+
+DIMENSION = 8
+
+# the words of these texts make up the vocabulary of the tiny model
+TEXTS = ["the quick brown fox", "a considerably longer sentence that needs more tokens than the others", "short"]
+
+
+class StubHandler:
+    """service handler of bulk ingestors and jobs, records with document "bad" fail to embed"""
+
+    ingest_batch_size = 2
+    ingest_upsert_size = 2
+    ingest_max_errors = 10
+
+    def __init__(self) -> None:
+        self.store: dict = {}
+        self.upserts: list = []
+
+    async def documents_embed(self, context, records: list, vdb=None, model: str = None) -> list:
+        errors = []
+        for record in records:
+            errors.append("embedding generation failed" if record.get("document") == "bad" else None)
+            record["embedding"] = [1.0]
+            record["_status"] = STATUS_UPDATED if record["id"] in self.store else STATUS_INSERTED
+        return errors
+
+    async def documents_upsert(self, context, records: list, vdb=None) -> bool:
+        self.upserts.append([record["id"] for record in records])
+        for record in records:
+            self.store[record["id"]] = record["document"]
+        return True
+
+
+def wait_for_job(client, id: str, seconds: float = 10) -> dict:
+    deadline = time.monotonic() + seconds
+    while True:
+        status = client.get("/job_status", params={"id": id}).json()
+        if status["state"] not in ["queued", "running"] or time.monotonic() > deadline:
+            return status
+        time.sleep(0.02)
+
+
+@pytest.fixture(scope="session")
+def service(tmp_path_factory):
+    """test client of the app with the fake model as default model, the vectordb is set per test"""
+    for name in ["VECTORDB_TYPE", "DEFAULT_MODEL", "OLLAMA_URL", "EMBEDDING_DISK_CACHE_PATH"]:
+        os.environ.pop(name, None)
+    os.environ["JOBS_DIR"] = str(tmp_path_factory.mktemp("jobs"))
+    # the startup reports every setting on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+        client = TestClient(main.app)
+        client.__enter__()
+    handler = main.Factory.get_service_handler()
+    handler.add_model_type("fake", FakeEmbeddingFunction)
+    response = client.post("/model_load", json={"type": "fake", "name": "fake", "id": "default", "parameters": {"dimension": DIMENSION, "latency_ms": 0, "latency_per_text_ms": 0}})
+    assert response.status_code == 200, response.text
+    yield client, handler
+    with contextlib.redirect_stdout(io.StringIO()):
+        client.__exit__(None, None, None)
+
+
+@pytest.fixture
+def client(service):
+    client, handler = service
+    handler.vdb_server = FakeVectorDB(parameters={"embedding": "default", "latency_ms": 0})
+    handler.embedding_cache.clear()
+    return client
+
+
+@pytest.fixture
+def handler(service, client):
+    return service[1]
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory) -> tuple:
+    """a small random BERT sentence transformer saved locally, nothing is downloaded"""
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    from sentence_transformers import SentenceTransformer, models
+
+    torch.manual_seed(0)
+
+    directory = tmp_path_factory.mktemp("tiny")
+    words = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", ".", ","] + sorted(set(" ".join(TEXTS).split()))
+    with open(directory / "vocab.txt", "w") as file:
+        file.write("\n".join(words))
+    BertTokenizerFast(vocab_file=str(directory / "vocab.txt")).save_pretrained(str(directory / "bert"))
+    BertModel(BertConfig(vocab_size=len(words), hidden_size=16, num_hidden_layers=1, num_attention_heads=2, intermediate_size=32, max_position_embeddings=64)).save_pretrained(str(directory / "bert"))
+
+    transformer = models.Transformer(str(directory / "bert"), max_seq_length=64)
+    model = SentenceTransformer(modules=[transformer, models.Pooling(16, "mean"), models.Normalize()], device="cpu")
+    model.save(str(directory / "model"))
+    return str(directory / "model"), model
@@ -0,0 +1,59 @@
+import asyncio
+from admission import AdmissionScheduler, PriorityClass, parse_priority, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from utils import Context
+
+
+def create(capacity: int = 1, bulk_queue: int = 8, timeout_ms: int = 0) -> AdmissionScheduler:
+    return AdmissionScheduler(capacity=capacity, classes=[
+        PriorityClass(PRIORITY_INTERACTIVE, 4, 8, timeout_ms),
+        PriorityClass(PRIORITY_BULK, 1, bulk_queue, timeout_ms)
+    ])
+
+
+def test_parse_priority():
+    assert parse_priority(None) == PRIORITY_INTERACTIVE
+    assert parse_priority(" Bulk ") == PRIORITY_BULK
+    assert parse_priority("urgent") is None
+
+
+def test_free_slot_goes_to_interactive_first():
+    scheduler = create()
+    order = []
+
+    async def call(name: str, priority: str):
+        assert await scheduler.acquire(Context(), priority)
+        order.append(name)
+        await asyncio.sleep(0)
+        scheduler.release(priority)
+
+    async def run():
+        assert await scheduler.acquire(Context(), PRIORITY_BULK)
+        tasks = [asyncio.create_task(call("bulk", PRIORITY_BULK)), asyncio.create_task(call("interactive", PRIORITY_INTERACTIVE))]
+        await asyncio.sleep(0)
+        scheduler.release(PRIORITY_BULK)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["interactive", "bulk"]
+    assert scheduler.get_stats()["running"] == 0
+
+
+def test_full_queue_and_timeout_are_rejected():
+    scheduler = create(bulk_queue=0, timeout_ms=20)
+
+    async def run():
+        assert await scheduler.acquire(Context(), PRIORITY_INTERACTIVE)
+        context = Context()
+        assert not await scheduler.acquire(context, PRIORITY_BULK)
+        assert context.status_code == 503
+        context = Context()
+        assert not await scheduler.acquire(context, PRIORITY_INTERACTIVE)
+        assert "20 ms" in context.reason
+        scheduler.release(PRIORITY_INTERACTIVE)
+        assert await scheduler.acquire(Context(), PRIORITY_BULK)
+
+    asyncio.run(run())
+    stats = scheduler.get_stats()["classes"]
+    assert stats[PRIORITY_BULK]["rejected"] == 1
+    assert stats[PRIORITY_INTERACTIVE]["timeouts"] == 1
+    assert stats[PRIORITY_INTERACTIVE]["waiting"] == 0
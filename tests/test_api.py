@@ -0,0 +1,124 @@
+import json
+import numpy as np
+from fakes import fake_vector
+from conftest import DIMENSION, wait_for_job
+
+
+def test_models(client):
+    models = client.get("/models").json()
+    assert any(model["id"] == "default" and model["type"] == "fake" for model in models)
+
+
+def test_embedding(client):
+    response = client.post("/embedding", json={"text": "hello"})
+    assert response.status_code == 200
+    assert np.allclose(response.json(), fake_vector("hello", DIMENSION))
+    assert "total;dur=" in response.headers["server-timing"]
+
+
+def test_embedding_binary_format(client):
+    response = client.post("/embedding", json={"text": "hello"}, headers={"Accept": "application/octet-stream"})
+    assert response.headers["x-embedding-shape"] == str(DIMENSION)
+    assert np.array_equal(np.frombuffer(response.content, dtype="<f4"), fake_vector("hello", DIMENSION))
+
+
+def test_embeddings_batch(client):
+    texts = ["a", "b", "a"]
+    response = client.post("/embeddings_batch", json={"texts": texts}, params={"format": "float32"})
+    assert response.headers["x-embedding-shape"] == f"3,{DIMENSION}"
+    result = np.frombuffer(response.content, dtype="<f4").reshape(3, DIMENSION)
+    assert np.array_equal(result, np.stack([fake_vector(text, DIMENSION) for text in texts]))
+
+
+def test_embeddings_batch_json_and_limits(client, handler):
+    texts = ["x", "y"]
+    # one text is cached, the other one is embedded
+    client.post("/embedding", json={"text": "x"})
+    result = client.post("/embeddings_batch", json={"texts": texts}).json()
+    assert np.allclose(result, [fake_vector(text, DIMENSION) for text in texts])
+    assert client.post("/embeddings_batch", json={"texts": []}).status_code == 400
+    assert client.post("/embeddings_batch", json={"texts": ["z"] * (handler.max_batch_size + 1)}).status_code == 413
+
+
+def test_embeddings_ollama_format(client):
+    response = client.post("/embeddings", json={"model": "default", "prompt": "hello"})
+    assert np.allclose(response.json()["embedding"], fake_vector("hello", DIMENSION))
+
+
+def test_embedding_invalid_format_and_priority(client):
+    assert client.post("/embedding", json={"text": "x"}, params={"format": "xml"}).status_code == 406
+    assert client.post("/embedding", json={"text": "x"}, headers={"X-Priority": "urgent"}).status_code == 400
+    assert client.post("/embedding", json={"text": "x"}, headers={"X-Priority": "bulk"}).status_code == 200
+
+
+def test_stats_endpoints(client):
+    client.post("/embedding", json={"text": "stats"})
+    assert client.get("/cache_stats").json()["entries"] >= 1
+    admission = client.get("/admission_stats").json()
+    assert set(admission["classes"]) == {"interactive", "bulk"}
+    assert client.get("/write_buffer_stats").json() == {"enabled": False}
+    assert client.get("/metrics").status_code == 200
+
+
+def test_profile_disabled_by_default(client):
+    assert client.get("/profile", params={"seconds": 0.1}).status_code == 403
+
+
+def test_document_learn_and_query(client):
+    response = client.post("/document_learn", json={"id": "1", "document": "first text", "metadata": {"kind": "a"}})
+    assert response.json() is True
+    client.post("/document_learn", json={"id": "2", "document": "second text", "metadata": {"kind": "b"}})
+    assert client.get("/documents_count").json() == 2
+
+    result = client.post("/document_query", json={"document": "second text", "max_records": 1}).json()
+    assert [record["id"] for record in result] == ["2"]
+
+    result = client.post("/document_query_batch", json={"documents": ["first text", "second text"], "max_records": 1}).json()
+    assert [[record["id"] for record in records] for records in result] == [["1"], ["2"]]
+
+
+def test_document_query_batch_merge(client):
+    for id in ["a", "b", "c"]:
+        client.post("/document_learn", json={"id": id, "document": f"text {id}"})
+    vectors = [fake_vector(f"text {id}", DIMENSION).tolist() for id in ["a", "b"]]
+    result = client.post("/document_query_batch", json={"embeddings": vectors, "max_records": 2, "merge": True}).json()
+    # both exact matches come first, each record is listed once
+    assert sorted(record["id"] for record in result) == ["a", "b"]
+    assert all(abs(record["distance"]) < 1e-5 for record in result)
+    assert client.post("/document_query_batch", json={"max_records": 1}).status_code == 400
+
+
+def test_query_cache_sees_writes(client):
+    client.post("/document_learn", json={"id": "1", "document": "first text"})
+    query = {"document": "second text", "max_records": 1}
+    assert [record["id"] for record in client.post("/document_query", json=query).json()] == ["1"]
+    client.post("/document_learn", json={"id": "2", "document": "second text"})
+    assert [record["id"] for record in client.post("/document_query", json=query).json()] == ["2"]
+
+
+def test_documents_learn_bulk(client, handler):
+    body = '[{"id": "a", "document": "x"}, {"id": "b", "document": bad}, {"id": "a", "document": "y"}, {"id": "c", "document": "z"}]'
+    result = client.post("/documents_learn_bulk", content=body).json()
+    assert result["received"] == 4
+    assert result["failed"] == 1
+    assert result["learned"] == 2
+    assert result["collapsed"] == 1
+    assert result["errors"][0]["index"] == 1
+    # duplicate ids within one upsert collapse to the last write
+    assert handler.vdb_server._records["a"]["document"] == "y"
+    assert client.get("/documents_count").json() == 2
+
+
+def test_job_ingest(client):
+    body = "\n".join(json.dumps({"id": str(index), "document": f"text {index}"}) for index in range(20))
+    status = client.post("/job_ingest", content=body).json()
+    status = wait_for_job(client, status["id"])
+    assert status["state"] == "completed"
+    assert status["learned"] == 20
+    assert any(job["id"] == status["id"] for job in client.get("/jobs").json())
+    assert client.get("/documents_count").json() == 20
+
+
+def test_job_migrate_validation(client):
+    assert client.post("/job_migrate", json={"target": "default"}).status_code == 400
+    assert client.post("/job_migrate", json={"target": "other", "model": "missing"}).status_code == 404
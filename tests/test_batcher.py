@@ -0,0 +1,65 @@
+import asyncio
+import time
+from batcher import EmbeddingBatcher
+from executor import InferenceExecutor
+from registry import ModelEntry
+from interfaces import EmbeddingFunctionInterface
+from utils import Context
+
+
+class RecordingFunction(EmbeddingFunctionInterface):
+    """records the batches and whether the model entry was marked in use, texts containing bad fail the batch"""
+
+    def __init__(self, entry: ModelEntry = None) -> None:
+        super().__init__(type_desc="recording", model_name="recording")
+        self.entry: ModelEntry = entry
+        self.batches: list = []
+        self.in_use: list = []
+
+    def get_embeddings(self, context: Context, texts: list) -> list:
+        self.batches.append(list(texts))
+        self.in_use.append(self.entry.in_use if self.entry else None)
+        time.sleep(0.01)
+        if "bad" in texts:
+            context.set_error("bad text", status_code=422)
+            return None
+        return [[float(len(text))] for text in texts]
+
+
+def submit_all(batcher: EmbeddingBatcher, texts: list) -> list:
+    async def run():
+        contexts = [Context() for _ in texts]
+        result = await asyncio.gather(*[batcher.submit(context, text) for context, text in zip(contexts, texts)])
+        batcher.close()
+        batcher.executor.shutdown()
+        return result, contexts
+    return asyncio.run(run())
+
+
+def test_concurrent_requests_share_batches():
+    entry = ModelEntry("m", "recording", "recording")
+    function = RecordingFunction(entry)
+    batcher = EmbeddingBatcher("m", function, InferenceExecutor(), entry=entry, max_batch_size=4, max_wait_ms=50)
+    texts = ["a" * (index + 1) for index in range(6)]
+    result, _ = submit_all(batcher, texts)
+    assert [len(batch) for batch in function.batches] == [4, 2]
+    assert result == [[float(len(text))] for text in texts]
+    # the model was in use while the batches ran
+    assert function.in_use == [1, 1]
+    assert entry.in_use == 0 and entry.last_used
+
+
+def test_failed_batch_reports_to_each_request():
+    function = RecordingFunction()
+    batcher = EmbeddingBatcher("m", function, InferenceExecutor(), max_batch_size=8, max_wait_ms=20)
+    result, contexts = submit_all(batcher, ["good", "bad"])
+    assert result == [None, None]
+    assert [(context.reason, context.status_code) for context in contexts] == [("bad text", 422)] * 2
+
+
+def test_full_queue_is_rejected():
+    function = RecordingFunction()
+    batcher = EmbeddingBatcher("m", function, InferenceExecutor(), max_batch_size=1, max_wait_ms=0, max_queue=1)
+    result, contexts = submit_all(batcher, ["a", "b", "c"])
+    assert result[0] is not None
+    assert any(context.status_code == 503 for context in contexts)
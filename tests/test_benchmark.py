@@ -0,0 +1,27 @@
+import json
+import os
+import subprocess
+import sys
+from conftest import ROOT
+
+
+def test_benchmark_runs_on_fakes(tmp_path):
+    output = str(tmp_path / "result.json")
+    command = [
+        sys.executable, os.path.join(ROOT, "bench", "run_benchmark.py"),
+        "--endpoints", "embedding,embeddings_batch,document_learn,document_query,embedding_ollama",
+        "--requests", "8", "--concurrency", "2", "--warmup", "4", "--distinct-texts", "20", "--batch-size", "4",
+        "--dimension", "8", "--latency-ms", "0", "--latency-per-text-ms", "0", "--vectordb-latency-ms", "0",
+        "--output", output
+    ]
+    environment = dict(os.environ, JOBS_DIR=str(tmp_path / "jobs"))
+    for name in ["VECTORDB_TYPE", "DEFAULT_MODEL", "OLLAMA_URL", "EMBEDDING_DISK_CACHE_PATH"]:
+        environment.pop(name, None)
+    subprocess.run(command, check=True, capture_output=True, cwd=str(tmp_path), env=environment, timeout=300)
+    subprocess.run(command + ["--compare", output, "--output", str(tmp_path / "second.json")], check=True, capture_output=True, cwd=str(tmp_path), env=environment, timeout=300)
+
+    with open(output) as file:
+        result = json.load(file)
+    assert all(values["requests"] == 8 and values["errors"] == 0 for values in result["results"].values())
+    with open(tmp_path / "second.json") as file:
+        assert set(json.load(file)["comparison"]["changes"]) == set(result["results"])
@@ -0,0 +1,31 @@
+from bucketing import token_lengths, plan_batches, embed_bucketed
+
+
+def test_plan_batches_groups_similar_lengths():
+    lengths = [10, 2, 9, 3, 1]
+    assert plan_batches(lengths, max_tokens=100, max_items=2) == [[4, 1], [3, 2], [0]]
+    # the padded size of the batch is capped, not the sum of the lengths
+    assert plan_batches(lengths, max_tokens=20) == [[4, 1, 3], [2, 0]]
+
+
+def test_plan_batches_long_text_gets_own_batch():
+    assert plan_batches([50, 1, 1], max_tokens=10) == [[1, 2], [0]]
+    assert plan_batches([]) == []
+
+
+def test_embed_bucketed_restores_order():
+    texts = ["long text here", "a", "mid text"]
+    calls = []
+
+    def embed(batch: list) -> list:
+        calls.append(batch)
+        return [[len(text)] for text in batch]
+
+    assert embed_bucketed(texts, token_lengths(None, texts), embed, max_items=2) == [[14], [1], [8]]
+    assert calls == [["a", "mid text"], ["long text here"]]
+    assert embed_bucketed(texts, [1, 1, 1], lambda batch: None) is None
+
+
+def test_token_lengths_without_tokenizer():
+    assert token_lengths(None, ["abcdefgh", ""]) == [4, 2]
+    assert token_lengths(None, ["x" * 100], max_length=8) == [8]
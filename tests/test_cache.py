@@ -0,0 +1,92 @@
+import numpy as np
+from cache import EmbeddingCache, EmbeddingDiskCache, QueryResultCache, text_hash
+
+
+def test_text_hash_normalizes_text():
+    assert text_hash(" café ") == text_hash("café")
+    assert text_hash("a") != text_hash("b")
+
+
+def test_embedding_cache_lru():
+    entry = 4 * 4 + EmbeddingCache.ENTRY_OVERHEAD
+    cache = EmbeddingCache(max_bytes=2 * entry)
+    cache.put("m", "a", [1, 2, 3, 4])
+    cache.put("m", "b", [5, 6, 7, 8])
+    assert np.array_equal(cache.get("m", "a"), [1, 2, 3, 4])
+    assert cache.get("other", "a") is None
+
+    # b is the least recently used entry
+    cache.put("m", "c", [0, 0, 0, 0])
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") is not None
+    stats = cache.get_stats()
+    assert stats["entries"] == 2 and stats["bytes"] == 2 * entry and stats["evictions"] == 1
+
+
+def test_embedding_cache_invalidate_and_disable():
+    cache = EmbeddingCache()
+    cache.put("m", "a", [1.0])
+    cache.put("n", "a", [2.0])
+    assert cache.invalidate("m") == 1
+    assert cache.get("m", "a") is None and cache.get("n", "a") is not None
+
+    disabled = EmbeddingCache(max_bytes=0)
+    assert np.array_equal(disabled.put("m", "a", [1.0]), [1.0])
+    assert disabled.get("m", "a") is None
+
+
+def test_disk_cache_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingDiskCache(path)
+    cache.put_many("m", "fake::a|normalize=False", [("a", [1.0, 2.0]), ("b", [3.0, 4.0])])
+    cache.close()
+
+    cache = EmbeddingDiskCache(path)
+    found = cache.get_many("m", "fake::a|normalize=False", ["b", "x", "a"])
+    assert sorted(found) == [0, 2]
+    assert np.array_equal(found[2], [1.0, 2.0])
+    # another cache key of the same model id is another model output
+    assert cache.get_many("m", "fake::a|normalize=True", ["a"]) == {}
+    assert cache.get_stats()["hits"] == 2
+    cache.close()
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingDiskCache(str(tmp_path / "cache.sqlite"), max_bytes=10 * 16)
+    cache.CHECK_SIZE_EVERY = 1
+    for index in range(20):
+        cache.put_many("m", "fake", [(str(index), np.full(4, index, dtype=np.float32))])
+    stats = cache.get_stats()
+    assert stats["bytes"] <= 10 * 16 and stats["evictions"] > 0
+    assert 19 in [int(vector[0]) for vector in cache.get_many("m", "fake", ["19"]).values()]
+    assert cache.get_many("m", "fake", ["0"]) == {}
+    cache.close()
+
+
+def test_query_cache_write_generation():
+    cache = QueryResultCache(max_entries=2, ttl=60)
+    key = QueryResultCache.make_key("docs", QueryResultCache.text_key("m", "q"), 3, {"b": 1, "a": 2})
+    assert key == QueryResultCache.make_key("docs", QueryResultCache.text_key("m", "q"), 3, {"a": 2, "b": 1})
+    generation = cache.get_generation("docs")
+    cache.put(key, generation, ["r"])
+    assert cache.get(key) == ["r"]
+
+    # a write to the collection invalidates its results, a read that started before it is not stored
+    cache.bump("docs")
+    assert cache.get(key) is None
+    cache.put(key, generation, ["stale"])
+    assert cache.get(key) is None
+    assert cache.get_stats()["invalidations"] == 1
+
+
+def test_query_cache_ttl_and_size():
+    cache = QueryResultCache(max_entries=2, ttl=-1)
+    cache.put(("docs", "a", 1, "{}"), 0, ["r"])
+    assert cache.get(("docs", "a", 1, "{}")) is None
+    assert cache.get_stats()["expirations"] == 1
+
+    cache = QueryResultCache(max_entries=2, ttl=60)
+    for query in ["a", "b", "c"]:
+        cache.put(("docs", query, 1, "{}"), 0, [query])
+    assert cache.get(("docs", "a", 1, "{}")) is None
+    assert cache.get_stats()["evictions"] == 1
@@ -0,0 +1,34 @@
+from changes import content_hash, with_change_keys, get_status, get_counts, CONTENT_HASH_KEY, STATUS_INSERTED, STATUS_UPDATED, STATUS_SKIPPED
+
+
+def test_content_hash_ignores_service_keys():
+    doc_hash = content_hash("text", metadata={"kind": "a"})
+    assert content_hash("text", metadata=with_change_keys({"kind": "a"}, doc_hash, "m")) == doc_hash
+    assert content_hash("text", metadata={"kind": "b"}) != doc_hash
+    assert content_hash("text", metadata={"kind": "a"}, extra=[256, 32]) != doc_hash
+
+
+def test_get_status():
+    doc_hash = content_hash("text")
+    existing = {"a": with_change_keys(None, doc_hash, "m"), "b": None}
+    assert get_status(existing, "a", doc_hash, "m") == STATUS_SKIPPED
+    # another model or content, or a record without hash is written again
+    assert get_status(existing, "a", doc_hash, "other") == STATUS_UPDATED
+    assert get_status(existing, "a", content_hash("changed"), "m") == STATUS_UPDATED
+    assert get_status(existing, "a", None, "m") == STATUS_UPDATED
+    assert get_status(existing, "b", doc_hash, "m") == STATUS_UPDATED
+    assert get_status(existing, "c", doc_hash, "m") == STATUS_INSERTED
+    assert get_counts([STATUS_SKIPPED, STATUS_INSERTED, STATUS_SKIPPED]) == {STATUS_INSERTED: 1, STATUS_UPDATED: 0, STATUS_SKIPPED: 2}
+
+
+def test_document_learn_skips_unchanged(client, handler):
+    handler.change_detection = True
+    try:
+        document = {"id": "1", "document": "text", "metadata": {"kind": "a"}}
+        assert client.post("/document_learn", json=document).json() == {STATUS_INSERTED: 1, STATUS_UPDATED: 0, STATUS_SKIPPED: 0}
+        assert client.post("/document_learn", json=document).json() == {STATUS_INSERTED: 0, STATUS_UPDATED: 0, STATUS_SKIPPED: 1}
+        document["metadata"] = {"kind": "b"}
+        assert client.post("/document_learn", json=document).json() == {STATUS_INSERTED: 0, STATUS_UPDATED: 1, STATUS_SKIPPED: 0}
+        assert CONTENT_HASH_KEY in handler.vdb_server._records["1"]["metadata"]
+    finally:
+        handler.change_detection = False
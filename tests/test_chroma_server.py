@@ -0,0 +1,64 @@
+import asyncio
+from chromadb.errors import NotFoundError
+import chroma_server
+from chroma_server import ChromaDBServer
+from utils import Context
+
+
+class FakeClient:
+    def __init__(self, tenant: str, database: str, collections: set) -> None:
+        self.tenant: str = tenant
+        self.database: str = database
+        self.collections: set = collections
+
+    async def get_collection(self, name: str):
+        if (self.tenant, self.database, name) not in self.collections:
+            raise NotFoundError(f"Collection [{name}] does not exist")
+        return name
+
+    async def get_or_create_collection(self, name: str):
+        self.collections.add((self.tenant, self.database, name))
+        return name
+
+
+def create_server(monkeypatch, collections: set, max_collections: int = 4) -> tuple:
+    clients = []
+
+    async def create_client(host: str, port: int, tenant: str, database: str):
+        client = FakeClient(tenant, database, collections)
+        clients.append(client)
+        return client
+
+    monkeypatch.setattr(chroma_server, "AsyncHttpClient", create_client)
+    server = ChromaDBServer(host="chroma", port=8000, collection="default", parameters={"max_collections": max_collections})
+    return server, clients
+
+
+def test_reads_do_not_create_collections(monkeypatch):
+    collections = set()
+    server, _ = create_server(monkeypatch, collections)
+
+    async def run():
+        context = Context()
+        assert await server.get_collection(context, collection="typo") is None
+        assert context.status_code == 404
+        assert collections == set()
+
+        created = await server.get_collection(Context(), collection="docs", create=True)
+        assert created.cdb_collection == "docs"
+        assert await server.get_collection(Context(), collection="docs") is created
+
+    asyncio.run(run())
+
+
+def test_clients_are_bounded(monkeypatch):
+    collections = {("t", f"db{index}", "docs") for index in range(10)}
+    server, clients = create_server(monkeypatch, collections, max_collections=2)
+
+    async def run():
+        for index in range(10):
+            assert await server.get_collection(Context(), collection="docs", tenant="t", database=f"db{index}") is not None
+
+    asyncio.run(run())
+    assert len(clients) == 10
+    assert server._clients.get_stats()["collections"] == 2
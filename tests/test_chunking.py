@@ -0,0 +1,51 @@
+from chunking import TextChunker, get_token_spans
+from fakes import FakeEmbeddingFunction
+
+TEXT = "one two three four five six seven"
+
+
+class TokenizerFunction(FakeEmbeddingFunction):
+    """reports one token per character and a max sequence length"""
+
+    def __init__(self, max_tokens: int = None) -> None:
+        super().__init__()
+        self.max_tokens: int = max_tokens
+
+    def get_token_offsets(self, text: str) -> list:
+        # the empty span stands for a special token
+        return [(0, 0)] + [(index, index + 1) for index in range(len(text)) if not text[index].isspace()]
+
+    def get_max_tokens(self) -> int:
+        return self.max_tokens
+
+
+def test_words_without_tokenizer():
+    assert get_token_spans(FakeEmbeddingFunction(), " ab  c") == [(1, 3), (5, 6)]
+    assert get_token_spans(TokenizerFunction(), "ab") == [(0, 1), (1, 2)]
+
+
+def test_overlapping_windows():
+    chunks = TextChunker(tokens=3, overlap=1).split(FakeEmbeddingFunction(), TEXT)
+    assert [chunk["text"] for chunk in chunks] == ["one two three", "three four five", "five six seven"]
+    assert chunks[1]["start"] == TEXT.index("three") and chunks[1]["tokens"] == 3
+    assert [chunk["text"] for chunk in TextChunker(tokens=10).split(FakeEmbeddingFunction(), TEXT)] == [TEXT]
+
+
+def test_window_fits_the_model():
+    # 4 tokens minus the special tokens leave windows of 2
+    chunks = TextChunker(tokens=100, overlap=5).split(TokenizerFunction(max_tokens=4), "abcd")
+    assert [chunk["text"] for chunk in chunks] == ["ab", "bc", "cd"]
+
+
+def test_text_without_tokens():
+    assert TextChunker().split(FakeEmbeddingFunction(), "   ") == [{"text": "   ", "start": 0, "end": 3, "tokens": 0}]
+    assert TextChunker().split(FakeEmbeddingFunction(), "") == []
+
+
+def test_document_learn_chunks(client, handler):
+    response = client.post("/document_learn", json={"id": "1", "document": "a b c d e", "metadata": {"kind": "x"}, "chunk": True, "chunk_tokens": 2, "chunk_overlap": 0})
+    assert response.json() is True
+    records = handler.vdb_server._records
+    assert sorted(records) == ["1#0", "1#1", "1#2"]
+    assert records["1#2"]["document"] == "e"
+    assert records["1#1"]["metadata"] == {"kind": "x", "parent_id": "1", "chunk_index": 1, "chunk_count": 3, "chunk_start": 4, "chunk_end": 7}
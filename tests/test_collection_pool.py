@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from collection_pool import CollectionPool, CollectionNotFound
+
+
+def test_concurrent_opens_share_one_call():
+    pool = CollectionPool(max_collections=2)
+    calls = []
+
+    async def open_collection():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return object()
+
+    async def run():
+        return await asyncio.gather(*[pool.get("a", open_collection) for _ in range(5)])
+
+    collections = asyncio.run(run())
+    assert len(calls) == 1 and all(collection is collections[0] for collection in collections)
+
+
+def test_least_recently_used_collection_is_dropped():
+    pool = CollectionPool(max_collections=2)
+
+    async def run():
+        for key in ["a", "b", "a", "c"]:
+            await pool.get(key, lambda key=key: asyncio.sleep(0, result=key))
+        return list(pool._collections)
+
+    assert asyncio.run(run()) == ["a", "c"]
+    assert pool.get_stats() == {"collections": 2, "max_collections": 2, "opened": 3, "evictions": 1}
+
+
+def test_failed_open_is_not_cached():
+    pool = CollectionPool()
+
+    async def missing():
+        raise CollectionNotFound("a")
+
+    async def run():
+        with pytest.raises(CollectionNotFound):
+            await pool.get("a", missing)
+        return await pool.get("a", lambda: asyncio.sleep(0, result="created"))
+
+    assert asyncio.run(run()) == "created"
@@ -0,0 +1,60 @@
+import base64
+import json
+import numpy as np
+from encoding import negotiate_format, encode_embeddings, FORMAT_JSON, FORMAT_FLOAT32, FORMAT_FLOAT16, FORMAT_BASE64, FORMAT_MSGPACK
+
+VECTORS = np.array([[0.25, -1.5, 3.0], [1.0, 0.0, -0.125]], dtype=np.float32)
+
+
+def test_negotiate_format():
+    assert negotiate_format() == FORMAT_JSON
+    assert negotiate_format(accept="text/html, application/octet-stream;q=0.9") == FORMAT_FLOAT32
+    assert negotiate_format(accept="application/x-float16") == FORMAT_FLOAT16
+    assert negotiate_format(accept="*/*") == FORMAT_JSON
+    assert negotiate_format(accept="application/octet-stream", format="BASE64") == FORMAT_BASE64
+    assert negotiate_format(format="xml") is None
+
+
+def test_negotiate_format_q_values():
+    assert negotiate_format(accept="application/x-msgpack;q=0, application/json") == FORMAT_JSON
+    assert negotiate_format(accept="application/json;q=0.5, application/x-float16;q=0.8") == FORMAT_FLOAT16
+    assert negotiate_format(accept="application/octet-stream;q=0.9, application/json;q=0.9") == FORMAT_FLOAT32
+    assert negotiate_format(accept="*/*;q=0.1, application/x-msgpack") == FORMAT_MSGPACK
+    assert negotiate_format(accept="application/x-float16;q=0") == FORMAT_JSON
+    assert negotiate_format(accept="application/x-float16;q=bad, application/octet-stream") == FORMAT_FLOAT32
+
+
+def test_json_round_trip():
+    response = encode_embeddings(VECTORS)
+    assert np.array_equal(np.asarray(json.loads(response.body), dtype=np.float32), VECTORS)
+    response = encode_embeddings(VECTORS[0], key="embedding")
+    assert json.loads(response.body) == {"embedding": VECTORS[0].tolist()}
+
+
+def test_float32_round_trip():
+    response = encode_embeddings(VECTORS, format=FORMAT_FLOAT32)
+    assert response.headers["x-embedding-shape"] == "2,3"
+    result = np.frombuffer(response.body, dtype="<f4").reshape(2, 3)
+    assert np.array_equal(result, VECTORS)
+
+
+def test_float16_round_trip():
+    response = encode_embeddings(VECTORS, format=FORMAT_FLOAT16)
+    result = np.frombuffer(response.body, dtype="<f2").reshape(2, 3)
+    assert np.allclose(result.astype(np.float32), VECTORS, atol=1e-3)
+
+
+def test_base64_round_trip():
+    response = encode_embeddings(VECTORS, format=FORMAT_BASE64)
+    rows = [np.frombuffer(base64.b64decode(row), dtype="<f4") for row in json.loads(response.body)]
+    assert np.array_equal(np.stack(rows), VECTORS)
+    response = encode_embeddings(VECTORS[1], format=FORMAT_BASE64)
+    assert np.array_equal(np.frombuffer(base64.b64decode(json.loads(response.body)), dtype="<f4"), VECTORS[1])
+
+
+def test_msgpack_round_trip():
+    import msgpack
+    response = encode_embeddings(VECTORS, format=FORMAT_MSGPACK, key="embeddings")
+    payload = msgpack.unpackb(response.body, raw=False)["embeddings"]
+    assert payload["dtype"] == "float32" and payload["shape"] == [2, 3]
+    assert np.array_equal(np.frombuffer(payload["data"], dtype="<f4").reshape(payload["shape"]), VECTORS)
@@ -0,0 +1,34 @@
+import asyncio
+import threading
+from executor import InferenceExecutor
+from utils import Context
+
+
+def test_calls_run_off_the_event_loop():
+    executor = InferenceExecutor(max_workers=1)
+
+    async def run():
+        return await executor.run(Context(), threading.current_thread), threading.current_thread()
+
+    worker, loop = asyncio.run(run())
+    assert worker is not loop and worker.name.startswith("inference")
+    assert executor.get_pending() == 0
+    executor.shutdown()
+
+
+def test_full_queue_is_rejected():
+    executor = InferenceExecutor(max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def run():
+        first = asyncio.create_task(executor.run(Context(), release.wait))
+        second = asyncio.create_task(executor.run(Context(), release.wait))
+        await asyncio.sleep(0.01)
+        context = Context()
+        assert await executor.run(context, release.wait) is None
+        assert context.status_code == 503
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == [True, True]
+    executor.shutdown()
@@ -0,0 +1,83 @@
+import asyncio
+import json
+from conftest import StubHandler
+from ingest import iter_json_records, BulkIngestor
+
+
+async def _chunks(parts: list):
+    for part in parts:
+        yield part.encode("utf-8")
+
+
+def parse(parts: list, max_record_bytes: int = 16 * 1024 * 1024) -> list:
+    async def collect():
+        return [item async for item in iter_json_records(_chunks(parts), max_record_bytes=max_record_bytes)]
+    return asyncio.run(collect())
+
+
+def test_ndjson_lines():
+    result = parse(['{"id": "a"}\n\n{"id": "b"}\n', '{"id": "c"}'])
+    assert result == [(0, {"id": "a"}, None), (1, {"id": "b"}, None), (2, {"id": "c"}, None)]
+
+
+def test_ndjson_invalid_line_is_an_item_error():
+    result = parse(['{"id": "a"}\n{bad}\n{"id": "c"}\n'])
+    assert [record for _, record, _ in result] == [{"id": "a"}, None, {"id": "c"}]
+    assert result[1][2].startswith("invalid json")
+
+
+def test_array_split_across_chunks():
+    result = parse(['  [{"id": "a", "text": "x,]"}, {"id"', ': "b"}', ' ,{"id": "c"}]'])
+    assert result == [(0, {"id": "a", "text": "x,]"}, None), (1, {"id": "b"}, None), (2, {"id": "c"}, None)]
+
+
+def test_array_malformed_element_is_skipped():
+    result = parse(['[{"id": "a"}, {"id": oops, "n": [1, 2]}, {"id": "c"}', ', {"id": "d"}]'])
+    assert [record for _, record, _ in result] == [{"id": "a"}, None, {"id": "c"}, {"id": "d"}]
+    assert [index for index, _, _ in result] == [0, 1, 2, 3]
+    assert result[1][2].startswith("invalid json")
+
+
+def test_array_truncated_at_end():
+    result = parse(['[{"id": "a"}, {"id": "b'])
+    assert result == [(0, {"id": "a"}, None), (1, None, "invalid json at end of array")]
+
+
+def test_array_record_too_large():
+    result = parse(['[{"id": "a"}, {"id": "', "x" * 100, '"}]'], max_record_bytes=64)
+    assert result == [(0, {"id": "a"}, None), (1, None, "record too large")]
+
+
+def ingest(handler: StubHandler, records: list, skip: int = 0, **kwargs) -> tuple:
+    ingestor = BulkIngestor(handler, **kwargs)
+    body = "\n".join(json.dumps(record) for record in records)
+    summary = asyncio.run(ingestor.run(_chunks([body]), skip=skip))
+    return ingestor, summary
+
+
+def test_bulk_ingestor_counts_and_chunks():
+    handler = StubHandler()
+    records = [{"id": str(index), "document": "bad" if index == 3 else f"text {index}"} for index in range(7)]
+    ingestor, summary = ingest(handler, records, batch_size=2, upsert_size=3)
+    assert summary["received"] == 7 and summary["learned"] == 6 and summary["inserted"] == 6
+    assert summary["errors"] == [{"index": 3, "id": "3", "reason": "embedding generation failed"}]
+    assert handler.upserts == [["0", "1", "2"], ["4", "5", "6"]]
+    assert ingestor.get_committed() == 7
+
+
+def test_bulk_ingestor_counts_collapsed_ids():
+    handler = StubHandler()
+    records = [{"id": "a", "document": "x"}, {"id": "b", "document": "y"}, {"id": "a", "document": "z"}]
+    _, summary = ingest(handler, records)
+    assert summary["learned"] == 2
+    assert summary["collapsed"] == 1
+    assert summary["inserted"] == 2
+    assert handler.store == {"a": "z", "b": "y"}
+
+
+def test_bulk_ingestor_skips_committed_records():
+    handler = StubHandler()
+    records = [{"id": str(index), "document": "text"} for index in range(5)]
+    _, summary = ingest(handler, records, skip=3)
+    assert summary["received"] == 2
+    assert sorted(handler.store) == ["3", "4"]
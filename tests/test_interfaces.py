@@ -0,0 +1,20 @@
+from interfaces import EmbeddingFunctionInterface
+from utils import Context
+
+
+class SingleTextFunction(EmbeddingFunctionInterface):
+    """implements single texts only, texts starting with ! fail"""
+
+    def get_embedding(self, context: Context, text: str) -> list:
+        if text.startswith("!"):
+            context.set_error("bad text")
+            return None
+        return [float(len(text))]
+
+
+def test_batch_falls_back_to_single_texts():
+    function = SingleTextFunction(type_desc="single", model_name="single")
+    assert function.get_embeddings(Context(), ["a", "abc"]) == [[1.0], [3.0]]
+    context = Context()
+    assert function.get_embeddings(context, ["a", "!b"]) is None
+    assert context.reason == "bad text"
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import os
+from conftest import StubHandler
+from jobs import JobManager, IngestJob, SOURCE_FILE, STATE_COMPLETED, STATE_INTERRUPTED, STATE_CANCELLED
+from utils import Context
+
+
+def write_records(path, count: int) -> str:
+    with open(path, "w") as file:
+        file.write("\n".join(json.dumps({"id": str(index), "document": f"text {index}"}) for index in range(count)))
+    return str(path)
+
+
+async def wait_for(job: IngestJob, seconds: float = 5):
+    for _ in range(int(seconds / 0.01)):
+        if job.state not in ["queued", "running"]:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_file_job_runs_to_completion(tmp_path):
+    write_records(tmp_path / "records.ndjson", 5)
+    handler = StubHandler()
+    manager = JobManager(handler, directory=str(tmp_path / "jobs"), file_root=str(tmp_path))
+
+    async def run():
+        manager.start()
+        context = Context()
+        assert manager.submit_file(context, "../outside.ndjson") is None and context.status_code == 403
+        job = manager.submit_file(Context(), "records.ndjson")
+        await wait_for(job)
+        await manager.stop()
+        return job
+
+    job = asyncio.run(run())
+    status = job.get_status()
+    assert status["state"] == STATE_COMPLETED and status["learned"] == 5 and status["checkpoint"] == 5
+    assert sorted(handler.store) == [str(index) for index in range(5)]
+    # the records file belongs to the caller and is kept
+    assert os.path.exists(tmp_path / "records.ndjson")
+
+
+def test_interrupted_job_resumes_from_checkpoint(tmp_path):
+    path = write_records(tmp_path / "records.ndjson", 6)
+    directory = tmp_path / "jobs"
+    os.makedirs(directory)
+    # a job that was running when the process stopped, three records were finished
+    job = IngestJob(id="j1", path=path, source=SOURCE_FILE)
+    job.state = "running"
+    job.checkpoint = 3
+    job.counts["learned"] = 3
+    with open(directory / "j1.json", "w") as file:
+        json.dump(job.to_dict(), file)
+
+    handler = StubHandler()
+    manager = JobManager(handler, directory=str(directory))
+
+    async def run():
+        manager.start()
+        assert manager.get("j1").state == STATE_INTERRUPTED
+        job = manager.resume(Context(), "j1")
+        await wait_for(job)
+        await manager.stop()
+        return job
+
+    status = asyncio.run(run()).get_status()
+    assert status["state"] == STATE_COMPLETED and status["learned"] == 6 and status["runs"] == 1
+    assert sorted(handler.store) == ["3", "4", "5"]
+
+
+def test_queue_limit_and_cancel(tmp_path):
+    write_records(tmp_path / "records.ndjson", 1)
+    manager = JobManager(StubHandler(), directory=str(tmp_path / "jobs"), max_queue=1, file_root=str(tmp_path))
+
+    async def run():
+        manager.start()
+        # the workers have not taken the first job yet
+        job = manager.submit_file(Context(), "records.ndjson")
+        context = Context()
+        assert manager.submit_file(context, "records.ndjson") is None and context.status_code == 429
+        assert manager.cancel(Context(), job.id).state == STATE_CANCELLED
+        context = Context()
+        assert manager.cancel(context, job.id) is None and context.status_code == 409
+        await asyncio.sleep(0.05)
+        await manager.stop()
+        return job
+
+    assert asyncio.run(run()).get_status()["learned"] == 0
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import numpy as np
+import pytest
+from local_vectordb import LocalVectorDB, match_where, hnswlib
+from utils import Context
+
+
+def open_db(path, collection: str = "docs", **parameters) -> LocalVectorDB:
+    db = LocalVectorDB(collection=collection, parameters=dict({"path": str(path), "sync": False}, **parameters))
+    assert asyncio.run(db.is_valid())
+    return db
+
+
+def learn(db: LocalVectorDB, ids: list, vectors: list, metadatas: list = None) -> bool:
+    return asyncio.run(db.learn_documents(Context(), ids=ids, documents=[f"doc {id}" for id in ids], embeddings=vectors, metadatas=metadatas))
+
+
+def query(db: LocalVectorDB, vector: list, max_records: int = 3, where: dict = None) -> list:
+    return asyncio.run(db.query_document(Context(), max_records=max_records, embedding=vector, metadata=where))
+
+
+def test_match_where():
+    metadata = {"kind": "a", "size": 3}
+    assert match_where(metadata, {"kind": "a"})
+    assert match_where(metadata, {"size": {"$gte": 3, "$lt": 4}})
+    assert match_where(metadata, {"$or": [{"kind": "b"}, {"size": {"$in": [1, 3]}}]})
+    assert not match_where(metadata, {"$and": [{"kind": "a"}, {"size": {"$ne": 3}}]})
+    assert not match_where(metadata, {"missing": {"$nin": [1]}})
+    assert not match_where(metadata, {"kind": {"$gt": 1}})
+    with pytest.raises(ValueError):
+        match_where(metadata, {"kind": {"$like": "a"}})
+
+
+def test_upsert_query_and_reopen(tmp_path):
+    db = open_db(tmp_path)
+    assert learn(db, ["a", "b", "c"], [[1, 0], [0, 1], [1, 1]], [{"kind": "x"}, {"kind": "y"}, {"kind": "x"}])
+    assert [record["id"] for record in query(db, [1, 0.1])] == ["a", "c", "b"]
+    assert [record["id"] for record in query(db, [0, 1], where={"kind": "x"})] == ["c", "a"]
+
+    # a replaced vector moves to a new row, the old one is dead
+    assert learn(db, ["a"], [[-1, 0]])
+    assert query(db, [-1, 0], max_records=1)[0]["id"] == "a"
+    db._close_files()
+
+    reopened = open_db(tmp_path)
+    assert asyncio.run(reopened.count(Context())) == 3
+    # like chroma, fields missing in an update keep their stored values
+    assert query(reopened, [-1, 0], max_records=1)[0] == {"id": "a", "document": "doc a", "metadata": {"kind": "x"}, "distance": 0.0}
+
+
+def test_torn_write_is_dropped_on_open(tmp_path):
+    db = open_db(tmp_path)
+    learn(db, ["a", "b"], [[1, 0], [0, 1]])
+    db._close_files()
+    # a crash after the rows but within the log line of the next write
+    with open(db._vector_path(), "ab") as file:
+        file.write(np.array([[5, 5]], dtype="<f4").tobytes())
+    with open(db._log_path(), "ab") as file:
+        file.write(b'{"op": "upsert", "records": [{"id": "c", "row"')
+    size = os.path.getsize(db._log_path())
+
+    reopened = open_db(tmp_path)
+    assert sorted(reopened._records) == ["a", "b"]
+    assert reopened._rows == 2
+    assert os.path.getsize(reopened._log_path()) < size
+    assert learn(reopened, ["c"], [[2, 2]])
+    assert query(reopened, [2, 2], max_records=1)[0]["id"] == "c"
+
+
+def test_compaction_switches_generation(tmp_path):
+    db = open_db(tmp_path, compact_ratio=0.5)
+    db.COMPACT_MIN_ROWS = 4
+    learn(db, ["a", "b", "c", "d"], [[1, 0], [0, 1], [1, 1], [2, 0]])
+    assert asyncio.run(db.delete_documents(Context(), ids=["a", "b", "c"]))
+    assert db.generation == 1
+    assert db._rows == 1
+    assert not os.path.exists(db._vector_path(0))
+    assert query(db, [2, 0])[0]["id"] == "d"
+
+    reopened = open_db(tmp_path)
+    assert reopened.generation == 1 and list(reopened._records) == ["d"]
+
+
+def test_appends_grow_capacity_geometrically(tmp_path):
+    db = open_db(tmp_path)
+    capacities = set()
+    for index in range(1500):
+        learn(db, [str(index)], [[float(index), 1.0]])
+        capacities.add(len(db._norms))
+    assert capacities == {1024, 2048}
+    assert db._rows == 1500
+    assert query(db, [1499.0, 1.0], max_records=1)[0]["id"] == "1499"
+
+
+@pytest.mark.skipif(hnswlib is None, reason="needs hnswlib")
+def test_hnsw_index_serves_unfiltered_queries(tmp_path):
+    db = open_db(tmp_path, index="hnsw")
+    vectors = np.random.default_rng(0).standard_normal((200, 8)).astype(np.float32)
+    learn(db, [str(index) for index in range(200)], vectors.tolist())
+    assert query(db, vectors[17].tolist(), max_records=1)[0]["id"] == "17"
+    assert db._index is not None
+    learn(db, ["new"], [(vectors[3] * 2).tolist()])
+    assert query(db, (vectors[3] * 2).tolist(), max_records=1)[0]["id"] == "new"
+
+
+def test_collections_per_tenant_and_database(tmp_path):
+    db = open_db(tmp_path, tenant="acme", database="main")
+    assert db.directory == os.path.join(str(tmp_path), "acme", "main", "docs")
+
+    context = Context()
+    assert asyncio.run(db.get_collection(context, collection="other")) is None
+    assert context.status_code == 404
+    assert not os.path.exists(os.path.join(str(tmp_path), "acme", "main", "other"))
+
+    other = asyncio.run(db.get_collection(Context(), collection="other", create=True))
+    assert other.directory == os.path.join(str(tmp_path), "acme", "main", "other")
+    assert asyncio.run(db.get_collection(Context(), collection="other")) is other
+    assert asyncio.run(db.get_collection(Context(), collection="../escape", create=True)) is None
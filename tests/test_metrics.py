@@ -0,0 +1,41 @@
+from metrics import MetricsRegistry, Counter, Gauge, Histogram
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("requests_total", "Requests", ("path",)))
+    gauge = registry.register(Gauge("depth", "Depth"))
+    histogram = registry.register(Histogram("seconds", "Latency", buckets=(0.1, 1.0)))
+    counter.inc(path='a"b')
+    counter.inc(2, path='a"b')
+    registry.add_collector(lambda: gauge.set(7))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{path="a\\"b"} 3' in lines
+    assert "depth 7" in lines
+    assert 'seconds_bucket{le="0.1"} 1' in lines
+    assert 'seconds_bucket{le="1.0"} 2' in lines
+    assert 'seconds_bucket{le="+Inf"} 3' in lines
+    assert "seconds_sum 5.55" in lines and "seconds_count 3" in lines
+
+
+def test_failing_collector_does_not_break_rendering():
+    registry = MetricsRegistry()
+    registry.register(Counter("calls_total", "Calls")).inc()
+
+    def collector():
+        raise RuntimeError("gone")
+
+    registry.add_collector(collector)
+    assert "calls_total 1" in registry.render()
+
+
+def test_metrics_endpoint(client):
+    client.post("/embedding", json={"text": "metrics"})
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'cdbembed_embedded_texts_total{model="default"}' in response.text
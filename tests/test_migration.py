@@ -0,0 +1,27 @@
+import asyncio
+import numpy as np
+from conftest import DIMENSION, wait_for_job
+from fakes import fake_vector
+from local_vectordb import LocalVectorDB
+
+
+def test_migrate_collection_to_another_model(client, handler, tmp_path):
+    handler.vdb_server = LocalVectorDB(collection="docs", parameters={"path": str(tmp_path), "sync": False, "embedding": "default"})
+    assert asyncio.run(handler.vdb_server.is_valid())
+    response = client.post("/model_load", json={"type": "fake", "name": "small", "id": "small", "parameters": {"dimension": 4, "latency_ms": 0, "latency_per_text_ms": 0}})
+    assert response.status_code == 200, response.text
+    for index in range(5):
+        client.post("/document_learn", json={"id": str(index), "document": f"text {index}", "metadata": {"n": index}})
+
+    assert client.post("/job_migrate", json={"target": "docs", "source": "docs"}).status_code == 400
+    status = client.post("/job_migrate", json={"target": "docs_small", "model": "small", "page_size": 2}).json()
+    status = wait_for_job(client, status["id"])
+    assert status["state"] == "completed"
+    assert status["learned"] == 5 and status["records_total"] == 5
+
+    assert client.get("/documents_count", params={"collection": "docs_small"}).json() == 5
+    result = client.post("/document_query", json={"document": "text 3", "max_records": 1, "collection": "docs_small", "model": "small"}).json()
+    assert result[0]["id"] == "3" and result[0]["metadata"] == {"n": 3}
+    # the source keeps its vectors of the old model
+    assert client.get("/documents_count").json() == 5
+    assert np.allclose(handler.vdb_server._vectors[handler.vdb_server._records["3"][0]], fake_vector("text 3", DIMENSION))
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import math
+import httpx
+from ollama_client import EmbeddingFunctionOllama
+from utils import Context
+
+RAW = [3.0, 4.0]
+
+
+class FakeOllama:
+    """answers like an ollama server, optionally without /api/embed and with failing first attempts"""
+
+    def __init__(self, batch_route: bool = True, failures: int = 0, status_code: int = 503) -> None:
+        self.batch_route: bool = batch_route
+        self.failures: int = failures
+        self.status_code: int = status_code
+        self.calls: list = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls.append(request.url.path)
+        if self.failures:
+            self.failures -= 1
+            return httpx.Response(self.status_code)
+        payload = json.loads(request.content)
+        if request.url.path == "/api/embed" and self.batch_route:
+            return httpx.Response(200, json={"embeddings": [[0.6, 0.8] for _ in payload["input"]]})
+        if request.url.path == "/api/embeddings":
+            return httpx.Response(200, json={"embedding": RAW})
+        return httpx.Response(404, text="404 page not found")
+
+
+def create(server: FakeOllama, **parameters) -> EmbeddingFunctionOllama:
+    function = EmbeddingFunctionOllama(model_name="m", parameters=dict({"url": "http://ollama", "backoff_ms": 0}, **parameters))
+    function._sync_client = httpx.Client(transport=httpx.MockTransport(server))
+    function._async_client = httpx.AsyncClient(transport=httpx.MockTransport(server))
+    return function
+
+
+def test_raw_vectors_by_default():
+    server = FakeOllama()
+    function = create(server)
+    assert function.get_embeddings(Context(), ["a", "b"]) == [RAW, RAW]
+    assert server.calls == ["/api/embeddings", "/api/embeddings"]
+    assert function.get_cache_key() == "m|normalize=False"
+
+
+def test_normalize_uses_batched_route():
+    server = FakeOllama()
+    function = create(server, normalize=True, batch_size=2)
+    result = function.get_embeddings(Context(), ["a", "b", "c"])
+    assert len(result) == 3 and all(math.isclose(math.hypot(*vector), 1.0) for vector in result)
+    assert server.calls == ["/api/embed", "/api/embed"]
+    assert function.get_cache_key() == "m|normalize=True"
+
+
+def test_missing_batch_route_falls_back_to_single_texts():
+    server = FakeOllama(batch_route=False)
+    function = create(server, normalize=True)
+    result = asyncio.run(function.get_embeddings_async(Context(), ["a", "b"], executor=None))
+    # the legacy vectors are scaled like the batched ones
+    assert result == [[0.6, 0.8], [0.6, 0.8]]
+    assert function.batch_supported is False
+    assert server.calls == ["/api/embed", "/api/embeddings", "/api/embeddings"]
+
+
+def test_retries_on_unavailable_server():
+    server = FakeOllama(failures=2)
+    function = create(server, retries=2)
+    assert function.get_embedding(Context(), "a") == RAW
+    assert len(server.calls) == 3
+
+
+def test_gives_up_after_retries():
+    server = FakeOllama(failures=5)
+    function = create(server, retries=1)
+    context = Context()
+    assert function.get_embedding(context, "a") is None
+    assert context.status_code == 502
+    assert len(server.calls) == 2
@@ -0,0 +1,38 @@
+import os
+import numpy as np
+import pytest
+from conftest import TEXTS
+from utils import Context
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+from onnx_embedding import EmbeddingFunctionOnnx
+
+
+def load(model_name: str, cache_dir, **parameters) -> EmbeddingFunctionOnnx:
+    function = EmbeddingFunctionOnnx(model_name=model_name, parameters=dict({"cache_dir": str(cache_dir)}, **parameters))
+    context = Context()
+    assert function.load(context), context.reason
+    return function
+
+
+def test_export_matches_pytorch(tiny_model, tmp_path):
+    model_name, model = tiny_model
+    function = load(model_name, tmp_path)
+    assert function.parity["min_cosine"] >= EmbeddingFunctionOnnx.PARITY_THRESHOLD
+    result = np.asarray(function.get_embeddings(Context(), TEXTS))
+    assert np.allclose(result, model.encode(TEXTS, convert_to_numpy=True), atol=1e-5)
+    assert function.get_cache_key() == f"{model_name}|quantize=False|pooling=mean|normalize=True|max_length=64"
+
+    # a second load uses the cached export
+    modified = os.path.getmtime(function.get_model_path())
+    assert np.allclose(load(model_name, tmp_path).get_embeddings(Context(), TEXTS), result)
+    assert os.path.getmtime(function.get_model_path()) == modified
+
+
+def test_quantized_model_passes_its_parity_check(tiny_model, tmp_path):
+    model_name, _ = tiny_model
+    function = load(model_name, tmp_path, quantize=True)
+    assert function.get_model_path().endswith(EmbeddingFunctionOnnx.ONNX_INT8_FILE)
+    assert function.parity["min_cosine"] >= EmbeddingFunctionOnnx.PARITY_THRESHOLD_INT8
+    assert len(function.get_embeddings(Context(), TEXTS)) == len(TEXTS)
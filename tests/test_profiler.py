@@ -0,0 +1,50 @@
+import threading
+import time
+from profiler import SamplingProfiler
+from utils import Context
+
+
+def busy(stop: threading.Event):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+
+def test_sample_folds_thread_stacks():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy, args=(stop,), name="busy-worker")
+    thread.start()
+    try:
+        stacks = SamplingProfiler().sample(seconds=0.1, interval_ms=5)
+    finally:
+        stop.set()
+        thread.join()
+    busy_stacks = [stack for stack in stacks if stack.startswith("thread busy-worker;")]
+    assert busy_stacks and all("busy (test_profiler.py:" in stack for stack in busy_stacks)
+    lines = SamplingProfiler.format_folded(stacks).splitlines()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_one_profile_at_a_time():
+    profiler = SamplingProfiler()
+    with profiler._lock:
+        assert profiler.is_running()
+        assert profiler.sample(seconds=0) is None
+
+
+def test_context_timings():
+    context = Context()
+    context.add_timing("embed", 0.002)
+    context.add_timing("embed", 0.001)
+    with context.timing("vectordb"):
+        pass
+    assert context.get_server_timing().startswith("embed;dur=3.000, vectordb;dur=")
+
+
+def test_profile_endpoint(client, handler):
+    handler.profiler_enabled = True
+    try:
+        response = client.get("/profile", params={"seconds": 0.05, "interval_ms": 5})
+        assert response.status_code == 200
+        assert "thread " in response.text
+    finally:
+        handler.profiler_enabled = False
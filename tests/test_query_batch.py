@@ -0,0 +1,47 @@
+import asyncio
+from backend import ServiceHandler
+from interfaces import VectorDBInterface
+from utils import Context
+
+
+class StubVectorDB(VectorDBInterface):
+    """returns fixed hits per query embedding"""
+
+    def __init__(self, hits: dict) -> None:
+        super().__init__(parameters={})
+        self.hits: dict = hits
+        self.calls: int = 0
+
+    async def query_documents(self, context: Context, max_records: int = 5, embeddings: list = None, metadata: dict = None) -> list:
+        self.calls += 1
+        return [self.hits[embedding[0]][:max_records] for embedding in embeddings]
+
+
+def query_batch(hits: dict, embeddings: list, **kwargs) -> tuple:
+    handler = ServiceHandler()
+    handler.vdb_server = StubVectorDB(hits)
+    context = Context()
+    result = asyncio.run(handler.documents_query_batch(context=context, embeddings=embeddings, **kwargs))
+    return result, context, handler.vdb_server
+
+
+HITS = {
+    1.0: [{"id": "a", "distance": 0.1}, {"id": "b", "distance": 0.5}],
+    2.0: [{"id": "b", "distance": 0.2}, {"id": "c", "distance": 0.3}],
+}
+
+
+def test_one_call_for_all_queries():
+    result, _, vdb = query_batch(HITS, [[1.0], [2.0]], max_records=2)
+    assert [[record["id"] for record in records] for records in result] == [["a", "b"], ["b", "c"]]
+    assert vdb.calls == 1
+
+
+def test_merge_keeps_best_distance_per_id():
+    result, _, _ = query_batch(HITS, [[1.0], [2.0]], max_records=2, merge=True)
+    assert result == [{"id": "a", "distance": 0.1, "hits": 1}, {"id": "b", "distance": 0.2, "hits": 2}]
+
+
+def test_batch_size_limit():
+    result, context, _ = query_batch(HITS, [[1.0]] * 300)
+    assert result is False and context.status_code == 413
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from interfaces import EmbeddingFunctionInterface
+from registry import ModelRegistry
+from utils import Context
+
+MODEL_BYTES = 1000000
+
+
+class SizedFunction(EmbeddingFunctionInterface):
+    """loads instantly and reports a fixed memory usage"""
+
+    def load(self, context: Context) -> bool:
+        return True
+
+    def get_memory_usage(self) -> int:
+        return MODEL_BYTES
+
+
+def create_registry(**kwargs) -> tuple:
+    created = []
+
+    def factory(model_type: str, model_name: str, parameters: dict):
+        function = SizedFunction(type_desc=model_type, model_name=model_name, parameters=parameters)
+        created.append(function)
+        return function
+
+    registry = ModelRegistry(factory=factory, **kwargs)
+    for model_id in ["a", "b", "c"]:
+        registry.register(model_id=model_id, model_type="sized", model_name=model_id)
+    return registry, created
+
+
+def test_concurrent_loads_share_one_load():
+    registry, created = create_registry()
+
+    async def run():
+        return await asyncio.gather(*[registry.get(Context(), "a") for _ in range(5)])
+
+    functions = asyncio.run(run())
+    assert len(created) == 1
+    assert all(function is created[0] for function in functions)
+    assert asyncio.run(registry.get(Context(), "missing")) is None
+
+
+def test_budget_evicts_least_recently_used():
+    registry, _ = create_registry(memory_budget=2 * MODEL_BYTES)
+
+    async def run():
+        await registry.get(Context(), "a")
+        await registry.get(Context(), "b")
+        await registry.get(Context(), "a")
+        await registry.get(Context(), "c")
+
+    asyncio.run(run())
+    assert [registry.is_loaded(model_id) for model_id in ["a", "b", "c"]] == [True, False, True]
+    # evicted models stay registered
+    assert registry.contains("b")
+
+
+def test_models_in_use_are_not_evicted():
+    registry, _ = create_registry(memory_budget=2 * MODEL_BYTES, idle_ttl=60)
+
+    async def run():
+        await registry.get(Context(), "a")
+        await registry.get(Context(), "b")
+        with registry.use("a"):
+            await registry.get(Context(), "c")
+            assert registry.get_entry("a").in_use == 1
+        assert registry.get_entry("a").in_use == 0
+
+    asyncio.run(run())
+    assert [registry.is_loaded(model_id) for model_id in ["a", "b", "c"]] == [True, False, True]
+
+
+def test_idle_models_are_evicted():
+    registry, _ = create_registry(idle_ttl=60)
+    asyncio.run(registry.get(Context(), "a"))
+    asyncio.run(registry.get(Context(), "b"))
+    for model_id in ["a", "b"]:
+        registry.get_entry(model_id).last_used = time.time() - 120
+
+    with registry.use("b"):
+        # use marks the model as used again when it ends
+        registry.get_entry("b").last_used = time.time() - 120
+        assert registry.evict_idle() == 1
+    assert not registry.is_loaded("a")
+    assert registry.is_loaded("b")
+    assert registry.evict_idle() == 0
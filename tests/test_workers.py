@@ -0,0 +1,39 @@
+import asyncio
+import numpy as np
+import pytest
+from conftest import TEXTS
+from utils import Context
+
+pytest.importorskip("sentence_transformers")
+from workers import EmbeddingFunctionProcessPool
+
+
+def test_process_pool_matches_the_model(tiny_model):
+    model_name, model = tiny_model
+    function = EmbeddingFunctionProcessPool(model_name=model_name, parameters={"processes": 2, "threads": 1})
+    context = Context()
+    assert function.load(context), context.reason
+    try:
+        assert function.get_concurrency() == 2
+        assert function.get_memory_usage() > 0
+        expected = model.encode(TEXTS, convert_to_numpy=True)
+        assert np.allclose(function.get_embeddings(Context(), TEXTS), expected, atol=1e-5)
+
+        async def run():
+            return await asyncio.gather(*[function.get_embeddings_async(Context(), [text], executor=None) for text in TEXTS])
+        result = asyncio.run(run())
+        assert np.allclose(np.concatenate(result), expected, atol=1e-5)
+    finally:
+        function.unload()
+
+    context = Context()
+    assert function.get_embedding(context, "short") is None
+    assert "not available" in context.reason
+
+
+def test_failed_worker_load_fails_the_pool(tmp_path):
+    function = EmbeddingFunctionProcessPool(model_name=str(tmp_path / "missing"), parameters={"processes": 1, "threads": 1, "load_timeout": 120})
+    context = Context()
+    assert not function.load(context)
+    assert context.status_code == 500
+    assert function._workers == []
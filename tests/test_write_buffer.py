@@ -0,0 +1,50 @@
+import asyncio
+from fakes import FakeVectorDB
+from utils import Context
+from write_buffer import WriteBehindBuffer
+
+
+class FailingVectorDB(FakeVectorDB):
+    async def learn_documents(self, context: Context, ids: list, documents: list = None, embeddings: list = None, uris: list = None, metadatas: list = None) -> bool:
+        context.set_error("collection is read only")
+        return False
+
+
+def add_all(buffer: WriteBehindBuffer, vdb, ids: list, durable: bool = True) -> list:
+    async def run():
+        result = await asyncio.gather(*[buffer.add(Context(), vdb, id=id, document=f"doc {id}", embedding=[1.0], durable=durable) for id in ids])
+        await buffer.close()
+        return result
+    return asyncio.run(run())
+
+
+def test_concurrent_adds_share_one_upsert():
+    buffer = WriteBehindBuffer(max_records=10, max_delay_ms=5)
+    vdb = FakeVectorDB(parameters={"latency_ms": 0})
+    assert add_all(buffer, vdb, ["a", "b", "a", "c"]) == [True] * 4
+    stats = buffer.get_stats()
+    assert stats["flushes"] == 1 and stats["flushed"] == 3 and stats["collapsed"] == 1
+    assert sorted(vdb._records) == ["a", "b", "c"]
+
+
+def test_full_buffer_flushes_without_delay():
+    buffer = WriteBehindBuffer(max_records=2, max_delay_ms=60000)
+    vdb = FakeVectorDB(parameters={"latency_ms": 0})
+
+    async def run():
+        adds = [buffer.add(Context(), vdb, id=id, document="doc", embedding=[1.0]) for id in ["a", "b"]]
+        return await asyncio.wait_for(asyncio.gather(*adds), timeout=5)
+
+    assert asyncio.run(run()) == [True, True]
+    assert buffer.get_stats()["flushes"] == 1
+    assert buffer.get_pending() == 0
+
+
+def test_failed_flush_reaches_durable_adds_only():
+    buffer = WriteBehindBuffer(max_delay_ms=1)
+    vdb = FailingVectorDB(parameters={"latency_ms": 0})
+    assert add_all(buffer, vdb, ["a", "b"]) == [False, False]
+
+    # a non durable add is acknowledged before the flush, its failure is only counted
+    assert add_all(buffer, vdb, ["c"], durable=False) == [True]
+    assert buffer.get_stats()["failed"] == 3